@@ -65,6 +65,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CurrentMerchantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -221,6 +222,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.CurrentMerchantMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -239,3 +241,95 @@ CORS_ALLOW_HEADERS = [
     'ngrok-skip-browser-warning',  # Allow ngrok bypass header
 ]
 
+
+# --- Visitor Tracking ---
+# "direct" writes every heartbeat immediately; "buffered" merges heartbeats in
+# memory and flushes them in bulk every VISITORS_FLUSH_INTERVAL_SECONDS. A failed
+# flush is retried with the next one up to VISITORS_FLUSH_MAX_RETRIES times
+VISITORS_INGESTION_MODE = os.getenv("VISITORS_INGESTION_MODE", "direct")
+VISITORS_FLUSH_INTERVAL_SECONDS = float(os.getenv("VISITORS_FLUSH_INTERVAL_SECONDS", "2"))
+VISITORS_FLUSH_MAX_PENDING = int(os.getenv("VISITORS_FLUSH_MAX_PENDING", "5000"))
+VISITORS_FLUSH_MAX_RETRIES = int(os.getenv("VISITORS_FLUSH_MAX_RETRIES", "3"))
+
+# Active visitor counter: sessions seen in the last VISITORS_ACTIVE_WINDOW_SECONDS.
+# The default backend keeps windows in process memory, which is exact only with
+# a single worker process; with several gunicorn workers use
+# "visitors.live_counter.DjangoCacheBackend" and a cache they share in CACHES.
+VISITORS_ACTIVE_WINDOW_SECONDS = int(os.getenv("VISITORS_ACTIVE_WINDOW_SECONDS", "300"))
+VISITORS_LIVE_COUNTER_BACKEND = os.getenv("VISITORS_LIVE_COUNTER_BACKEND", "visitors.live_counter.LocalMemoryBackend")
+VISITORS_LIVE_COUNTER_RECONCILE_SECONDS = int(os.getenv("VISITORS_LIVE_COUNTER_RECONCILE_SECONDS", "300"))
+
+# Live count stream (served only under NomoFlow.asgi)
+VISITORS_STREAM_POLL_SECONDS = float(os.getenv("VISITORS_STREAM_POLL_SECONDS", "2"))
+VISITORS_STREAM_KEEPALIVE_SECONDS = int(os.getenv("VISITORS_STREAM_KEEPALIVE_SECONDS", "15"))
+VISITORS_STREAM_MAX_SECONDS = int(os.getenv("VISITORS_STREAM_MAX_SECONDS", "300"))
+
+# Live counter heartbeat: interval bounds and the per-worker request rate
+# above which clients are asked to back off
+VISITORS_HEARTBEAT_BASE_SECONDS = int(os.getenv("VISITORS_HEARTBEAT_BASE_SECONDS", "10"))
+VISITORS_HEARTBEAT_MAX_SECONDS = int(os.getenv("VISITORS_HEARTBEAT_MAX_SECONDS", "60"))
+VISITORS_HEARTBEAT_LOAD_RPS = float(os.getenv("VISITORS_HEARTBEAT_LOAD_RPS", "50"))
+
+# Visitor rollups: how far back to aggregate raw rows for a merchant that has
+# never been rolled up
+VISITORS_ROLLUP_BACKFILL_DAYS = int(os.getenv("VISITORS_ROLLUP_BACKFILL_DAYS", "35"))
+
+# How often in-process unique visitor sketches are merged into the database
+VISITORS_SKETCH_FLUSH_SECONDS = float(os.getenv("VISITORS_SKETCH_FLUSH_SECONDS", "30"))
+
+# Default days raw visitor rows are kept; merchants can override it with a
+# VisitorRetentionPolicy. Pruned by `manage.py prune_visitor_data`.
+VISITORS_RETENTION_DAYS = int(os.getenv("VISITORS_RETENTION_DAYS", "90"))
+
+# A visitor counts as viewing a page until this long after their last
+# heartbeat from it; keep above VISITORS_HEARTBEAT_MAX_SECONDS
+VISITORS_PAGE_VIEWERS_WINDOW_SECONDS = int(os.getenv("VISITORS_PAGE_VIEWERS_WINDOW_SECONDS", "90"))
+
+# Top pages leaderboard: paths tracked per merchant, and how long an epoch of
+# activity counts (the leaderboard covers the current and previous epoch)
+VISITORS_TOP_PAGES_CAPACITY = int(os.getenv("VISITORS_TOP_PAGES_CAPACITY", "100"))
+VISITORS_TOP_PAGES_EPOCH_SECONDS = int(os.getenv("VISITORS_TOP_PAGES_EPOCH_SECONDS", "300"))
+
+# Session enrichment: how often queued sessions get device/source/country
+# filled in, and the IP range table built by `manage.py build_ip_country_table`
+# (country stays empty without one)
+VISITORS_ENRICHMENT_FLUSH_SECONDS = float(os.getenv("VISITORS_ENRICHMENT_FLUSH_SECONDS", "10"))
+VISITORS_IP_COUNTRY_FILE = os.getenv("VISITORS_IP_COUNTRY_FILE", "")
+
+# Per-process cache of public store_id -> merchant lookups, and of unknown
+# store ids (invalidated locally by Merchant save/delete signals)
+MERCHANT_CACHE_TTL_SECONDS = int(os.getenv("MERCHANT_CACHE_TTL_SECONDS", "60"))
+MERCHANT_NEGATIVE_CACHE_TTL_SECONDS = int(os.getenv("MERCHANT_NEGATIVE_CACHE_TTL_SECONDS", "10"))
+
+# Per-process cache of merchant feature flags checked by storefront endpoints
+# (invalidated locally by MerchantFeature save/delete signals)
+FEATURE_FLAG_CACHE_TTL_SECONDS = int(os.getenv("FEATURE_FLAG_CACHE_TTL_SECONDS", "10"))
+
+# Proactive Salla token refresh (`manage.py refresh_salla_tokens`): tokens
+# expiring within this window are refreshed by a pool of this many threads
+SALLA_TOKEN_REFRESH_AHEAD_SECONDS = int(os.getenv("SALLA_TOKEN_REFRESH_AHEAD_SECONDS", "1800"))
+SALLA_TOKEN_REFRESH_WORKERS = int(os.getenv("SALLA_TOKEN_REFRESH_WORKERS", "4"))
+
+# Shared Salla HTTP client: keep-alive pool size and retry/backoff on 429 and 5xx
+SALLA_HTTP_POOL_SIZE = int(os.getenv("SALLA_HTTP_POOL_SIZE", "10"))
+SALLA_HTTP_MAX_RETRIES = int(os.getenv("SALLA_HTTP_MAX_RETRIES", "3"))
+SALLA_HTTP_BACKOFF_SECONDS = float(os.getenv("SALLA_HTTP_BACKOFF_SECONDS", "0.5"))
+SALLA_HTTP_MAX_BACKOFF_SECONDS = float(os.getenv("SALLA_HTTP_MAX_BACKOFF_SECONDS", "30"))
+SALLA_HTTP_TIMEOUT_SECONDS = float(os.getenv("SALLA_HTTP_TIMEOUT_SECONDS", "30"))
+
+# Salla catalog/order sync: pages fetched in parallel per merchant, and the
+# request rate it keeps to (per merchant, 0 = unlimited)
+SALLA_SYNC_CONCURRENCY = int(os.getenv("SALLA_SYNC_CONCURRENCY", "4"))
+SALLA_SYNC_REQUESTS_PER_SECOND = float(os.getenv("SALLA_SYNC_REQUESTS_PER_SECOND", "5"))
+# A product sync that wrote no page for this long starts over, since products
+# that moved between its pages meanwhile would be deactivated; keep it above
+# the time one round of the scheduler takes
+SALLA_SYNC_PRODUCT_RUN_IDLE_SECONDS = int(os.getenv("SALLA_SYNC_PRODUCT_RUN_IDLE_SECONDS", "1800"))
+# Incremental order syncs filter on order date, so every this many days a run
+# re-reads all orders to pick up status and total changes of older ones
+SALLA_SYNC_FULL_RESYNC_DAYS = int(os.getenv("SALLA_SYNC_FULL_RESYNC_DAYS", "7"))
+
+# Scheduled sync of all merchants (`manage.py sync_salla_stores`): merchants
+# synced at once, and records a merchant syncs per turn before yielding
+SALLA_SYNC_WORKERS = int(os.getenv("SALLA_SYNC_WORKERS", "4"))
+SALLA_SYNC_SLICE_RECORDS = int(os.getenv("SALLA_SYNC_SLICE_RECORDS", "500"))
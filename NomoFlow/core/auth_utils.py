@@ -1,95 +1,240 @@
 """
 Authentication and token management utilities
 """
+import threading
+import time
 import requests
-from typing import Optional, Tuple
+from typing import Any, Dict, Optional, Tuple
 from django.conf import settings
+from django.db.models import F, Q
 from django.utils import timezone
 from django.http import JsonResponse
 from .models import Merchant, SallaToken
+from .salla_client import salla_client
 
 
-def refresh_salla_token(merchant: Merchant) -> Tuple[bool, Optional[str]]:
+# Refresh tokens this long before they expire
+TOKEN_REFRESH_MARGIN = timezone.timedelta(minutes=5)
+
+# How long a refresh may hold its claim on a token (OAuth call and retries
+# included), and how often other callers check whether it is done
+REFRESH_CLAIM_LEASE = timezone.timedelta(seconds=60)
+REFRESH_CLAIM_POLL_SECONDS = 0.2
+
+
+class TokenCache:
+    """
+    Process-local cache of Salla access tokens with single-flight refresh.
+
+    Threads of one process share a per-merchant lock, and across processes the
+    refresh is claimed with a lease on the merchant's SallaToken row, so
+    exactly one caller sends the OAuth refresh and the others wait for, then
+    reuse, its result. No database lock is held during the OAuth call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens: Dict[int, Tuple[str, Any]] = {}  # merchant id -> (access_token, expires_at)
+        self._refresh_locks: Dict[int, threading.Lock] = {}
+
+    def get(self, merchant_id: int) -> Optional[Tuple[str, Any]]:
+        return self._tokens.get(merchant_id)
+
+    def set(self, merchant_id: int, access_token: str, expires_at) -> None:
+        with self._lock:
+            self._tokens[merchant_id] = (access_token, expires_at)
+
+    def invalidate(self, merchant_id: int) -> None:
+        with self._lock:
+            self._tokens.pop(merchant_id, None)
+
+    def refresh_lock(self, merchant_id: int) -> threading.Lock:
+        with self._lock:
+            lock = self._refresh_locks.get(merchant_id)
+            if lock is None:
+                lock = self._refresh_locks[merchant_id] = threading.Lock()
+            return lock
+
+
+token_cache = TokenCache()
+
+
+def _needs_refresh(expires_at) -> bool:
+    return bool(expires_at) and timezone.now() >= expires_at - TOKEN_REFRESH_MARGIN
+
+
+class TokenRefreshError(Exception):
+    pass
+
+
+def _refresh_failed(merchant: Merchant, error_msg: str) -> Tuple[bool, str]:
+    """Record a failed refresh on the token row and return the failure result"""
+    token_cache.invalidate(merchant.id)
+    try:
+        SallaToken.objects.filter(merchant=merchant).update(
+            refresh_failures=F("refresh_failures") + 1,
+            last_refresh_error=error_msg[:500],
+        )
+    except Exception as e:
+        print(f"⚠️ Could not record token refresh failure: {e}")
+    return False, error_msg
+
+
+def _claim_refresh(merchant: Merchant, token: SallaToken) -> bool:
+    """Take the refresh lease of `token` unless another caller holds it"""
+    now = timezone.now()
+    return bool(SallaToken.objects.filter(
+        Q(refresh_claimed_until__isnull=True) | Q(refresh_claimed_until__lt=now),
+        merchant=merchant,
+        refresh_token=token.refresh_token,
+    ).update(refresh_claimed_until=now + REFRESH_CLAIM_LEASE))
+
+
+def _release_refresh(merchant: Merchant, token: SallaToken) -> None:
+    try:
+        SallaToken.objects.filter(merchant=merchant, refresh_token=token.refresh_token).update(
+            refresh_claimed_until=None,
+        )
+    except Exception as e:
+        print(f"⚠️ Could not release token refresh claim: {e}")
+
+
+def refresh_salla_token(merchant: Merchant, stale_access_token: Optional[str] = None) -> Tuple[bool, Optional[str]]:
     """
     Refresh Salla access token using refresh_token.
     
+    Only one caller refreshes at a time; the others wait for it. If the stored
+    token no longer matches stale_access_token (the one the caller found
+    expired or rejected), another caller already refreshed it and no request
+    is sent.
+    
     Returns:
         (success: bool, error_message: Optional[str])
         On success, updates the token in database.
     """
-    try:
-        token = SallaToken.objects.filter(merchant=merchant).first()
-        if not token or not token.refresh_token:
-            return False, "No refresh token available"
-        
-        data = {
-            "grant_type": "refresh_token",
-            "client_id": settings.SALLA_CLIENT_ID,
-            "client_secret": settings.SALLA_CLIENT_SECRET,
-            "refresh_token": token.refresh_token,
-        }
-        
-        response = requests.post(settings.SALLA_OAUTH_TOKEN_URL, data=data, timeout=20)
-        
-        if response.status_code != 200:
-            error_text = response.text
-            print(f"🔴 Token Refresh FAILED for merchant {merchant.salla_merchant_id}: {response.status_code} - {error_text}")
-            return False, f"Token refresh failed: {response.status_code}"
-        
-        token_json = response.json()
-        new_access_token = token_json.get("access_token")
-        new_refresh_token = token_json.get("refresh_token", token.refresh_token)  # Keep old if not provided
-        expires_in = token_json.get("expires_in", 0)
-        
-        if not new_access_token:
-            return False, "No access token in refresh response"
-        
-        expires_at = timezone.now() + timezone.timedelta(seconds=int(expires_in or 0))
-        
-        token.access_token = new_access_token
-        token.refresh_token = new_refresh_token
-        token.expires_at = expires_at
-        token.save()
-        
-        print(f"✅ Token refreshed successfully for merchant {merchant.salla_merchant_id}")
-        return True, None
-        
-    except requests.exceptions.RequestException as e:
-        error_msg = f"Request error during token refresh: {str(e)}"
-        print(f"🔴 {error_msg}")
-        return False, error_msg
-    except Exception as e:
-        error_msg = f"Unexpected error during token refresh: {str(e)}"
-        print(f"🔴 {error_msg}")
-        return False, error_msg
+    with token_cache.refresh_lock(merchant.id):
+        try:
+            # Claim the refresh with a short lease instead of holding a row lock
+            # through the OAuth call; callers in other processes poll until it
+            # is released or the token changes
+            deadline = time.monotonic() + REFRESH_CLAIM_LEASE.total_seconds()
+            seen_refresh_token = None
+            while True:
+                token = SallaToken.objects.filter(merchant=merchant).first()
+                if not token or not token.refresh_token:
+                    token_cache.invalidate(merchant.id)
+                    return False, "No refresh token available"
+                
+                stale_access_token = stale_access_token or token.access_token
+                seen_refresh_token = seen_refresh_token or token.refresh_token
+                refreshed_elsewhere = token.access_token != stale_access_token or token.refresh_token != seen_refresh_token
+                if refreshed_elsewhere and not _needs_refresh(token.expires_at):
+                    token_cache.set(merchant.id, token.access_token, token.expires_at)
+                    return True, None
+                
+                if _claim_refresh(merchant, token):
+                    break
+                if time.monotonic() >= deadline:
+                    return False, "Token refresh already in progress"
+                time.sleep(REFRESH_CLAIM_POLL_SECONDS)
+            
+            try:
+                data = {
+                    "grant_type": "refresh_token",
+                    "client_id": settings.SALLA_CLIENT_ID,
+                    "client_secret": settings.SALLA_CLIENT_SECRET,
+                    "refresh_token": token.refresh_token,
+                }
+                
+                response = salla_client.request("POST", settings.SALLA_OAUTH_TOKEN_URL, data=data, timeout=20)
+                
+                if response.status_code != 200:
+                    error_text = response.text
+                    print(f"🔴 Token Refresh FAILED for merchant {merchant.salla_merchant_id}: {response.status_code} - {error_text}")
+                    raise TokenRefreshError(f"Token refresh failed: {response.status_code}")
+                
+                token_json = response.json()
+                new_access_token = token_json.get("access_token")
+                new_refresh_token = token_json.get("refresh_token", token.refresh_token)  # Keep old if not provided
+                expires_in = token_json.get("expires_in", 0)
+                
+                if not new_access_token:
+                    raise TokenRefreshError("No access token in refresh response")
+            except Exception:
+                _release_refresh(merchant, token)
+                raise
+            
+            expires_at = timezone.now() + timezone.timedelta(seconds=int(expires_in or 0))
+            
+            # Compare-and-swap: a reconnect that stored another token meanwhile wins
+            saved = SallaToken.objects.filter(merchant=merchant, refresh_token=token.refresh_token).update(
+                access_token=new_access_token,
+                refresh_token=new_refresh_token,
+                expires_at=expires_at,
+                last_refreshed_at=timezone.now(),
+                refresh_failures=0,
+                last_refresh_error=None,
+                refresh_claimed_until=None,
+                updated_at=timezone.now(),
+            )
+            if not saved:
+                token_cache.invalidate(merchant.id)
+                print(f"⚠️ Token of merchant {merchant.salla_merchant_id} was replaced during refresh; keeping the stored one")
+                return True, None
+            
+            token_cache.set(merchant.id, new_access_token, expires_at)
+            print(f"✅ Token refreshed successfully for merchant {merchant.salla_merchant_id}")
+            return True, None
+            
+        except TokenRefreshError as e:
+            return _refresh_failed(merchant, str(e))
+        except requests.exceptions.RequestException as e:
+            error_msg = f"Request error during token refresh: {str(e)}"
+            print(f"🔴 {error_msg}")
+            return _refresh_failed(merchant, error_msg)
+        except Exception as e:
+            error_msg = f"Unexpected error during token refresh: {str(e)}"
+            print(f"🔴 {error_msg}")
+            return _refresh_failed(merchant, error_msg)
 
 
 def get_valid_access_token(merchant: Merchant) -> Tuple[Optional[str], Optional[str]]:
     """
     Get a valid access token for merchant, refreshing if necessary.
+    Served from the process-local cache while the token is not near expiry.
     
     Returns:
         (access_token: Optional[str], error_message: Optional[str])
         If error_message is not None, the token refresh failed and merchant should reconnect.
     """
+    cached = token_cache.get(merchant.id)
+    if cached and not _needs_refresh(cached[1]):
+        return cached[0], None
+    
     token = SallaToken.objects.filter(merchant=merchant).first()
     
     if not token:
+        token_cache.invalidate(merchant.id)
         return None, "No token found - merchant needs to reconnect"
     
     # Check if token is expired or about to expire (within 5 minutes)
-    if token.expires_at and timezone.now() >= (token.expires_at - timezone.timedelta(minutes=5)):
+    if _needs_refresh(token.expires_at):
         # Token expired or about to expire, try to refresh
-        success, error_msg = refresh_salla_token(merchant)
+        success, error_msg = refresh_salla_token(merchant, stale_access_token=token.access_token)
         if not success:
             # Refresh failed - mark merchant as disconnected
             merchant.is_connected = False
             merchant.save(update_fields=["is_connected"])
             return None, error_msg or "Token refresh failed - merchant needs to reconnect"
         
+        cached = token_cache.get(merchant.id)
+        if cached:
+            return cached[0], None
+        
         # Reload token after refresh
         token.refresh_from_db()
     
+    token_cache.set(merchant.id, token.access_token, token.expires_at)
     return token.access_token, None
 
 
@@ -110,9 +255,10 @@ def call_salla_api_with_refresh(merchant: Merchant, method: str, url: str, **kwa
     headers.setdefault("Accept", "application/json")
     headers.setdefault("Content-Type", "application/json")
     kwargs["headers"] = headers
+    kwargs.setdefault("timeout", 30)
     
     try:
-        response = requests.request(method, url, timeout=30, **kwargs)
+        response = salla_client.request(method, url, **kwargs)
         
         # If we get 401, try refreshing token once
         if response.status_code == 401:
@@ -128,14 +274,15 @@ def call_salla_api_with_refresh(merchant: Merchant, method: str, url: str, **kwa
             
             if "invalid_token" in str(error_code).lower() or "unauthorized" in str(response.text).lower() or "unauthenticated" in str(response.text).lower():
                 print(f"🔄 Got 401, attempting token refresh for merchant {merchant.salla_merchant_id}")
-                success, refresh_error = refresh_salla_token(merchant)
+                token_cache.invalidate(merchant.id)
+                success, refresh_error = refresh_salla_token(merchant, stale_access_token=access_token)
                 
                 if success:
                     # Retry with new token
                     access_token, _ = get_valid_access_token(merchant)
                     headers["Authorization"] = f"Bearer {access_token}"
                     kwargs["headers"] = headers
-                    response = requests.request(method, url, timeout=30, **kwargs)
+                    response = salla_client.request(method, url, **kwargs)
                     
                     if response.status_code == 401:
                         print(f"🔴 Still 401 after refresh! URL: {url}")
@@ -4,6 +4,7 @@ Authentication decorators
 from functools import wraps
 from django.shortcuts import redirect
 from django.http import HttpRequest
+
 from .utils import get_current_merchant
 
 
@@ -14,6 +15,7 @@ def require_merchant_session(view_func):
     """
     @wraps(view_func)
     def wrapper(request: HttpRequest, *args, **kwargs):
+        # Also works for requests that didn't pass through CurrentMerchantMiddleware
         merchant = get_current_merchant(request)
         if not merchant:
             # No session - redirect to app entry point
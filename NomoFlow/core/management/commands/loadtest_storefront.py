@@ -0,0 +1,334 @@
+"""
+Load test the public storefront endpoints called by the embed scripts.
+
+Simulates --stores stores with --tabs open tabs each for --duration seconds of
+storefront time. Every tab follows the embed schedules: on each page load it
+checks feature flags and fetches the purchase display, notifications and
+coupons feeds and recommendations, and the live counter heartbeats at the
+interval the server returns. Requests run back to back through the Django
+test client against a throwaway test database (in-memory SQLite by
+default), so the report shows what a single worker can sustain:
+
+    python manage.py loadtest_storefront --stores 20 --tabs 5 --duration 300
+    python manage.py loadtest_storefront --legacy-live-counter   # track + live-count polling
+
+Per endpoint it prints requests, req/s, p50/p95/p99 latency and SQL queries
+per request, then compares the request rate the simulated tabs would produce
+in real time with the throughput achieved.
+"""
+import contextlib
+import heapq
+import io
+import json
+import math
+import random
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from core.models import Attribution, Merchant
+from coupons.models import Coupon
+from features.models import Feature, MerchantFeature
+from notifications.models import PopupNotification
+from recommendations.models import Order, OrderItem, Product
+
+
+FEATURE_KEYS = ['live_counter', 'email_collector', 'recent_purchases', 'recommendations']
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def record(self, seconds: float, queries: int, status: int) -> None:
+        self.latencies.append(seconds)
+        self.queries.append(queries)
+        if status >= 400:
+            self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(p / 100 * len(ordered)) - 1, 0)]
+
+
+class Tab:
+    """One open storefront tab"""
+
+    def __init__(self, store: dict, rng: random.Random):
+        self.store = store
+        self.session_id = uuid.uuid4().hex
+        self.rng = rng
+        self.page = '/'
+        self.product_id = None
+        self.viewed = []
+        self.generation = 0
+        self.pending_views = []
+
+
+class Command(BaseCommand):
+    help = "Simulate storefront tabs polling the public embed endpoints and report per-endpoint latency and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stores", type=int, default=10, help="Simulated stores")
+        parser.add_argument("--tabs", type=int, default=5, help="Open tabs per store")
+        parser.add_argument("--duration", type=int, default=120, help="Simulated storefront seconds")
+        parser.add_argument("--page-seconds", type=float, default=30.0, help="Average time a tab stays on a page")
+        parser.add_argument("--products", type=int, default=30, help="Seeded products per store")
+        parser.add_argument(
+            "--legacy-live-counter",
+            action="store_true",
+            help="Model the old live counter embed (track on load, live-count polling) instead of heartbeats",
+        )
+        parser.add_argument("--seed", type=int, default=1, help="Random seed")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    # --- setup ---------------------------------------------------------------
+
+    def _seed(self, stores: int, products: int) -> list:
+        features = [
+            Feature.objects.get_or_create(key=key, defaults={'title': key.replace('_', ' ').title()})[0]
+            for key in FEATURE_KEYS
+        ]
+        now = timezone.now()
+        seeded = []
+        for i in range(stores):
+            merchant = Merchant.objects.create(name=f"Load test store {i}", salla_merchant_id=f"loadtest-{i}")
+            MerchantFeature.objects.bulk_create([
+                MerchantFeature(merchant=merchant, feature=feature, is_enabled=True) for feature in features
+            ])
+            product_rows = Product.objects.bulk_create([
+                Product(
+                    merchant=merchant,
+                    salla_product_id=f"{i}-{n}",
+                    name=f"Product {n}",
+                    description=f"Load test product {n} in category {n % 5}",
+                    category=f"Category {n % 5}",
+                    tags=[f"tag{n % 3}", f"tag{n % 7}"],
+                    price=Decimal(10 + n),
+                )
+                for n in range(products)
+            ])
+            orders = Order.objects.bulk_create([
+                Order(merchant=merchant, salla_order_id=f"{i}-{n}", total_amount=Decimal(50), ordered_at=now)
+                for n in range(products // 2)
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, salla_product_id=product.salla_product_id, price=product.price)
+                for n, order in enumerate(orders)
+                for product in (product_rows[n], product_rows[(n * 3 + 1) % products])
+            ])
+            Coupon.objects.bulk_create([
+                Coupon(merchant=merchant, code=f"SAVE{n}", discount_kind=Coupon.PERCENT, amount=Decimal(10))
+                for n in range(3)
+            ])
+            PopupNotification.objects.bulk_create([
+                PopupNotification(merchant=merchant, title=f"Notice {n}", message="Load test")
+                for n in range(2)
+            ])
+            Attribution.objects.bulk_create([
+                Attribution(
+                    merchant=merchant,
+                    salla_order_id=f"{i}-{n}",
+                    customer_name="Customer",
+                    product_name=f"Product {n}",
+                    revenue_sar=Decimal(100),
+                    occurred_at=now - timedelta(hours=n),
+                )
+                for n in range(10)
+            ])
+            seeded.append({
+                'store_id': merchant.salla_merchant_id,
+                'products': [product.salla_product_id for product in product_rows],
+            })
+        return seeded
+
+    # --- requests ------------------------------------------------------------
+
+    def _request(self, label: str, method: str, path: str, body=None, content_type='application/json'):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if method == 'GET':
+                response = self.client.get(path)
+            else:
+                response = self.client.post(path, json.dumps(body), content_type=content_type)
+            elapsed = time.perf_counter() - started
+        self.stats.setdefault(label, EndpointStats()).record(elapsed, len(queries.captured_queries), response.status_code)
+        return response
+
+    def _load_page(self, tab: Tab) -> None:
+        """Every embed's requests for one page load"""
+        store_id = tab.store['store_id']
+        query = f"store_id={store_id}"
+
+        roll = tab.rng.random()
+        if roll < 0.6:
+            tab.product_id = tab.rng.choice(tab.store['products'])
+            tab.page = f"/p/{tab.product_id}"
+            tab.viewed = (tab.viewed + [tab.product_id])[-5:]
+        elif roll < 0.7:
+            tab.page = '/cart'
+        else:
+            tab.page = tab.rng.choice(['/', '/category', '/offers'])
+
+        # Email collector, purchase display, notifications and coupons embeds
+        self._request("GET /features/is-enabled/", 'GET', f"/features/is-enabled/?{query}")
+        self._request("GET /features/is-enabled/", 'GET', f"/features/is-enabled/?feature=recent_purchases&{query}")
+        self._request("GET /features/purchase-display/feed/", 'GET', f"/features/purchase-display/feed/?{query}")
+        self._request("GET /notifications/feed/", 'GET', f"/notifications/feed/?{query}")
+        self._request("GET /coupons/feed/", 'GET', f"/coupons/feed/?{query}")
+
+        # Recommendation widgets
+        self._request("GET /features/is-enabled/", 'GET', f"/features/is-enabled/?feature=recommendations&{query}")
+        if tab.page.startswith('/p/'):
+            # Similar products and frequently bought together each fetch it
+            for _ in range(2):
+                self._request(
+                    "GET /api/recommendations/product/<id>/", 'GET',
+                    f"/api/recommendations/product/{tab.product_id}/?{query}",
+                )
+            self._request("POST /api/recommendations/track/", 'POST', "/api/recommendations/track/", {
+                'store_id': store_id,
+                'product_id': tab.product_id,
+                'interaction_type': 'view',
+                'session_id': tab.session_id,
+            })
+        elif tab.page == '/cart':
+            self._request(
+                "GET /api/recommendations/customer/", 'GET',
+                f"/api/recommendations/customer/?{query}&viewed_products={','.join(tab.viewed)}",
+            )
+
+    def _heartbeat(self, tab: Tab) -> float:
+        """One live counter heartbeat; returns seconds until the next one"""
+        events, tab.pending_views = tab.pending_views, []
+        response = self._request("POST /visitors/heartbeat/", 'POST', "/visitors/heartbeat/", {
+            'store_id': tab.store['store_id'],
+            'session_id': tab.session_id,
+            'page': tab.page,
+            'events': events,
+        })
+        try:
+            interval = response.json().get('next_interval_ms', 10000) / 1000
+        except ValueError:
+            interval = 10.0
+        return max(interval * tab.rng.uniform(0.9, 1.1), 5.0)
+
+    def _legacy_poll(self, tab: Tab, first: bool) -> float:
+        store_id = tab.store['store_id']
+        if first:
+            self._request("POST /visitors/track/", 'POST', "/visitors/track/", {
+                'store_id': store_id, 'session_id': tab.session_id, 'page': tab.page,
+            })
+        self._request("GET /visitors/live-count/", 'GET', f"/visitors/live-count/?store_id={store_id}")
+        return getattr(settings, 'VISITORS_HEARTBEAT_BASE_SECONDS', 10)
+
+    def _hide_page(self, tab: Tab) -> None:
+        """Beacon with the page views still queued when the tab navigates away"""
+        if tab.pending_views:
+            self._request("POST /visitors/track/batch/", 'POST', "/visitors/track/batch/", {
+                'store_id': tab.store['store_id'],
+                'session_id': tab.session_id,
+                'events': tab.pending_views,
+            }, content_type='text/plain')
+            tab.pending_views = []
+
+    # --- simulation ----------------------------------------------------------
+
+    def _run(self, options):
+        stores = self._seed(options['stores'], max(options['products'], 4))
+        rng = random.Random(options['seed'])
+        tabs = [Tab(store, rng) for store in stores for _ in range(options['tabs'])]
+        legacy = options['legacy_live_counter']
+        duration = options['duration']
+        page_seconds = options['page_seconds']
+
+        self.client = Client()
+        self.stats = {}
+
+        # (storefront time, tie breaker, event, tab, live counter generation)
+        events = []
+        for n, tab in enumerate(tabs):
+            heapq.heappush(events, (rng.uniform(0, page_seconds), n, 'page', tab, 0))
+        sequence = len(tabs)
+
+        self.stdout.write(
+            f"Simulating {len(tabs)} tabs across {len(stores)} stores for {duration}s of storefront time..."
+        )
+        started = time.perf_counter()
+
+        # Views print debug output; keep it out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            while events:
+                at, _, kind, tab, generation = heapq.heappop(events)
+                if at > duration:
+                    break
+
+                if kind == 'page':
+                    if not legacy:
+                        self._hide_page(tab)
+                    self._load_page(tab)
+                    if not legacy:
+                        tab.pending_views.append({'page': tab.page, 'viewed_at': int(time.time() * 1000)})
+                    # A new page restarts the live counter embed
+                    tab.generation += 1
+                    sequence += 1
+                    heapq.heappush(events, (at, sequence, 'live', tab, tab.generation))
+                    sequence += 1
+                    heapq.heappush(events, (at + page_seconds * rng.uniform(0.5, 1.5), sequence, 'page', tab, 0))
+
+                elif generation == tab.generation:
+                    if legacy:
+                        wait = self._legacy_poll(tab, first=(kind == 'live'))
+                    else:
+                        wait = self._heartbeat(tab)
+                    sequence += 1
+                    heapq.heappush(events, (at + wait, sequence, 'poll', tab, generation))
+
+        elapsed = time.perf_counter() - started
+        self._report(elapsed, duration, len(tabs))
+
+    def _report(self, elapsed: float, duration: int, tab_count: int) -> None:
+        header = f"{'endpoint':<42} {'requests':>8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>6}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+
+        total = 0
+        for label, stats in sorted(self.stats.items()):
+            count = len(stats.latencies)
+            total += count
+            busy = sum(stats.latencies)
+            self.stdout.write(
+                f"{label:<42} {count:>8} {count / busy if busy else 0:>8.0f} "
+                f"{stats.percentile(50) * 1000:>8.1f} {stats.percentile(95) * 1000:>8.1f} "
+                f"{stats.percentile(99) * 1000:>8.1f} {sum(stats.queries) / count:>8.1f} {stats.errors:>6}"
+            )
+
+        achieved = total / elapsed if elapsed else 0
+        offered = total / duration if duration else 0
+        self.stdout.write('')
+        self.stdout.write(
+            f"{total} requests in {elapsed:.1f}s: {achieved:.0f} req/s achieved, "
+            f"{offered:.1f} req/s offered by {tab_count} tabs"
+        )
+        if offered:
+            self.stdout.write(self.style.SUCCESS(
+                f"One worker keeps up with roughly {tab_count * achieved / offered:.0f} concurrent storefront tabs"
+            ))
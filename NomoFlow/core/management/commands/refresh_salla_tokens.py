@@ -0,0 +1,75 @@
+"""
+Refresh Salla access tokens before they expire.
+
+    python manage.py refresh_salla_tokens
+    python manage.py refresh_salla_tokens --interval 300          # keep running
+    python manage.py refresh_salla_tokens --ahead-minutes 60 --workers 8
+
+Keep --ahead-minutes comfortably above --interval plus the 5 minute margin
+at which request paths refresh on their own, so they never have to.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.token_refresh import refresh_due_tokens
+
+
+class Command(BaseCommand):
+    help = "Refresh Salla tokens that expire soon, with a bounded thread pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead-minutes",
+            type=int,
+            default=getattr(settings, "SALLA_TOKEN_REFRESH_AHEAD_SECONDS", 1800) // 60,
+            help="Refresh tokens expiring within this many minutes",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "SALLA_TOKEN_REFRESH_WORKERS", 4),
+            help="Concurrent refreshes",
+        )
+        parser.add_argument(
+            "--max-failures",
+            type=int,
+            default=5,
+            help="Skip tokens that failed this many times in a row (the merchant must reconnect)",
+        )
+        parser.add_argument("--limit", type=int, help="Refresh at most this many tokens per pass")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Run again every N seconds instead of exiting after one pass",
+        )
+
+    def handle(self, *args, **options):
+        totals = {"refreshed": 0, "failed": 0}
+        while True:
+            run = refresh_due_tokens(
+                ahead=timedelta(minutes=options["ahead_minutes"]),
+                workers=options["workers"],
+                max_failures=options["max_failures"],
+                limit=options["limit"],
+            )
+            totals["refreshed"] += run.refreshed
+            totals["failed"] += run.failed
+
+            for error in run.errors:
+                self.stderr.write(f"Refresh failed for {error}")
+            style = self.style.SUCCESS if not run.failed else self.style.WARNING
+            self.stdout.write(style(
+                f"{run.due} due, {run.refreshed} refreshed, {run.failed} failed "
+                f"(avg {run.avg_seconds:.2f}s, max {run.max_seconds:.2f}s; "
+                f"total {totals['refreshed']} refreshed, {totals['failed']} failed)"
+            ))
+
+            if not options["interval"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,17 @@
+from .utils import get_current_merchant
+
+
+class CurrentMerchantMiddleware:
+    """
+    Expose the session's merchant as request.merchant: the Merchant, or None
+    when there is no connected merchant in the session, so views can test it
+    with `if not request.merchant:` and pass it straight to the ORM.
+    Requests without a session cookie (storefront embeds) cost no query.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.merchant = get_current_merchant(request)
+        return self.get_response(request)
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attribution_customer_name_attribution_product_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sallatoken',
+            name='last_refresh_error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sallatoken',
+            name='last_refreshed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sallatoken',
+            name='refresh_failures',
+            field=models.PositiveIntegerField(default=0, help_text='Consecutive failed refreshes'),
+        ),
+        migrations.AddIndex(
+            model_name='sallatoken',
+            index=models.Index(fields=['expires_at'], name='core_sallat_expires_cd8904_idx'),
+        ),
+    ]
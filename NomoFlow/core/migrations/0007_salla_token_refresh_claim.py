@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_salla_token_refresh_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sallatoken',
+            name='refresh_claimed_until',
+            field=models.DateTimeField(blank=True, help_text='Lease of the caller refreshing the token', null=True),
+        ),
+    ]
@@ -31,10 +31,17 @@ class SallaToken(models.Model):
     refresh_token = models.TextField()
     expires_at = models.DateTimeField()
     scope = models.TextField(null=True, blank=True)
+    last_refreshed_at = models.DateTimeField(null=True, blank=True)
+    refresh_failures = models.PositiveIntegerField(default=0, help_text="Consecutive failed refreshes")
+    last_refresh_error = models.TextField(null=True, blank=True)
+    refresh_claimed_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the caller refreshing the token")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
         verbose_name = "Salla Token"
         verbose_name_plural = "Salla Tokens"
 
@@ -0,0 +1,218 @@
+"""
+Shared HTTP client for Salla API and OAuth traffic.
+
+All calls go through one pooled requests.Session per process, so connections
+to Salla are kept alive and reused instead of paying a TCP+TLS handshake per
+call. Rate-limited (429) and transient server errors are retried with
+jittered exponential backoff, honouring Retry-After. Every attempt is timed
+and recorded per endpoint, with numeric ids folded into the path
+(GET api.salla.dev/admin/v2/coupons/{id}).
+
+The client only talks to the URLs it is given, so pointing SALLA_API_BASE and
+SALLA_OAUTH_TOKEN_URL at a local stub server is enough to exercise it.
+"""
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable, Deque, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.utils import timezone
+
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Methods that are safe to resend after a server error or a dropped connection.
+# Other methods (POST) are only retried on 429 or when the connection was never made.
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F-]{32,36})(?=/|$)")
+
+
+def endpoint_key(method: str, url: str) -> str:
+    """Metrics key of a call: method, host and path with ids replaced by {id}"""
+    parts = urlsplit(url)
+    return f"{method.upper()} {parts.netloc}{_ID_SEGMENT.sub('/{id}', parts.path)}"
+
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Seconds asked for by a Retry-After header (delta-seconds or HTTP date)"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - timezone.now()).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class EndpointStats:
+    """Latency and outcome counters of one endpoint"""
+
+    def __init__(self, window: int):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, float]:
+        ordered = sorted(self.latencies)
+
+        def percentile(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": (self.total_seconds / self.calls * 1000) if self.calls else 0.0,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": self.max_seconds * 1000,
+        }
+
+
+class RateLimiter:
+    """Spaces calls out to at most `rate` per second across threads (0 = unlimited)"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SallaClient:
+    """Pooled, retrying HTTP client with per-endpoint latency metrics"""
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 30.0,
+        metrics_window: int = 500,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.metrics_window = metrics_window
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._stats: Dict[str, EndpointStats] = {}
+
+        self.session = requests.Session()
+        # Retries are handled here, where they can be timed and logged
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        # Full jitter, so callers throttled together do not retry together
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _record(self, key: str, seconds: float, failed: bool, retried: bool) -> None:
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats(self.metrics_window)
+            stats.calls += 1
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.latencies.append(seconds)
+            if failed:
+                stats.errors += 1
+            if retried:
+                stats.retries += 1
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Send a request, retrying 429 and transient failures.
+
+        Returns the last response once it is not retryable or retries are
+        exhausted; raises the last requests exception when no response came.
+        """
+        method = method.upper()
+        kwargs.setdefault("timeout", self.timeout)
+        key = endpoint_key(method, url)
+        idempotent = method in IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                # A connect timeout never reached Salla, so even a POST can be resent
+                retryable = idempotent or isinstance(e, requests.exceptions.ConnectTimeout)
+                retry = retryable and attempt < self.max_retries
+                self._record(key, time.monotonic() - started, failed=True, retried=retry)
+                if not retry:
+                    raise
+                delay = self._backoff_delay(attempt)
+                print(f"⚠️ Salla {key} failed ({e.__class__.__name__}); retry {attempt + 1} in {delay:.1f}s")
+            else:
+                status = response.status_code
+                retryable = status == 429 or (status in RETRY_STATUSES and idempotent)
+                retry = retryable and attempt < self.max_retries
+                delay = None
+                if retry:
+                    delay = self._backoff_delay(attempt)
+                    wait = retry_after_seconds(response)
+                    if wait is not None:
+                        if wait > self.max_backoff:
+                            # Throttled for longer than a caller should block; give the 429 back
+                            retry = False
+                        else:
+                            delay = max(delay, wait)
+                self._record(key, time.monotonic() - started, failed=status >= 500 or status == 429, retried=retry)
+                if not retry:
+                    return response
+                print(f"⚠️ Salla {key} returned {status}; retry {attempt + 1} in {delay:.1f}s")
+                response.close()
+
+            self._sleep(delay)
+            attempt += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-endpoint metrics of this process since start or the last reset"""
+        with self._lock:
+            return {key: stats.snapshot() for key, stats in sorted(self._stats.items())}
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+salla_client = SallaClient(
+    pool_size=getattr(settings, 'SALLA_HTTP_POOL_SIZE', 10),
+    max_retries=getattr(settings, 'SALLA_HTTP_MAX_RETRIES', 3),
+    backoff=getattr(settings, 'SALLA_HTTP_BACKOFF_SECONDS', 0.5),
+    max_backoff=getattr(settings, 'SALLA_HTTP_MAX_BACKOFF_SECONDS', 30.0),
+    timeout=getattr(settings, 'SALLA_HTTP_TIMEOUT_SECONDS', 30.0),
+)
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .auth_utils import token_cache
+from .models import Merchant, SallaToken
+from .utils import invalidate_store_merchant
+
+
+@receiver(post_save, sender=Merchant)
+@receiver(post_delete, sender=Merchant)
+def invalidate_merchant_cache(sender, instance, **kwargs):
+    invalidate_store_merchant(instance.salla_merchant_id)
+
+
+@receiver(post_save, sender=SallaToken)
+@receiver(post_delete, sender=SallaToken)
+def invalidate_token_cache(sender, instance, **kwargs):
+    token_cache.invalidate(instance.merchant_id)
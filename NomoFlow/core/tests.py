@@ -1,3 +1,209 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.core.handlers.wsgi import WSGIRequest
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .auth_utils import get_valid_access_token, refresh_salla_token, token_cache
+from .decorators import require_merchant_session
+from .middleware import CurrentMerchantMiddleware
+from .models import Merchant, SallaToken
+from .salla_client import SallaClient
+from .utils import SESSION_KEY_CURRENT_MERCHANT_ID, get_current_merchant, set_current_merchant
+
+
+class CurrentMerchantMiddlewareTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="100")
+
+    def _request(self, merchant_id=None):
+        request = RequestFactory().get("/")
+        request.session = {}
+        if merchant_id:
+            request.session[SESSION_KEY_CURRENT_MERCHANT_ID] = merchant_id
+        return CurrentMerchantMiddleware(lambda r: r)(request)
+
+    def test_no_session_merchant_is_none(self):
+        request = self._request()
+        self.assertIs(request.merchant, None)
+
+    def test_session_merchant_is_resolved_once(self):
+        with self.assertNumQueries(1):
+            request = self._request(self.merchant.id)
+            self.assertEqual(request.merchant, self.merchant)
+            self.assertEqual(get_current_merchant(request), self.merchant)
+        self.assertIs(type(request.merchant), Merchant)
+        self.assertIs(type(request), WSGIRequest)
+
+    def test_disconnected_merchant_is_none(self):
+        Merchant.objects.filter(id=self.merchant.id).update(is_connected=False)
+        self.assertIs(self._request(self.merchant.id).merchant, None)
+
+    def test_set_current_merchant_resets_request(self):
+        request = self._request()
+        self.assertIs(request.merchant, None)
+        set_current_merchant(request, self.merchant)
+        self.assertEqual(request.merchant, self.merchant)
+
+    def test_require_merchant_session_without_the_middleware(self):
+        view = require_merchant_session(lambda request: HttpResponse("ok"))
+
+        request = RequestFactory().get("/")
+        request.session = {}
+        self.assertEqual(view(request).status_code, 302)
+
+        request = RequestFactory().get("/")
+        request.session = {SESSION_KEY_CURRENT_MERCHANT_ID: self.merchant.id}
+        self.assertEqual(view(request).content, b"ok")
+
+
+class StubServer:
+    """Local HTTP server answering every request with the next queued (status, headers, body)"""
+
+    def __init__(self, *responses, delay=0.0):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                stub.requests.append((self.command, self.path, self.rfile.read(length)))
+                time.sleep(delay)
+                status, headers, body = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                body = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _reply
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class SallaClientRetryTests(TestCase):
+    def setUp(self):
+        self.sleeps = []
+        self.client = SallaClient(max_retries=3, backoff=0.01, max_backoff=5, sleep=self.sleeps.append)
+
+    def test_429_waits_for_retry_after(self):
+        with StubServer((429, {"Retry-After": "2"}, {}), (200, {}, {"ok": True})) as stub:
+            response = self.client.request("GET", f"{stub.url}/orders")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(stub.requests), 2)
+        self.assertEqual(len(self.sleeps), 1)
+        self.assertGreaterEqual(self.sleeps[0], 2)
+
+    def test_retry_after_beyond_max_backoff_returns_the_429(self):
+        with StubServer((429, {"Retry-After": "60"}, {})) as stub:
+            response = self.client.request("GET", f"{stub.url}/orders")
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual((len(stub.requests), self.sleeps), (1, []))
+
+    def test_server_errors_are_retried_for_get_only(self):
+        with StubServer((503, {}, {})) as stub:
+            self.assertEqual(self.client.request("GET", f"{stub.url}/orders").status_code, 503)
+            self.assertEqual(len(stub.requests), 4)
+            self.assertEqual(self.client.request("POST", f"{stub.url}/orders").status_code, 503)
+            self.assertEqual(len(stub.requests), 5)
+
+        stats = self.client.stats()[f"GET 127.0.0.1:{stub.server.server_port}/orders"]
+        self.assertEqual((stats["calls"], stats["retries"], stats["errors"]), (4, 3, 4))
+
+
+class TokenRefreshTests(TransactionTestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="200")
+        SallaToken.objects.create(
+            merchant=self.merchant, access_token="old", refresh_token="r1",
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        token_cache.invalidate(self.merchant.id)
+        self.refreshed = (200, {}, {"access_token": "new", "refresh_token": "r2", "expires_in": 3600})
+
+    def test_concurrent_callers_share_one_refresh(self):
+        results = []
+        with StubServer(self.refreshed, delay=0.2) as stub, \
+                override_settings(SALLA_OAUTH_TOKEN_URL=f"{stub.url}/oauth2/token"):
+            threads = [
+                threading.Thread(target=lambda: results.append(get_valid_access_token(self.merchant)))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(results, [("new", None)] * 5)
+        token = SallaToken.objects.get(merchant=self.merchant)
+        self.assertEqual((token.refresh_token, token.refresh_claimed_until), ("r2", None))
+
+    def test_waits_for_a_refresh_claimed_elsewhere(self):
+        SallaToken.objects.filter(merchant=self.merchant).update(
+            refresh_claimed_until=timezone.now() + timedelta(seconds=30),
+        )
+
+        def other_worker_finishes():
+            SallaToken.objects.filter(merchant=self.merchant).update(
+                access_token="theirs", refresh_token="r9", refresh_claimed_until=None,
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+
+        with StubServer(self.refreshed) as stub, \
+                override_settings(SALLA_OAUTH_TOKEN_URL=f"{stub.url}/oauth2/token"):
+            timer = threading.Timer(0.3, other_worker_finishes)
+            timer.start()
+            result = refresh_salla_token(self.merchant, stale_access_token="old")
+            timer.join()
+
+        self.assertEqual(result, (True, None))
+        self.assertEqual(stub.requests, [])
+        self.assertEqual(token_cache.get(self.merchant.id)[0], "theirs")
+
+    def test_failed_refresh_releases_its_claim(self):
+        with StubServer((400, {}, {"error": "invalid_grant"})) as stub, \
+                override_settings(SALLA_OAUTH_TOKEN_URL=f"{stub.url}/oauth2/token"):
+            success, error = refresh_salla_token(self.merchant)
+
+        self.assertFalse(success)
+        token = SallaToken.objects.get(merchant=self.merchant)
+        self.assertEqual((token.refresh_failures, token.refresh_claimed_until), (1, None))
+        self.assertIn("400", token.last_refresh_error)
+
+    def test_reconnect_during_refresh_wins(self):
+        def reconnect():
+            SallaToken.objects.filter(merchant=self.merchant).update(
+                access_token="reconnected", refresh_token="r5",
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+
+        with StubServer(self.refreshed, delay=0.3) as stub, \
+                override_settings(SALLA_OAUTH_TOKEN_URL=f"{stub.url}/oauth2/token"):
+            timer = threading.Timer(0.1, reconnect)
+            timer.start()
+            self.assertEqual(refresh_salla_token(self.merchant), (True, None))
+            timer.join()
+
+        token = SallaToken.objects.get(merchant=self.merchant)
+        self.assertEqual((token.access_token, token.refresh_token), ("reconnected", "r5"))
@@ -0,0 +1,85 @@
+"""
+Proactive Salla token refresh.
+
+Tokens expiring within the refresh window are refreshed ahead of time by a
+bounded thread pool, so request paths find a valid cached token instead of
+blocking on the OAuth call. Refreshes go through refresh_salla_token, whose
+single-flight locking also keeps scheduler and request paths from
+refreshing the same token twice.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .auth_utils import refresh_salla_token
+from .models import SallaToken
+
+
+@dataclass
+class RefreshRun:
+    due: int = 0
+    refreshed: int = 0
+    failed: int = 0
+    durations: List[float] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def max_seconds(self) -> float:
+        return max(self.durations, default=0.0)
+
+    @property
+    def avg_seconds(self) -> float:
+        return sum(self.durations) / len(self.durations) if self.durations else 0.0
+
+
+def tokens_due(ahead: timedelta, max_failures: int, limit: Optional[int] = None):
+    """Tokens of connected merchants expiring within `ahead`, soonest first"""
+    tokens = SallaToken.objects.filter(
+        expires_at__lte=timezone.now() + ahead,
+        merchant__is_connected=True,
+        refresh_failures__lt=max_failures,
+    ).exclude(refresh_token='').select_related('merchant').order_by('expires_at')
+    return tokens[:limit] if limit else tokens
+
+
+def _refresh_one(token: SallaToken):
+    started = time.monotonic()
+    try:
+        success, error = refresh_salla_token(token.merchant, stale_access_token=token.access_token)
+    finally:
+        # Pool threads open their own connections
+        close_old_connections()
+    return token.merchant_id, success, error, time.monotonic() - started
+
+
+def refresh_due_tokens(
+    ahead: Optional[timedelta] = None,
+    workers: Optional[int] = None,
+    max_failures: int = 5,
+    limit: Optional[int] = None,
+) -> RefreshRun:
+    """Refresh every token that expires within `ahead`"""
+    ahead = ahead or timedelta(seconds=getattr(settings, 'SALLA_TOKEN_REFRESH_AHEAD_SECONDS', 1800))
+    workers = workers or getattr(settings, 'SALLA_TOKEN_REFRESH_WORKERS', 4)
+
+    run = RefreshRun()
+    tokens = list(tokens_due(ahead, max_failures, limit))
+    run.due = len(tokens)
+    if not tokens:
+        return run
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='salla-token-refresh') as pool:
+        for merchant_id, success, error, seconds in pool.map(_refresh_one, tokens):
+            run.durations.append(seconds)
+            if success:
+                run.refreshed += 1
+            else:
+                run.failed += 1
+                run.errors.append(f"merchant {merchant_id}: {error}")
+    return run
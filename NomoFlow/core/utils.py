@@ -1,6 +1,10 @@
 from __future__ import annotations
 
-from typing import Optional
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from django.conf import settings
+from django.db import router
 from django.http import HttpRequest
 from .models import Merchant, SallaToken
 
@@ -10,13 +14,18 @@ SESSION_KEY_CURRENT_MERCHANT_ID = "current_merchant_id"
 
 def set_current_merchant(request: HttpRequest, merchant: Merchant) -> None:
     request.session[SESSION_KEY_CURRENT_MERCHANT_ID] = merchant.id
+    reset_current_merchant(request)
 
 
 def get_current_merchant(request: HttpRequest) -> Optional[Merchant]:
     """
     Get current merchant from session.
     Returns None if no valid session exists.
+    The result is remembered on the request, so repeated calls cost nothing.
     """
+    if '_current_merchant' in request.__dict__:
+        return request._current_merchant
+
     merchant: Optional[Merchant] = None
 
     try:
@@ -26,9 +35,17 @@ def get_current_merchant(request: HttpRequest) -> Optional[Merchant]:
     except Exception:
         merchant = None
 
+    request._current_merchant = merchant
     return merchant
 
 
+def reset_current_merchant(request: HttpRequest) -> None:
+    """Re-resolve the merchant of this request after the session changed"""
+    request.__dict__.pop('_current_merchant', None)
+    if 'merchant' in request.__dict__:
+        request.merchant = get_current_merchant(request)
+
+
 def clear_current_merchant(request: HttpRequest) -> None:
     """Clear current merchant from session (logout)"""
     try:
@@ -37,8 +54,71 @@ def clear_current_merchant(request: HttpRequest) -> None:
             del request.session[SESSION_KEY_CURRENT_MERCHANT_ID]
             # Save session to ensure changes are persisted
             request.session.save()
+            reset_current_merchant(request)
             print(f"✅ Cleared session for merchant ID: {merchant_id}")
     except Exception as e:
         print(f"⚠️ Error clearing session: {e}")
 
 
+
+
+# --- Public store_id -> Merchant resolution ---------------------------------
+#
+# Every storefront embed call starts by resolving its store_id. Results are
+# cached per process: (merchant id, is_connected) for known stores, None for
+# unknown ids. Merchant save/delete signals invalidate the local entry; other
+# worker processes pick up changes within the TTL.
+
+_MERCHANT_CACHE_MAX_ENTRIES = 10000
+
+_merchant_cache: Dict[str, Tuple[float, Optional[Tuple[int, bool]]]] = {}
+_merchant_cache_lock = threading.Lock()
+
+
+def _lookup_store_merchant(store_id: str) -> Optional[Tuple[int, bool]]:
+    return Merchant.objects.filter(salla_merchant_id=store_id).values_list('id', 'is_connected').first()
+
+
+def _cached_store_merchant(store_id: str) -> Optional[Tuple[int, bool]]:
+    now = time.monotonic()
+    entry = _merchant_cache.get(store_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    found = _lookup_store_merchant(store_id)
+    if found is not None:
+        ttl = getattr(settings, 'MERCHANT_CACHE_TTL_SECONDS', 60)
+    else:
+        ttl = getattr(settings, 'MERCHANT_NEGATIVE_CACHE_TTL_SECONDS', 10)
+
+    with _merchant_cache_lock:
+        if len(_merchant_cache) >= _MERCHANT_CACHE_MAX_ENTRIES:
+            # Unknown ids are caller-controlled; never let them grow the cache unbounded
+            for key in [key for key, (expires, _) in _merchant_cache.items() if expires <= now]:
+                del _merchant_cache[key]
+            if len(_merchant_cache) >= _MERCHANT_CACHE_MAX_ENTRIES:
+                _merchant_cache.clear()
+        _merchant_cache[store_id] = (now + ttl, found)
+    return found
+
+
+def resolve_store_merchant(store_id) -> Optional[Merchant]:
+    """
+    Get the merchant for a public store_id (Salla merchant id), or None.
+    The returned instance only has id, salla_merchant_id and is_connected
+    loaded; other fields load from the database on first access.
+    """
+    if not store_id:
+        return None
+    store_id = str(store_id)
+
+    found = _cached_store_merchant(store_id)
+    if found is None:
+        return None
+    merchant_id, is_connected = found
+    return Merchant.from_db(router.db_for_read(Merchant), ['id', 'salla_merchant_id', 'is_connected'], [merchant_id, store_id, is_connected])
+
+
+def invalidate_store_merchant(store_id) -> None:
+    with _merchant_cache_lock:
+        _merchant_cache.pop(str(store_id), None)
@@ -1,7 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.views.decorators.http import require_http_methods
-from .utils import get_current_merchant, set_current_merchant, clear_current_merchant, SESSION_KEY_CURRENT_MERCHANT_ID
+from .utils import set_current_merchant, clear_current_merchant, SESSION_KEY_CURRENT_MERCHANT_ID
 from .models import Merchant, SallaToken
 
 
@@ -41,7 +41,7 @@ def app_entry(request):
     else:
         lang = request.session.get('language', 'ar')  # Default to Arabic
     
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     if merchant:
         # Valid session exists - redirect to dashboard
@@ -106,7 +106,7 @@ def disconnect(request):
     Disconnect: Delete tokens and mark merchant as disconnected.
     Merchant account remains but in disconnected state.
     """
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     if not merchant:
         messages.error(request, 'لا توجد جلسة نشطة')
@@ -1,3 +1,7 @@
 from django.test import TestCase
 
-# Create your tests here.
+
+class AnonymousPagesTests(TestCase):
+    def test_coupons_page_without_merchant(self):
+        response = self.client.get("/coupons/")
+        self.assertEqual(response.status_code, 200)
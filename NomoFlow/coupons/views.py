@@ -7,15 +7,15 @@ from django.utils import timezone
 from .models import Coupon
 from .forms import CouponForm
 from core.models import Merchant, SallaToken
-from core.utils import get_current_merchant
+from core.auth_utils import call_salla_api_with_refresh
+from core.utils import resolve_store_merchant
 from django.conf import settings
 from datetime import timedelta
-import requests
 
 
 def get_merchant(request):
     """Resolve current merchant using session-aware resolver."""
-    return get_current_merchant(request)
+    return request.merchant
 
 
 @ensure_csrf_cookie
@@ -162,12 +162,11 @@ def public_coupons_feed(request):
         print(f"   ❌ Template variable not replaced by Salla: {store_id}")
         return JsonResponse({'coupons': [], 'error': 'Template variable not replaced'})
     
-    try:
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        print(f"   ✅ Found merchant: {merchant.name}")
-    except Merchant.DoesNotExist:
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
         print(f"   ❌ No merchant found with ID: {store_id}")
         return JsonResponse({'coupons': []})
+    print(f"   ✅ Found merchant: {merchant.id}")
     
     now = timezone.now()
     
@@ -198,7 +197,8 @@ def public_coupons_feed(request):
 def _create_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
     """Best-effort create the coupon in Salla Admin API and store the returned id.
 
-    - Requires the merchant to have an active SallaToken (OAuth install).
+    - Requires the merchant to have an active SallaToken (OAuth install);
+      the token is refreshed on demand.
     - Tries a few likely endpoints; succeeds on the first 200/201 response.
     - Never raises to caller; meant to be used inside a try/except.
     """
@@ -206,11 +206,6 @@ def _create_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
     if coupon.salla_coupon_id:
         return
 
-    token = SallaToken.objects.filter(merchant=merchant).first()
-    if not token or not token.access_token:
-        print("ℹ️ No Salla token for merchant; skipping Salla coupon creation")
-        return
-
     base = (getattr(settings, 'SALLA_API_BASE', '').rstrip('/') or 'https://api.salla.dev/admin/v2')
     # Use only the generic /coupons endpoint (expects type/amount and YYYY-MM-DD dates)
     endpoints = [
@@ -258,42 +253,36 @@ def _create_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
     }
     legacy_payload = {k: v for k, v in legacy_payload.items() if v is not None}
 
-    headers = {
-        "Authorization": f"Bearer {token.access_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-
     last_status = None
     last_body = None
     for url in endpoints:
-        try:
-            send_payload = legacy_payload
-            resp = requests.post(url, json=send_payload, headers=headers, timeout=20)
-            last_status = resp.status_code
-            if resp.status_code in (200, 201):
+        send_payload = legacy_payload
+        resp, error_msg = call_salla_api_with_refresh(merchant, "POST", url, json=send_payload, timeout=20)
+        if error_msg:
+            print(f"🔴 Salla API request error for {url}: {error_msg}")
+            continue
+        last_status = resp.status_code
+        if resp.status_code in (200, 201):
+            data = {}
+            try:
+                data = resp.json()
+            except Exception:
                 data = {}
-                try:
-                    data = resp.json()
-                except Exception:
-                    data = {}
-                salla_id = (
-                    (data.get('data') or {}).get('id')
-                    or data.get('id')
-                    or (data.get('data') or {}).get('coupon', {}).get('id')
-                )
-                if salla_id:
-                    coupon.salla_coupon_id = str(salla_id)
-                    coupon.save(update_fields=["salla_coupon_id"]) 
-                    print(f"✅ Created Salla coupon id={salla_id} via {url}")
-                    return
-            else:
-                try:
-                    last_body = resp.text
-                except Exception:
-                    last_body = None
-        except requests.exceptions.RequestException as e:
-            print(f"🔴 Salla API request error for {url}: {e}")
+            salla_id = (
+                (data.get('data') or {}).get('id')
+                or data.get('id')
+                or (data.get('data') or {}).get('coupon', {}).get('id')
+            )
+            if salla_id:
+                coupon.salla_coupon_id = str(salla_id)
+                coupon.save(update_fields=["salla_coupon_id"]) 
+                print(f"✅ Created Salla coupon id={salla_id} via {url}")
+                return
+        else:
+            try:
+                last_body = resp.text
+            except Exception:
+                last_body = None
 
     print(f"⚠️ Failed to create coupon in Salla. Last status={last_status}, body={last_body}")
 
@@ -307,11 +296,6 @@ def _update_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
         print("ℹ️ No salla_coupon_id; skipping Salla update")
         return
 
-    token = SallaToken.objects.filter(merchant=merchant).first()
-    if not token or not token.access_token:
-        print("ℹ️ No Salla token; skipping Salla update")
-        return
-
     base = (getattr(settings, 'SALLA_API_BASE', '').rstrip('/') or 'https://api.salla.dev/admin/v2')
     url = f"{base}/coupons/{coupon.salla_coupon_id}"
     
@@ -347,20 +331,13 @@ def _update_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
     # Remove None values
     payload = {k: v for k, v in payload.items() if v is not None}
 
-    headers = {
-        "Authorization": f"Bearer {token.access_token}",
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-    }
-
-    try:
-        resp = requests.put(url, json=payload, headers=headers, timeout=20)
-        if resp.status_code in (200, 201):
-            print(f"✅ Updated Salla coupon id={coupon.salla_coupon_id}")
-        else:
-            print(f"⚠️ Failed to update Salla coupon. Status={resp.status_code}, body={resp.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"🔴 Salla API update request error: {e}")
+    resp, error_msg = call_salla_api_with_refresh(merchant, "PUT", url, json=payload, timeout=20)
+    if error_msg:
+        print(f"🔴 Salla API update request error: {error_msg}")
+    elif resp.status_code in (200, 201):
+        print(f"✅ Updated Salla coupon id={coupon.salla_coupon_id}")
+    else:
+        print(f"⚠️ Failed to update Salla coupon. Status={resp.status_code}, body={resp.text}")
 
 
 def _delete_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
@@ -372,27 +349,16 @@ def _delete_coupon_in_salla(merchant: Merchant, coupon: Coupon) -> None:
         print("ℹ️ No salla_coupon_id; skipping Salla deletion")
         return
 
-    token = SallaToken.objects.filter(merchant=merchant).first()
-    if not token or not token.access_token:
-        print("ℹ️ No Salla token; skipping Salla deletion")
-        return
-
     base = (getattr(settings, 'SALLA_API_BASE', '').rstrip('/') or 'https://api.salla.dev/admin/v2')
     url = f"{base}/coupons/{coupon.salla_coupon_id}"
 
-    headers = {
-        "Authorization": f"Bearer {token.access_token}",
-        "Accept": "application/json",
-    }
-
-    try:
-        resp = requests.delete(url, headers=headers, timeout=20)
-        if resp.status_code in (200, 204):
-            print(f"✅ Deleted Salla coupon id={coupon.salla_coupon_id}")
-        else:
-            print(f"⚠️ Failed to delete Salla coupon. Status={resp.status_code}, body={resp.text}")
-    except requests.exceptions.RequestException as e:
-        print(f"🔴 Salla API delete request error: {e}")
+    resp, error_msg = call_salla_api_with_refresh(merchant, "DELETE", url, timeout=20)
+    if error_msg:
+        print(f"🔴 Salla API delete request error: {error_msg}")
+    elif resp.status_code in (200, 204):
+        print(f"✅ Deleted Salla coupon id={coupon.salla_coupon_id}")
+    else:
+        print(f"⚠️ Failed to delete Salla coupon. Status={resp.status_code}, body={resp.text}")
 
 
 @require_GET
@@ -422,25 +388,22 @@ def check_coupon_sync(request, pk: int):
     }
 
     salla_id = (coupon.salla_coupon_id or "").strip()
-    token = SallaToken.objects.filter(merchant=merchant).first()
-    if salla_id and token and token.access_token:
+    if salla_id and SallaToken.objects.filter(merchant=merchant).exists():
         base = (getattr(settings, 'SALLA_API_BASE', '').rstrip('/') or 'https://api.salla.dev/admin/v2')
         candidates = [
             f"{base}/discounts/coupons/{salla_id}",
             f"{base}/discount-coupons/{salla_id}",
             f"{base}/coupons/{salla_id}",
         ]
-        headers = {"Authorization": f"Bearer {token.access_token}", "Accept": "application/json"}
         for url in candidates:
-            try:
-                r = requests.get(url, headers=headers, timeout=15)
-                if r.status_code == 200:
-                    result["remote"] = {"exists": True, "status": r.status_code, "source": url}
-                    break
-                else:
-                    result["remote"] = {"exists": False, "status": r.status_code, "source": url}
-            except requests.exceptions.RequestException as e:
-                result["remote"] = {"exists": False, "error": str(e), "source": url}
+            r, error_msg = call_salla_api_with_refresh(merchant, "GET", url, timeout=15)
+            if error_msg:
+                result["remote"] = {"exists": False, "error": error_msg, "source": url}
+            elif r.status_code == 200:
+                result["remote"] = {"exists": True, "status": r.status_code, "source": url}
+                break
+            else:
+                result["remote"] = {"exists": False, "status": r.status_code, "source": url}
 
     resp = JsonResponse(result)
     resp['Access-Control-Allow-Origin'] = '*'
@@ -3,14 +3,14 @@ from marketing.models import Campaign
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from core.models import Merchant
-from core.utils import get_current_merchant, set_current_merchant
+from core.utils import set_current_merchant
 from django.http import JsonResponse, HttpResponseBadRequest
 from .ai_engine import generate_ai_recommendations
 from features.models import Feature, MerchantFeature
 
 
 def index(request):
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('app_entry')
     kpis = ["Visitors", "Page Views", "Coupons", "Revenue"]
@@ -105,7 +105,7 @@ def switch_merchant(request):
 
 def page_recommendations(request):
     """Recommendations management page"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
     
@@ -134,7 +134,7 @@ def page_recommendations(request):
 
 def page_features(request):
     """Features control panel page"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
     
@@ -240,7 +240,7 @@ def page_features(request):
 
 def page_settings(request):
     """Account settings page"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('app_entry')
     
@@ -1,3 +1,58 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Merchant
+from core.utils import SESSION_KEY_CURRENT_MERCHANT_ID
+from visitors.ingest import SessionDelta, write_visits
+from visitors.models import PageView
+
+
+class SessionEngagementTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="800")
+        other = Merchant.objects.create(name="Other", salla_merchant_id="801")
+        self.start = timezone.now() - timedelta(hours=1)
+
+        self.visit("s1", ["/home", "/products"], step=60)
+        self.visit("s2", ["/home"])
+        self.visit("s3", ["/sale", "/cart", "/checkout"], step=60)
+        self.visit("s4", ["/home", "/cart"], step=600, merchant=other)
+
+        session = self.client.session
+        session[SESSION_KEY_CURRENT_MERCHANT_ID] = self.merchant.id
+        session.save()
+
+    def visit(self, session_id, paths, step=0, merchant=None):
+        """One write_visits call per page view, as the heartbeat buffer would make them"""
+        merchant = merchant or self.merchant
+        for i, path in enumerate(paths):
+            now = self.start + timedelta(seconds=i * step)
+            views = [PageView(merchant=merchant, session_id=session_id, path=path, viewed_at=now)]
+            delta = SessionDelta(now)
+            delta.add(views, now)
+            write_visits({(merchant.id, session_id): delta}, views)
+
+    def test_session_engagement(self):
+        response = self.client.get("/api/dashboard/session-engagement/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "days": 7,
+            "sessions": 3,
+            "avg_session_seconds": 60.0,
+            "pages_per_session": 2.0,
+            "bounce_rate": 33.3,
+        })
+
+    def test_entry_pages(self):
+        response = self.client.get("/api/dashboard/entry-pages/?limit=5")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["pages"], [
+            {"path": "/home", "sessions": 2, "pages_per_session": 1.5},
+            {"path": "/sale", "sessions": 1, "pages_per_session": 3.0},
+        ])
 
-# Create your tests here.
+    def test_invalid_days(self):
+        self.assertEqual(self.client.get("/api/dashboard/session-engagement/?days=x").status_code, 400)
+        self.assertEqual(self.client.get("/api/dashboard/entry-pages/?days=x").status_code, 400)
@@ -6,6 +6,10 @@ urlpatterns = [
     path("recommendations/", views.dashboard_recommendations, name="dashboard_recommendations"),
     path("campaigns/", views.dashboard_campaigns, name="dashboard_campaigns"),
     path("performance/", views.dashboard_performance, name="dashboard_performance"),
+    path("unique-visitors/", views.dashboard_unique_visitors, name="dashboard_unique_visitors"),
+    path("top-pages/", views.dashboard_top_pages, name="dashboard_top_pages"),
+    path("session-engagement/", views.dashboard_session_engagement, name="dashboard_session_engagement"),
+    path("entry-pages/", views.dashboard_entry_pages, name="dashboard_entry_pages"),
     path("coupon-usage/", views.dashboard_coupon_usage, name="dashboard_coupon_usage"),
     path("traffic-sources/", views.dashboard_traffic_sources, name="dashboard_traffic_sources"),
     path("sales/", views.dashboard_sales, name="dashboard_sales"),
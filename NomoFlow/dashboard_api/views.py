@@ -1,41 +1,40 @@
 from django.http import JsonResponse
-from django.db.models import Sum, Count
+from django.db.models import Avg, Count, Q, Sum
 from django.db.models.functions import TruncDate, TruncMonth, TruncYear
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
 from marketing.models import Campaign
 from coupons.models import Coupon
-from visitors.models import VisitorSession, PageView
-from core.utils import get_current_merchant
+from visitors.models import VisitorSession
+from visitors.rollups import daily_totals
+from visitors.hll import unique_visitors
+from visitors.top_pages import top_pages
+from visitors.enrichment import TRAFFIC_SOURCES
 from recommendations.models import Order
 
 def dashboard_metrics(request):
     from core.models import Attribution
     
     now = timezone.now()
-    week_ago = now - timedelta(days=7)
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
 
     # Visitor metrics
+    week = daily_totals(merchant, days=7, now=now)
     if merchant:
-        visitors = VisitorSession.objects.filter(merchant=merchant, last_seen_at__gte=week_ago)
-        page_views = PageView.objects.filter(merchant=merchant, viewed_at__gte=week_ago)
         coupons = Coupon.objects.filter(merchant=merchant)
         # Real revenue from Attribution
         total_revenue = Attribution.objects.filter(merchant=merchant).aggregate(
             total=Sum('revenue_sar')
         )['total'] or Decimal('0.00')
     else:
-        visitors = VisitorSession.objects.filter(last_seen_at__gte=week_ago)
-        page_views = PageView.objects.filter(viewed_at__gte=week_ago)
         coupons = Coupon.objects.all()
         total_revenue = Attribution.objects.aggregate(
             total=Sum('revenue_sar')
         )['total'] or Decimal('0.00')
 
-    total_visitors = visitors.count()
-    total_page_views = page_views.count()
+    total_visitors = unique_visitors(merchant, week[0]['date'], week[-1]['date'])
+    total_page_views = sum(day['page_views'] for day in week)
     total_coupons = coupons.count()
 
     data = {
@@ -48,18 +47,15 @@ def dashboard_metrics(request):
 
 
 def dashboard_recommendations(request):
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     recs = []
     
     # Visitor-based recommendations
-    now = timezone.now()
-    week_ago = now - timedelta(days=7)
+    visitors = sum(day['visitors'] for day in daily_totals(merchant, days=7))
     
     if merchant:
-        visitors = VisitorSession.objects.filter(merchant=merchant, last_seen_at__gte=week_ago).count()
         coupons = Coupon.objects.filter(merchant=merchant).count()
     else:
-        visitors = VisitorSession.objects.filter(last_seen_at__gte=week_ago).count()
         coupons = Coupon.objects.count()
     
     if visitors == 0:
@@ -91,44 +87,17 @@ def dashboard_campaigns(request):
 def dashboard_performance(request):
     """Get visitor analytics data for last 7 days"""
     now = timezone.now()
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     labels = []
     visitors_data = []
     page_views_data = []
     
-    # Get data for each of the last 7 days
-    for i in range(7):
-        day = now - timedelta(days=6-i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        # Get visitors and page views for this day
-        if merchant:
-            day_visitors = VisitorSession.objects.filter(
-                merchant=merchant,
-                last_seen_at__gte=day_start,
-                last_seen_at__lte=day_end
-            ).count()
-            day_page_views = PageView.objects.filter(
-                merchant=merchant,
-                viewed_at__gte=day_start,
-                viewed_at__lte=day_end
-            ).count()
-        else:
-            day_visitors = VisitorSession.objects.filter(
-                last_seen_at__gte=day_start,
-                last_seen_at__lte=day_end
-            ).count()
-            day_page_views = PageView.objects.filter(
-                viewed_at__gte=day_start,
-                viewed_at__lte=day_end
-            ).count()
-        
-        day_label = day.strftime('%a')
-        labels.append(day_label)
-        visitors_data.append(day_visitors)
-        page_views_data.append(day_page_views)
+    # Closed days come from the daily rollups, today from the raw tables
+    for day in daily_totals(merchant, days=7, now=now):
+        labels.append(day['date'].strftime('%a'))
+        visitors_data.append(day['visitors'])
+        page_views_data.append(day['page_views'])
     
     return JsonResponse({
         'labels': labels,
@@ -137,9 +106,112 @@ def dashboard_performance(request):
     })
 
 
+def dashboard_unique_visitors(request):
+    """Estimated unique visitors over the last N days (default 30)"""
+    merchant = request.merchant
+    
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 366))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid days'}, status=400)
+    
+    today = timezone.now().date()
+    start = today - timedelta(days=days - 1)
+    
+    return JsonResponse({
+        'days': days,
+        'start': start.isoformat(),
+        'end': today.isoformat(),
+        'unique_visitors': unique_visitors(merchant, start, today),
+    })
+
+
+def dashboard_top_pages(request):
+    """Get the pages with the most visitor activity right now"""
+    merchant = request.merchant
+    
+    if not merchant:
+        return JsonResponse({'error': 'No merchant selected', 'pages': []}, status=400)
+    
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit', 'pages': []}, status=400)
+    
+    return JsonResponse({'pages': top_pages.top(merchant.id, n=limit)})
+
+
+def _engagement_sessions(request, merchant, default_days=7):
+    """Sessions started in the last ?days that viewed at least one page"""
+    days = max(1, min(int(request.GET.get('days', default_days)), 366))
+    sessions = VisitorSession.objects.filter(
+        started_at__gte=timezone.now() - timedelta(days=days),
+        page_count__gt=0,
+    )
+    if merchant:
+        sessions = sessions.filter(merchant=merchant)
+    return days, sessions
+
+
+def dashboard_session_engagement(request):
+    """Average session duration, pages per session and bounce rate over the last N days"""
+    merchant = request.merchant
+    
+    try:
+        days, sessions = _engagement_sessions(request, merchant)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid days'}, status=400)
+    
+    # Reads only the running metrics kept on VisitorSession; no PageView join
+    stats = sessions.aggregate(
+        sessions=Count('id'),
+        avg_duration=Avg('duration_seconds'),
+        avg_pages=Avg('page_count'),
+        bounces=Count('id', filter=Q(page_count=1)),
+    )
+    total = stats['sessions']
+    
+    return JsonResponse({
+        'days': days,
+        'sessions': total,
+        'avg_session_seconds': round(stats['avg_duration'] or 0, 1),
+        'pages_per_session': round(stats['avg_pages'] or 0, 2),
+        'bounce_rate': round(stats['bounces'] / total * 100, 1) if total else 0,
+    })
+
+
+def dashboard_entry_pages(request):
+    """Most common landing pages over the last N days"""
+    merchant = request.merchant
+    
+    try:
+        days, sessions = _engagement_sessions(request, merchant)
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid days or limit', 'pages': []}, status=400)
+    
+    rows = (
+        sessions.values('first_path')
+        .annotate(sessions=Count('id'), avg_pages=Avg('page_count'))
+        .order_by('-sessions')[:limit]
+    )
+    
+    return JsonResponse({
+        'days': days,
+        'pages': [
+            {
+                'path': row['first_path'],
+                'sessions': row['sessions'],
+                'pages_per_session': round(row['avg_pages'] or 0, 2),
+            }
+            for row in rows
+        ],
+    })
+
+
 def dashboard_coupon_usage(request):
     """Get coupon usage statistics"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     if merchant:
         coupons = Coupon.objects.filter(merchant=merchant)
@@ -157,7 +229,7 @@ def dashboard_coupon_usage(request):
 
 def dashboard_traffic_sources(request):
     """Get traffic sources analytics"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     now = timezone.now()
     week_ago = now - timedelta(days=7)
     
@@ -166,13 +238,15 @@ def dashboard_traffic_sources(request):
     else:
         sessions = VisitorSession.objects.filter(last_seen_at__gte=week_ago)
     
-    # Group by source (if available) or use default
-    direct_count = sessions.filter(source__isnull=True).count() + sessions.filter(source='').count()
-    referral_count = sessions.exclude(source__isnull=True).exclude(source='').count()
+    # Sources are filled in by visitors.enrichment; sessions not enriched yet count as Direct
+    counts = {label: 0 for label in TRAFFIC_SOURCES}
+    for row in sessions.values('source').annotate(count=Count('id')):
+        label = row['source'] or 'Direct'
+        counts[label] = counts.get(label, 0) + row['count']
     
     return JsonResponse({
-        'labels': ['Direct', 'Referral'],
-        'data': [direct_count, referral_count]
+        'labels': list(counts.keys()),
+        'data': list(counts.values())
     })
 
 
@@ -180,7 +254,7 @@ def dashboard_sales(request):
     """Get sales analytics data by period (days, months, years)"""
     from core.models import Attribution
     
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     period = request.GET.get('period', 'days')
     now = timezone.now()
     
@@ -261,7 +335,7 @@ def dashboard_sales(request):
 
 def dashboard_marketing_suggestions(request):
     """Get AI marketing suggestions for the merchant"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     if not merchant:
         return JsonResponse({
@@ -0,0 +1,41 @@
+"""
+Per-process cache of merchant feature flags.
+
+Storefront endpoints check a feature's enabled flag on every call. Flags are
+cached per (merchant, feature key) for FEATURE_FLAG_CACHE_TTL_SECONDS;
+MerchantFeature save/delete signals invalidate the local entries, and other
+worker processes pick up a toggle within the TTL.
+"""
+import threading
+import time
+from typing import Dict, Tuple
+
+from django.conf import settings
+
+from .models import MerchantFeature
+
+
+_flag_cache: Dict[int, Dict[str, Tuple[float, bool]]] = {}  # merchant id -> key -> (expires, enabled)
+_flag_cache_lock = threading.Lock()
+
+
+def is_feature_enabled(merchant_id: int, key: str) -> bool:
+    """Whether the merchant has the feature enabled (False when it has no row)"""
+    now = time.monotonic()
+    entry = _flag_cache.get(merchant_id, {}).get(key)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    enabled = bool(MerchantFeature.objects.filter(
+        merchant_id=merchant_id, feature__key=key,
+    ).values_list('is_enabled', flat=True).first())
+
+    ttl = getattr(settings, 'FEATURE_FLAG_CACHE_TTL_SECONDS', 10)
+    with _flag_cache_lock:
+        _flag_cache.setdefault(merchant_id, {})[key] = (now + ttl, enabled)
+    return enabled
+
+
+def invalidate_feature_flags(merchant_id: int) -> None:
+    with _flag_cache_lock:
+        _flag_cache.pop(merchant_id, None)
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .flags import invalidate_feature_flags
+from .models import MerchantFeature
+
+
+@receiver(post_save, sender=MerchantFeature)
+@receiver(post_delete, sender=MerchantFeature)
+def invalidate_feature_flag_cache(sender, instance, **kwargs):
+    invalidate_feature_flags(instance.merchant_id)
@@ -1,3 +1,32 @@
 from django.test import TestCase
 
-# Create your tests here.
+from core.models import Merchant
+from .flags import invalidate_feature_flags, is_feature_enabled
+from .models import Feature, MerchantFeature
+
+
+class FeatureFlagCacheTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="400")
+        self.feature = Feature.objects.create(key="live_counter", title="Live View Counter")
+        invalidate_feature_flags(self.merchant.id)
+
+    def test_flag_is_cached(self):
+        MerchantFeature.objects.create(merchant=self.merchant, feature=self.feature, is_enabled=True)
+        self.assertTrue(is_feature_enabled(self.merchant.id, "live_counter"))
+        with self.assertNumQueries(0):
+            self.assertTrue(is_feature_enabled(self.merchant.id, "live_counter"))
+
+    def test_missing_row_is_disabled(self):
+        self.assertFalse(is_feature_enabled(self.merchant.id, "live_counter"))
+
+    def test_toggle_invalidates_the_flag(self):
+        merchant_feature = MerchantFeature.objects.create(merchant=self.merchant, feature=self.feature)
+        self.assertFalse(is_feature_enabled(self.merchant.id, "live_counter"))
+
+        merchant_feature.is_enabled = True
+        merchant_feature.save()
+        self.assertTrue(is_feature_enabled(self.merchant.id, "live_counter"))
+
+        merchant_feature.delete()
+        self.assertFalse(is_feature_enabled(self.merchant.id, "live_counter"))
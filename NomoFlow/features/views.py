@@ -12,7 +12,7 @@ from django.utils.timesince import timesince
 from django.db.models import Count, Sum
 from django.core.paginator import Paginator
 
-from core.utils import get_current_merchant
+from core.utils import resolve_store_merchant
 from core.models import Merchant, EmailSubscriber, Attribution
 
 from .models import MerchantFeature, Feature
@@ -118,7 +118,7 @@ def _json_with_cors(payload: dict, *, status: int = 200) -> JsonResponse:
 
 def email_collector_page(request):
     """Dashboard page for email collector"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
     
@@ -180,7 +180,7 @@ def _check_feature_ready(merchant, feature_key: str) -> tuple[bool, str]:
 @require_http_methods(["POST"])
 def toggle_feature(request):
     """Toggle a merchant feature on/off (defaults to email collector)."""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'success': False, 'message': 'No merchant selected'}, status=400)
     
@@ -249,9 +249,8 @@ def subscribe_email(request):
             return JsonResponse({'success': False, 'message': 'Store ID is required'}, status=400)
         
         # Get merchant
-        try:
-            merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        except Merchant.DoesNotExist:
+        merchant = resolve_store_merchant(store_id)
+        if merchant is None:
             return JsonResponse({'success': False, 'message': 'Store not found'}, status=404)
         
         # Check if email already exists
@@ -297,7 +296,7 @@ def subscribe_email(request):
 @require_http_methods(["POST"])
 def unsubscribe_email(request, pk):
     """Unsubscribe an email"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'success': False, 'message': 'No merchant selected'}, status=400)
     
@@ -312,7 +311,7 @@ def unsubscribe_email(request, pk):
 @require_http_methods(["POST"])
 def delete_subscriber(request, pk):
     """Delete a subscriber"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'success': False, 'message': 'No merchant selected'}, status=400)
     
@@ -325,7 +324,7 @@ def delete_subscriber(request, pk):
 @require_http_methods(["GET"])
 def export_subscribers(request):
     """Export subscribers as CSV"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
     
@@ -667,9 +666,8 @@ def is_feature_enabled(request):
     if not store_id:
         return _json_with_cors({'enabled': False, 'message': 'Store ID required'}, status=400)
     
-    try:
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-    except Merchant.DoesNotExist:
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
         return _json_with_cors({'enabled': False, 'message': 'Store not found'}, status=404)
         
     feature = Feature.objects.filter(key=feature_key).first()
@@ -693,7 +691,7 @@ def is_feature_enabled(request):
 
 def purchase_display_page(request):
     """Dashboard page for purchase display social proof"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
 
@@ -783,9 +781,8 @@ def purchase_display_feed(request):
             status=400,
         )
 
-    try:
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-    except Merchant.DoesNotExist:
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
         return _json_with_cors(
             {'enabled': False, 'items': [], 'message': 'Store not found'},
             status=404,
@@ -1,3 +1,30 @@
+import json
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Merchant, SallaToken
+from core.token_refresh import tokens_due
+
+
+class AuthorizeWebhookTests(TestCase):
+    def test_reconnect_resets_refresh_failures(self):
+        merchant = Merchant.objects.create(name="Store", salla_merchant_id="555")
+        SallaToken.objects.create(
+            merchant=merchant, access_token="old", refresh_token="r",
+            expires_at=timezone.now(), refresh_failures=5, last_refresh_error="Token refresh failed: 400",
+        )
+
+        response = self.client.post("/salla/webhook", json.dumps({
+            "event": "app.store.authorize",
+            "store_id": "555",
+            "data": {"access_token": "new", "refresh_token": "r2", "expires": 1, "expires_in": 600},
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
 
-# Create your tests here.
+        token = SallaToken.objects.get(merchant=merchant)
+        self.assertEqual(token.access_token, "new")
+        self.assertEqual(token.refresh_failures, 0)
+        self.assertIsNone(token.last_refresh_error)
+        self.assertIn(token, tokens_due(timedelta(minutes=30), max_failures=5))
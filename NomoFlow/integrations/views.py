@@ -15,6 +15,7 @@ from django.views.decorators.http import require_GET, require_POST
 from core.models import Merchant, SallaToken, Event
 from integrations.models import Integration
 from core.utils import set_current_merchant
+from core.salla_client import salla_client
 
 
 @require_GET
@@ -133,7 +134,7 @@ def salla_callback(request):
         "code": code,
     }
     try:
-        token_resp = requests.post(settings.SALLA_OAUTH_TOKEN_URL, data=data, timeout=20)
+        token_resp = salla_client.request("POST", settings.SALLA_OAUTH_TOKEN_URL, data=data, timeout=20)
         if token_resp.status_code != 200:
             print(f"🔴 Token Exchange FAILED!")
             print(f"   Status: {token_resp.status_code}")
@@ -161,7 +162,7 @@ def salla_callback(request):
 
 # 1) الموصى به: جلب هوية المستخدم والمتجر من UserInfo (أسرع وأضمن للربط)
     try:
-        ui_resp = requests.get(settings.SALLA_USERINFO_URL, headers=headers, timeout=20)
+        ui_resp = salla_client.request("GET", settings.SALLA_USERINFO_URL, headers=headers, timeout=20)
         if ui_resp.status_code != 200:
             return HttpResponseBadRequest(f"Failed to fetch user info: {ui_resp.status_code} - {ui_resp.text}")
     except requests.exceptions.ConnectionError as e:
@@ -190,7 +191,7 @@ def salla_callback(request):
         print(f"⚠️ Store ID not found in UserInfo. Trying Admin API...")
         # Fallback to Admin API
         try:
-            si = requests.get(f"{settings.SALLA_API_BASE}/store/info", headers=headers, timeout=20)
+            si = salla_client.request("GET", f"{settings.SALLA_API_BASE}/store/info", headers=headers, timeout=20)
             if si.status_code == 200:
                 s = si.json().get("data") or si.json()
                 store_id   = str(s.get("id") or "")
@@ -219,6 +220,10 @@ def salla_callback(request):
             "refresh_token": refresh_token or "",
             "expires_at": expires_at,
             "scope": scope or "",
+            # A reconnect starts the proactive refresh over
+            "refresh_failures": 0,
+            "last_refresh_error": None,
+            "refresh_claimed_until": None,
         },
     )
 
@@ -359,6 +364,9 @@ def salla_webhook(request):
                         "refresh_token": refresh_token,
                         "expires_at": expires_at,
                         "scope": scope if isinstance(scope, str) else " ".join(scope) if scope else "",
+                        "refresh_failures": 0,
+                        "last_refresh_error": None,
+                        "refresh_claimed_until": None,
                     },
                 )
                 # Mark merchant as connected
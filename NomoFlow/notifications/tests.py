@@ -1,3 +1,11 @@
 from django.test import TestCase
 
-# Create your tests here.
+
+class AnonymousPagesTests(TestCase):
+    def test_notifications_page_without_merchant(self):
+        response = self.client.get("/notifications/")
+        self.assertEqual(response.status_code, 200)
+
+    def test_dashboard_notifications_page_without_merchant(self):
+        response = self.client.get("/dashboard/notifications/")
+        self.assertEqual(response.status_code, 200)
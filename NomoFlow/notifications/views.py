@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
 from .models import PopupNotification
-from core.utils import get_current_merchant
+from core.utils import resolve_store_merchant
 from .forms import PopupNotificationForm
 from django.views.decorators.http import require_GET
 from django.http import HttpResponse
@@ -10,7 +10,7 @@ from django.http import HttpResponse
 
 def notifications_page(request):
     """Main notifications page with form and list"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     notifications = PopupNotification.objects.filter(merchant=merchant).order_by('-created_at')
     
     if request.method == 'POST':
@@ -112,31 +112,29 @@ def public_feed(request):
     if not store_id:
         return JsonResponse({'notifications': []})
     
-    try:
-        # Get merchant by Salla ID
-        from core.models import Merchant
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        
-        items = list(PopupNotification.objects.filter(
-            merchant=merchant, 
-            is_active=True
-        ).values(
-            'id', 'title', 'message', 'notification_type', 'position', 
-            'background_color', 'text_color', 'button_text', 'button_url', 'target_pages'
-        ))
-        response = JsonResponse({'notifications': items})
-        response['Access-Control-Allow-Origin'] = '*'
-        response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
-        response['Access-Control-Allow-Headers'] = 'Content-Type, ngrok-skip-browser-warning'
-        response['Access-Control-Max-Age'] = '86400'  # Cache for 24 hours
-        return response
-    except Merchant.DoesNotExist:
+    # Get merchant by Salla ID
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
         response = JsonResponse({'notifications': []})
         response['Access-Control-Allow-Origin'] = '*'
         response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
         response['Access-Control-Allow-Headers'] = 'Content-Type, ngrok-skip-browser-warning'
         response['Access-Control-Max-Age'] = '86400'  # Cache for 24 hours
         return response
+    
+    items = list(PopupNotification.objects.filter(
+        merchant=merchant, 
+        is_active=True
+    ).values(
+        'id', 'title', 'message', 'notification_type', 'position', 
+        'background_color', 'text_color', 'button_text', 'button_url', 'target_pages'
+    ))
+    response = JsonResponse({'notifications': items})
+    response['Access-Control-Allow-Origin'] = '*'
+    response['Access-Control-Allow-Methods'] = 'GET, OPTIONS'
+    response['Access-Control-Allow-Headers'] = 'Content-Type, ngrok-skip-browser-warning'
+    response['Access-Control-Max-Age'] = '86400'  # Cache for 24 hours
+    return response
 
 
 def embed_js(request):
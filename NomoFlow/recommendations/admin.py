@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Customer, Order, OrderItem, CustomerInteraction
+from .models import Product, Customer, Order, OrderItem, CustomerInteraction, SyncCheckpoint
 
 
 @admin.register(Product)
@@ -40,3 +40,10 @@ class CustomerInteractionAdmin(admin.ModelAdmin):
     list_filter = ['interaction_type', 'merchant', 'occurred_at']
     search_fields = ['product__name', 'customer__name', 'session_id']
     readonly_fields = ['occurred_at']
+
+
+@admin.register(SyncCheckpoint)
+class SyncCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['merchant', 'resource', 'synced_through', 'run_started_at', 'page', 'completed_at']
+    list_filter = ['resource', 'merchant']
+    readonly_fields = ['updated_at']
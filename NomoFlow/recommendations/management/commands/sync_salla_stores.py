@@ -0,0 +1,99 @@
+"""
+Sync products and orders of all connected merchants from Salla.
+
+    python manage.py sync_salla_stores
+    python manage.py sync_salla_stores --interval 3600               # keep running
+    python manage.py sync_salla_stores --workers 8 --slice 1000 --merchant 12
+
+Each pass continues every merchant's checkpointed sync, so after the first
+full pass only what changed is fetched.
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recommendations.sync_scheduler import RESOURCES, sync_merchants
+
+
+class Command(BaseCommand):
+    help = "Sync all connected merchants from Salla with a bounded, fair worker pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "SALLA_SYNC_WORKERS", 4),
+            help="Merchants synced at the same time",
+        )
+        parser.add_argument(
+            "--slice",
+            type=int,
+            default=getattr(settings, "SALLA_SYNC_SLICE_RECORDS", 500),
+            help="Records a merchant syncs per turn before yielding its worker",
+        )
+        parser.add_argument(
+            "--merchant-concurrency",
+            type=int,
+            default=getattr(settings, "SALLA_SYNC_CONCURRENCY", 4),
+            help="Parallel page fetches per merchant",
+        )
+        parser.add_argument(
+            "--merchant-rps",
+            type=float,
+            default=getattr(settings, "SALLA_SYNC_REQUESTS_PER_SECOND", 5),
+            help="Salla requests per second per merchant (0 = unlimited)",
+        )
+        parser.add_argument(
+            "--merchant",
+            type=int,
+            action="append",
+            dest="merchant_ids",
+            help="Only sync this merchant id (repeatable)",
+        )
+        parser.add_argument(
+            "--resource",
+            choices=RESOURCES,
+            action="append",
+            dest="resources",
+            help="Only sync this resource (repeatable; default: products and orders)",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Run again every N seconds instead of exiting after one pass",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            run = sync_merchants(
+                workers=options["workers"],
+                slice_records=options["slice"],
+                merchant_concurrency=options["merchant_concurrency"],
+                merchant_rps=options["merchant_rps"],
+                merchant_ids=options["merchant_ids"],
+                resources=options["resources"] or RESOURCES,
+            )
+
+            for state in run.merchants:
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"  merchant {state.merchant.id}: {state.records} records in {state.slices} slices, "
+                        f"{state.changed_products} products changed ({state.seconds:.1f}s)"
+                    )
+                for error in state.errors:
+                    self.stderr.write(f"Sync failed for merchant {state.merchant.id}: {error}")
+
+            style = self.style.SUCCESS if not run.failed else self.style.WARNING
+            self.stdout.write(style(
+                f"{len(run.merchants)} merchants: {run.synced} synced, {len(run.failed)} failed; "
+                f"{run.products} products and {run.orders} orders in {run.slices} slices, "
+                f"{run.seconds:.1f}s ({run.records_per_second:.0f} records/s)"
+            ))
+
+            if not options["interval"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_salla_token_refresh_status'),
+        ('recommendations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(choices=[('products', 'Products'), ('orders', 'Orders')], max_length=20)),
+                ('synced_through', models.DateTimeField(blank=True, null=True)),
+                ('run_started_at', models.DateTimeField(blank=True, null=True)),
+                ('run_since', models.DateTimeField(blank=True, null=True)),
+                ('page', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_checkpoints', to='core.merchant')),
+            ],
+            options={
+                'verbose_name': 'Sync Checkpoint',
+                'verbose_name_plural': 'Sync Checkpoints',
+                'constraints': [models.UniqueConstraint(fields=('merchant', 'resource'), name='uq_sync_checkpoint_per_resource')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_salla_token_refresh_status'),
+        ('recommendations', '0003_product_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sync_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='synccheckpoint',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['merchant', 'sync_generation'], name='recommendat_merchan_111ab0_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_sync_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='synccheckpoint',
+            name='full_synced_through',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -23,6 +23,11 @@ class Product(models.Model):
     image_url = models.URLField(null=True, blank=True)
     url = models.URLField(null=True, blank=True)
     
+    # Hash of the synced Salla fields; unchanged products are not rewritten
+    content_hash = models.CharField(max_length=32, blank=True, default="")
+    # Product sync run (SyncCheckpoint.generation) that last saw this product
+    sync_generation = models.PositiveIntegerField(default=0)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -34,6 +39,7 @@ class Product(models.Model):
         ]
         indexes = [
             models.Index(fields=["merchant", "is_active"]),
+            models.Index(fields=["merchant", "sync_generation"]),
             models.Index(fields=["category"]),
         ]
         verbose_name = "Product"
@@ -163,3 +169,43 @@ class CustomerInteraction(models.Model):
     
     def __str__(self):
         return f"{self.customer or 'Anonymous'} {self.interaction_type} {self.product.name}"
+
+
+class SyncCheckpoint(models.Model):
+    """Progress of a merchant's Salla sync of one resource, for incremental and resumable runs"""
+    PRODUCTS = "products"
+    ORDERS = "orders"
+    RESOURCES = [
+        (PRODUCTS, "Products"),
+        (ORDERS, "Orders"),
+    ]
+    
+    merchant = models.ForeignKey("core.Merchant", on_delete=models.CASCADE, related_name="sync_checkpoints")
+    resource = models.CharField(max_length=20, choices=RESOURCES)
+    
+    # Start time of the last completed run; the next run only asks for changes since then.
+    # For orders that means orders placed since then (Salla can't filter on update
+    # time), so changes to older orders wait for the next full run
+    synced_through = models.DateTimeField(null=True, blank=True)
+    # Start time of the last completed full run
+    full_synced_through = models.DateTimeField(null=True, blank=True)
+    
+    # Run in progress: when it started, the cursor it filters on and the last page committed
+    run_started_at = models.DateTimeField(null=True, blank=True)
+    run_since = models.DateTimeField(null=True, blank=True)
+    page = models.PositiveIntegerField(default=0)
+    # Bumped for every new run and stamped on the records it touches
+    generation = models.PositiveIntegerField(default=0)
+    
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["merchant", "resource"], name="uq_sync_checkpoint_per_resource"),
+        ]
+        verbose_name = "Sync Checkpoint"
+        verbose_name_plural = "Sync Checkpoints"
+    
+    def __str__(self):
+        return f"{self.merchant} {self.resource} through {self.synced_through or 'never'}"
@@ -0,0 +1,165 @@
+"""
+Scheduled Salla sync of every connected merchant.
+
+Work is cut into slices: one resumable sync call (see SyncCheckpoint) of at
+most `slice_records` records for one merchant and resource. Slices run on a
+bounded thread pool, and a merchant whose sync isn't finished goes back to
+the end of the queue, so a store with a long history gets one turn per round
+like every other store instead of holding a worker until it is done.
+
+A merchant never has more than one slice in flight; within a slice its pages
+are fetched by at most `merchant_concurrency` threads at `merchant_rps`
+requests per second.
+"""
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.models import Merchant
+from .models import SyncCheckpoint
+from .sync_service import SallaSyncService
+
+# Products first, so order items of the same pass can link to them
+RESOURCES = (SyncCheckpoint.PRODUCTS, SyncCheckpoint.ORDERS)
+
+
+@dataclass
+class MerchantSync:
+    merchant: Merchant
+    resources: List[str]
+    slices: int = 0
+    records: int = 0
+    seconds: float = 0.0
+    changed_products: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SliceResult:
+    resource: str
+    records: int
+    seconds: float
+    complete: bool
+    changed_products: int = 0
+    errors: List[str] = field(default_factory=list)
+
+
+@dataclass
+class SyncRun:
+    merchants: List[MerchantSync] = field(default_factory=list)
+    slices: int = 0
+    products: int = 0
+    orders: int = 0
+    seconds: float = 0.0
+
+    @property
+    def records(self) -> int:
+        return self.products + self.orders
+
+    @property
+    def records_per_second(self) -> float:
+        return self.records / self.seconds if self.seconds else 0.0
+
+    @property
+    def failed(self) -> List[MerchantSync]:
+        return [state for state in self.merchants if state.errors]
+
+    @property
+    def synced(self) -> int:
+        return sum(1 for state in self.merchants if not state.errors and not state.resources)
+
+
+def connected_merchants(merchant_ids: Optional[Iterable[int]] = None):
+    merchants = Merchant.objects.filter(is_connected=True, salla_token__isnull=False)
+    if merchant_ids:
+        merchants = merchants.filter(id__in=merchant_ids)
+    return merchants.order_by('id')
+
+
+def _run_slice(merchant: Merchant, resource: str, slice_records: int,
+               merchant_concurrency: Optional[int], merchant_rps: Optional[float]) -> SliceResult:
+    started = time.monotonic()
+    try:
+        service = SallaSyncService(
+            merchant, concurrency=merchant_concurrency, requests_per_second=merchant_rps,
+        )
+        changed_products = 0
+        if resource == SyncCheckpoint.PRODUCTS:
+            result = service.sync_products(limit=slice_records)
+            records = result['synced_count']
+            changed_products = result['new_count'] + result['changed_count'] + result['deactivated_count']
+        else:
+            records = service.sync_orders(limit=slice_records)
+        return SliceResult(
+            resource, records, time.monotonic() - started, resource in service.completed,
+            changed_products, list(service.errors),
+        )
+    except Exception as e:
+        # No token, or the merchant disconnected
+        return SliceResult(resource, 0, time.monotonic() - started, False, errors=[str(e)])
+    finally:
+        # Pool threads open their own connections
+        close_old_connections()
+
+
+def sync_merchants(
+    workers: Optional[int] = None,
+    slice_records: Optional[int] = None,
+    merchant_concurrency: Optional[int] = None,
+    merchant_rps: Optional[float] = None,
+    merchant_ids: Optional[Iterable[int]] = None,
+    resources: Iterable[str] = RESOURCES,
+) -> SyncRun:
+    """Sync every connected merchant once, round-robin in slices"""
+    workers = workers or getattr(settings, 'SALLA_SYNC_WORKERS', 4)
+    slice_records = slice_records or getattr(settings, 'SALLA_SYNC_SLICE_RECORDS', 500)
+    resources = [resource for resource in RESOURCES if resource in set(resources)]
+
+    started = time.monotonic()
+    run = SyncRun(merchants=[
+        MerchantSync(merchant, list(resources)) for merchant in connected_merchants(merchant_ids)
+    ])
+    queue = deque(state for state in run.merchants if state.resources)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='salla-sync-scheduler') as pool:
+        running = {}
+        while queue or running:
+            while queue and len(running) < workers:
+                state = queue.popleft()
+                future = pool.submit(
+                    _run_slice, state.merchant, state.resources[0], slice_records,
+                    merchant_concurrency, merchant_rps,
+                )
+                running[future] = state
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                state = running.pop(future)
+                result = future.result()
+
+                run.slices += 1
+                if result.resource == SyncCheckpoint.PRODUCTS:
+                    run.products += result.records
+                else:
+                    run.orders += result.records
+                state.slices += 1
+                state.records += result.records
+                state.seconds += result.seconds
+                state.changed_products += result.changed_products
+
+                if result.errors or not (result.complete or result.records):
+                    # The checkpoint keeps its progress; the next pass retries from there
+                    state.errors.extend(result.errors or [f"{result.resource}: no progress"])
+                    continue
+                if result.complete:
+                    state.resources.pop(0)
+                if state.resources:
+                    queue.append(state)
+
+    run.seconds = time.monotonic() - started
+    return run
@@ -2,328 +2,577 @@
 Salla API Sync Service
 Fetches products and orders from Salla API and stores them locally
 """
-import requests
+import hashlib
+import json
+import math
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from django.db import close_old_connections, transaction
 from django.utils import timezone
-from datetime import datetime
-from typing import Optional, List, Dict
+from datetime import datetime, timedelta
+from typing import Callable, Iterator, Optional, List, Dict, Tuple
 from decimal import Decimal
 
 from core.models import Merchant, SallaToken
 from core.auth_utils import call_salla_api_with_refresh
-from .models import Product, Customer, Order, OrderItem
+from core.salla_client import RateLimiter
+from .models import Product, Customer, Order, OrderItem, SyncCheckpoint
+
+# Salla API typically limits to 50 per page
+MAX_PER_PAGE = 50
+
+# Listing filter Salla accepts to skip old records per resource (a YYYY-MM-DD date).
+# Products have none, so product runs walk the whole catalog. Salla has no
+# filter on update time: from_date filters orders on their order date, so
+# incremental runs miss status and total changes of older orders, and a full
+# run is forced every SALLA_SYNC_FULL_RESYNC_DAYS to pick those up.
+CHANGED_SINCE_PARAMS = {
+    'orders': 'from_date',
+}
+
+# Parsed rows written per upsert statement
+WRITE_BATCH_SIZE = 500
+
+# Columns refreshed when a synced product already exists
+PRODUCT_UPDATE_FIELDS = [
+    'name', 'description', 'category', 'tags', 'price', 'sku', 'image_url', 'url',
+    'is_active', 'is_available', 'content_hash', 'sync_generation', 'synced_at', 'updated_at',
+]
+
+
+class SallaSyncError(Exception):
+    pass
+
+
+def _total_pages(pagination: Dict) -> Optional[int]:
+    """Page count from a Salla pagination block, or None when it does not say"""
+    total_pages = pagination.get('totalPages') or pagination.get('total_pages')
+    if total_pages:
+        return int(total_pages)
+    total = pagination.get('total')
+    per_page = pagination.get('perPage') or pagination.get('per_page')
+    if total is not None and per_page:
+        return math.ceil(int(total) / int(per_page))
+    return None
+
+
+def _has_next(pagination: Dict) -> bool:
+    links = pagination.get('links')
+    return bool(pagination.get('has_next') or (isinstance(links, dict) and links.get('next')))
+
+
+def parse_product(product_data: Dict) -> Optional[Dict]:
+    """Product columns from a Salla product payload, or None when it has no id"""
+    if not isinstance(product_data, dict):
+        return None
+        
+    salla_product_id = str(product_data.get('id', ''))
+    if not salla_product_id:
+        return None
+    
+    # Extract product information
+    name = product_data.get('name', '')
+    description = product_data.get('description', '') or product_data.get('description_ar', '')
+    
+    # Get category
+    category_data = product_data.get('category', {})
+    category = category_data.get('name', '') if isinstance(category_data, dict) else ''
+    
+    # Get tags
+    tags = []
+    tags_data = product_data.get('tags', [])
+    if isinstance(tags_data, list):
+        tags = [tag.get('name', '') if isinstance(tag, dict) else str(tag) for tag in tags_data]
+    
+    # Get price
+    price_data = product_data.get('price', {})
+    if isinstance(price_data, dict):
+        price = Decimal(str(price_data.get('amount', 0)))
+    else:
+        price = Decimal(str(price_data)) if price_data else None
+    
+    # Get images
+    images = product_data.get('images', [])
+    image_url = images[0].get('url', '') if images and isinstance(images[0], dict) else ''
+    
+    # Get product URL
+    url = product_data.get('url', '')
+    
+    # Get SKU
+    sku = product_data.get('sku', '')
+    
+    # Get status
+    status = product_data.get('status', '')
+    is_active = status == 'available' or status == 'sale'
+    is_available = (product_data.get('quantity') or 0) > 0
+    
+    return {
+        'salla_product_id': salla_product_id,
+        'name': name,
+        'description': description,
+        'category': category,
+        'tags': tags,
+        'price': price,
+        'sku': sku,
+        'image_url': image_url,
+        'url': url,
+        'is_active': is_active,
+        'is_available': is_available,
+    }
+
+
+def product_hash(row: Dict) -> str:
+    """Stable hash of parsed product columns"""
+    normalized = json.dumps(row, sort_keys=True, default=str, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _parse_ordered_at(created_at_str) -> datetime:
+    if created_at_str:
+        try:
+            # Try parsing ISO format datetime string
+            ordered_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
+            if timezone.is_naive(ordered_at):
+                ordered_at = timezone.make_aware(ordered_at)
+            return ordered_at
+        except (AttributeError, ValueError):
+            pass
+    return timezone.now()
+
+
+def parse_order(order_data: Dict) -> Optional[Dict]:
+    """Order, customer and item values from a Salla order payload, or None when it has no id"""
+    if not isinstance(order_data, dict):
+        return None
+        
+    salla_order_id = str(order_data.get('id', ''))
+    if not salla_order_id:
+        return None
+    
+    # Get customer information
+    customer = None
+    customer_data = order_data.get('customer', {})
+    if customer_data:
+        salla_customer_id = str(customer_data.get('id', ''))
+        if salla_customer_id:
+            customer = {
+                'salla_customer_id': salla_customer_id,
+                'name': customer_data.get('name', ''),
+                'email': customer_data.get('email', ''),
+                'phone': customer_data.get('mobile', ''),
+            }
+    
+    # Get order items
+    items = []
+    for item_data in order_data.get('products', []):
+        salla_product_id = str(item_data.get('product', {}).get('id', '')) if isinstance(item_data.get('product'), dict) else str(item_data.get('product_id', ''))
+        
+        price_data = item_data.get('price', {})
+        if isinstance(price_data, dict):
+            price = Decimal(str(price_data.get('amount', 0)))
+        else:
+            price = Decimal(str(price_data)) if price_data else Decimal('0')
+        
+        items.append({
+            'salla_product_id': salla_product_id,
+            'quantity': int(item_data.get('quantity', 1)),
+            'price': price,
+            'product_name': item_data.get('name', ''),
+        })
+    
+    return {
+        'salla_order_id': salla_order_id,
+        'customer': customer,
+        'total_amount': Decimal(str(order_data.get('amounts', {}).get('total', {}).get('amount', 0))),
+        'status': order_data.get('status', ''),
+        'ordered_at': _parse_ordered_at(order_data.get('created_at', '')),
+        'items': items,
+    }
 
 
 class SallaSyncService:
     """Service to sync data from Salla API with automatic token refresh"""
     
-    def __init__(self, merchant: Merchant):
+    def __init__(self, merchant: Merchant, concurrency: Optional[int] = None,
+                 requests_per_second: Optional[float] = None):
         self.merchant = merchant
         self.token = SallaToken.objects.filter(merchant=merchant).first()
         if not self.token or not self.token.access_token:
             raise ValueError(f"No valid token for merchant {merchant.name}")
         
         self.base_url = settings.SALLA_API_BASE.rstrip('/')
+        # Pages fetched in parallel after the first one; 1 fetches one page at a time
+        self.concurrency = max(1, concurrency or getattr(settings, 'SALLA_SYNC_CONCURRENCY', 4))
+        self.rate_limiter = RateLimiter(
+            requests_per_second if requests_per_second is not None
+            else getattr(settings, 'SALLA_SYNC_REQUESTS_PER_SECOND', 5)
+        )
+        # Outcome of the runs of this service: errors hit and resources whose run completed
+        self.errors: List[str] = []
+        self.completed = set()
     
-    def sync_products(self, limit: int = 100) -> dict:
-        """Sync products from Salla API with automatic token refresh
+    def _fetch_page(self, resource: str, page: int, per_page: int, params: Optional[Dict] = None) -> Tuple[List, Dict]:
+        """One page of a listing as (items, pagination)"""
+        self.rate_limiter.wait()
+        response, error_msg = call_salla_api_with_refresh(
+            self.merchant, "GET", f"{self.base_url}/{resource}",
+            params={**(params or {}), "page": page, "per_page": per_page},
+        )
         
-        Returns:
-            dict with 'synced_count' and 'deactivated_count'
+        if error_msg:
+            print(f"Error fetching {resource}: {error_msg}")
+            # If token refresh failed, merchant needs to reconnect
+            raise ValueError(f"API call failed: {error_msg}")
+        
+        if response.status_code != 200:
+            print(f"Error fetching {resource}: {response.status_code} - {response.text}")
+            raise SallaSyncError(f"Could not read {resource} page {page}: {response.status_code}")
+        
+        data = response.json()
+        if not isinstance(data, dict):
+            raise SallaSyncError(f"Expected dict response for {resource}, got {type(data)}")
+        
+        items = data.get('data', [])
+        if not isinstance(items, list):
+            raise SallaSyncError(f"Expected list of {resource}, got {type(items)}")
+        
+        pagination = data.get('pagination')
+        return items, pagination if isinstance(pagination, dict) else {}
+    
+    def _fetch_page_in_worker(self, *args):
+        try:
+            return self._fetch_page(*args)
+        finally:
+            # Token lookups may open a connection in this pool thread
+            close_old_connections()
+    
+    def _iter_pages(self, resource: str, limit: int, start_page: int = 1,
+                    params: Optional[Dict] = None) -> Iterator[Tuple[int, List]]:
         """
-        synced_count = 0
-        page = 1
-        per_page = min(limit, 50)  # Salla API typically limits to 50 per page
-        synced_product_ids = set()  # Track which products we've synced
+        Yield (page, items) for the pages of a listing in order, from
+        `start_page` and enough to cover `limit` records. Stops at the first
+        empty page; raises when a page can't be read.
+        
+        The first page tells how many pages there are; the rest are fetched by
+        a bounded thread pool, a few pages ahead of the caller, which persists
+        each page as it is yielded.
+        """
+        items, pagination = self._fetch_page(resource, start_page, MAX_PER_PAGE, params)
+        if not items:
+            return
+        yield start_page, items
+        
+        last_page = min(_total_pages(pagination) or 0, start_page - 1 + math.ceil(limit / MAX_PER_PAGE))
+        if self.concurrency == 1 or last_page <= start_page:
+            # Sequential: page count unknown, or concurrency disabled
+            page = start_page
+            while _has_next(pagination) or page < last_page:
+                page += 1
+                items, pagination = self._fetch_page(resource, page, MAX_PER_PAGE, params)
+                if not items:
+                    return
+                yield page, items
+            return
         
-        while synced_count < limit:
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='salla-sync') as pool:
+            pending = deque()
+            next_page = start_page + 1
             try:
-                url = f"{self.base_url}/products"
-                params = {
-                    "page": page,
-                    "per_page": per_page
-                }
-                
-                response, error_msg = call_salla_api_with_refresh(
-                    self.merchant, "GET", url, params=params
-                )
-                
-                if error_msg:
-                    print(f"Error fetching products: {error_msg}")
-                    # If token refresh failed, merchant needs to reconnect
-                    raise ValueError(f"API call failed: {error_msg}")
-                
-                if response.status_code != 200:
-                    print(f"Error fetching products: {response.status_code} - {response.text}")
-                    break
-                
-                data = response.json()
-                if not isinstance(data, dict):
-                    print(f"Error: Expected dict response, got {type(data)}")
-                    break
-                    
-                products_data = data.get('data', [])
-                if not isinstance(products_data, list):
-                    print(f"Error: Expected list of products, got {type(products_data)}")
-                    break
-                
-                if not products_data:
-                    break
+                while pending or next_page <= last_page:
+                    # Bounded read-ahead keeps memory flat on huge catalogs
+                    while next_page <= last_page and len(pending) < self.concurrency * 2:
+                        pending.append((next_page, pool.submit(
+                            self._fetch_page_in_worker, resource, next_page, MAX_PER_PAGE, params,
+                        )))
+                        next_page += 1
+                    page, future = pending.popleft()
+                    items, _ = future.result()
+                    if not items:
+                        return
+                    yield page, items
+            finally:
+                for _, future in pending:
+                    future.cancel()
+    
+    def _start_run(self, resource: str, full: bool, max_idle: Optional[timedelta] = None) -> SyncCheckpoint:
+        """
+        The checkpoint of the run to continue, or of a new one when none is in
+        progress. A run that wrote no page for `max_idle` starts over from page 1,
+        and a new run is full when the last full one is SALLA_SYNC_FULL_RESYNC_DAYS old.
+        """
+        checkpoint, _ = SyncCheckpoint.objects.get_or_create(merchant=self.merchant, resource=resource)
+        if max_idle and checkpoint.run_started_at and checkpoint.updated_at < timezone.now() - max_idle:
+            print(f"Restarting {resource} sync for merchant {self.merchant.id}: idle since {checkpoint.updated_at}")
+            full = True
+        if not checkpoint.run_started_at and resource in CHANGED_SINCE_PARAMS:
+            resync_days = getattr(settings, 'SALLA_SYNC_FULL_RESYNC_DAYS', 7)
+            last_full = checkpoint.full_synced_through
+            if not last_full or last_full < timezone.now() - timedelta(days=resync_days):
+                full = True
+        if full or not checkpoint.run_started_at:
+            checkpoint.run_started_at = timezone.now()
+            checkpoint.run_since = None if full else checkpoint.synced_through
+            checkpoint.page = 0
+            checkpoint.generation += 1
+            checkpoint.save()
+        elif checkpoint.page:
+            print(f"Resuming {resource} sync for merchant {self.merchant.id} after page {checkpoint.page}")
+        return checkpoint
+    
+    def _sync_resource(self, checkpoint: SyncCheckpoint, limit: int,
+                       parse: Callable[[Dict], Optional[Dict]],
+                       save: Callable[[List[Dict]], None]) -> Tuple[int, bool]:
+        """
+        Walk a listing from its checkpoint, writing parsed records in batches.
+        
+        The checkpoint moves to the last fully written page after every batch,
+        so a crashed or `limit`-capped run resumes there on the next call. The
+        change cursor only advances once a run reaches the end of the listing.
+        
+        Returns (records seen, whether the run completed).
+        """
+        resource = checkpoint.resource
+        param = CHANGED_SINCE_PARAMS.get(resource)
+        params = {param: checkpoint.run_since.date().isoformat()} if param and checkpoint.run_since else None
+        
+        synced_count = 0
+        rows = []
+        written_page = checkpoint.page
+        done_page = checkpoint.page
+        complete = False
+        
+        def flush():
+            nonlocal rows, written_page
+            batch, rows = rows, []
+            if batch:
+                save(batch)
+            written_page = done_page
+            checkpoint.page = written_page
+            checkpoint.save(update_fields=['page', 'updated_at'])
+        
+        try:
+            for page, items in self._iter_pages(resource, limit, checkpoint.page + 1, params):
+                taken = items[:limit - synced_count]
+                for item in taken:
+                    row = parse(item)
+                    if row:
+                        rows.append(row)
+                synced_count += len(taken)
+                if len(taken) == len(items):
+                    done_page = page
                 
-                for product_data in products_data:
-                    product = self._sync_product(product_data)
-                    if product:
-                        synced_product_ids.add(product.id)
-                    synced_count += 1
-                    
-                    if synced_count >= limit:
-                        break
+                if len(rows) >= WRITE_BATCH_SIZE:
+                    flush()
                 
-                # Check if there are more pages
-                pagination = data.get('pagination', {})
-                if not pagination.get('has_next', False):
+                if synced_count >= limit:
                     break
-                
-                page += 1
-                
-            except Exception as e:
-                print(f"Error syncing products: {e}")
-                break
+            else:
+                complete = True
+        except Exception as e:
+            print(f"Error syncing {resource}: {e}")
+            self.errors.append(f"{resource}: {e}")
+        
+        try:
+            if rows or done_page != written_page:
+                flush()
+        except Exception as e:
+            print(f"Error saving {resource}: {e}")
+            self.errors.append(f"{resource}: {e}")
+            complete = False
+        
+        if complete:
+            # The cursor only covers records the listing filter returns (see
+            # CHANGED_SINCE_PARAMS); full_synced_through covers everything
+            if checkpoint.run_since is None:
+                checkpoint.full_synced_through = checkpoint.run_started_at
+            checkpoint.synced_through = checkpoint.run_started_at
+            checkpoint.run_started_at = None
+            checkpoint.run_since = None
+            checkpoint.page = 0
+            checkpoint.completed_at = timezone.now()
+            checkpoint.save()
+            self.completed.add(resource)
+        
+        return synced_count, complete
+    
+    def sync_products(self, limit: int = 100, full: bool = False) -> dict:
+        """Sync products from Salla API with automatic token refresh
+        
+        Continues the checkpointed run, or starts a new one; full=True restarts from page 1,
+        as does a run idle for SALLA_SYNC_PRODUCT_RUN_IDLE_SECONDS.
+        
+        Returns:
+            dict with 'synced_count', 'deactivated_count', 'complete', the
+            'new_count', 'changed_count' and 'unchanged_count' of the synced
+            products, and 'catalog_changed' when any product was written or
+            deactivated
+        """
+        # Pages are resumed by number, so products added or removed while a run
+        # is paused shift others onto pages it already read. Those would miss
+        # the run's generation and be deactivated; a run left paused for long
+        # starts over instead. Idle time rather than age, so a big catalog
+        # synced slice by slice between other stores still finishes.
+        max_idle = timedelta(seconds=getattr(settings, 'SALLA_SYNC_PRODUCT_RUN_IDLE_SECONDS', 1800))
+        checkpoint = self._start_run(SyncCheckpoint.PRODUCTS, full, max_idle)
+        generation = checkpoint.generation
+        counts = {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+        
+        def save(rows):
+            for key, value in self._save_products(rows, generation).items():
+                counts[key] += value
+        
+        synced_count, complete = self._sync_resource(checkpoint, limit, parse_product, save)
         
         # Mark products that weren't in this sync as inactive
-        # This ensures old products are removed from recommendations
+        # This ensures old products are removed from recommendations. Every
+        # product the completed run saw, in this call or the ones it resumed
+        # from, carries its generation.
         deactivated_count = 0
-        if synced_product_ids:
+        seen = Product.objects.filter(merchant=self.merchant, sync_generation=generation)
+        if complete and seen.exists():
+            # Clearing the hash makes the product count as changed if it comes back
             deactivated_count = Product.objects.filter(
                 merchant=self.merchant,
-                is_active=True
-            ).exclude(id__in=synced_product_ids).update(is_active=False)
+                is_active=True,
+                sync_generation__lt=generation,
+            ).update(is_active=False, content_hash='')
             
             if deactivated_count > 0:
                 print(f"Marked {deactivated_count} old products as inactive")
         
         return {
             'synced_count': synced_count,
-            'deactivated_count': deactivated_count
+            'deactivated_count': deactivated_count,
+            'complete': complete,
+            **counts,
+            'catalog_changed': bool(counts['new_count'] or counts['changed_count'] or deactivated_count),
         }
     
-    def _sync_product(self, product_data: Dict):
-        """Sync a single product"""
-        if not isinstance(product_data, dict):
-            return
-            
-        salla_product_id = str(product_data.get('id', ''))
-        if not salla_product_id:
-            return
-        
-        # Extract product information
-        name = product_data.get('name', '')
-        description = product_data.get('description', '') or product_data.get('description_ar', '')
+    def _save_products(self, rows: List[Dict], generation: int) -> Dict[str, int]:
+        """
+        Upsert the new and changed products of a batch with one INSERT ... ON CONFLICT
+        and stamp the unchanged ones with the run's generation.
         
-        # Get category
-        category_data = product_data.get('category', {})
-        category = category_data.get('name', '') if isinstance(category_data, dict) else ''
+        Returns the batch's new/changed/unchanged counts.
+        """
+        synced_at = timezone.now()
+        # A row can't be updated twice by one upsert; the last copy of a product wins
+        by_salla_id = {row['salla_product_id']: row for row in rows}
+        stored_hashes = dict(Product.objects.filter(
+            merchant=self.merchant, salla_product_id__in=by_salla_id,
+        ).values_list('salla_product_id', 'content_hash'))
         
-        # Get tags
-        tags = []
-        tags_data = product_data.get('tags', [])
-        if isinstance(tags_data, list):
-            tags = [tag.get('name', '') if isinstance(tag, dict) else str(tag) for tag in tags_data]
+        counts = {'new_count': 0, 'changed_count': 0, 'unchanged_count': 0}
+        to_write = []
+        unchanged = []
+        for salla_product_id, row in by_salla_id.items():
+            content_hash = product_hash(row)
+            stored_hash = stored_hashes.get(salla_product_id)
+            if stored_hash == content_hash:
+                unchanged.append(salla_product_id)
+                continue
+            counts['new_count' if stored_hash is None else 'changed_count'] += 1
+            to_write.append(Product(
+                merchant=self.merchant, synced_at=synced_at, content_hash=content_hash,
+                sync_generation=generation, **row,
+            ))
         
-        # Get price
-        price_data = product_data.get('price', {})
-        if isinstance(price_data, dict):
-            price = Decimal(str(price_data.get('amount', 0)))
-        else:
-            price = Decimal(str(price_data)) if price_data else None
-        
-        # Get images
-        images = product_data.get('images', [])
-        image_url = images[0].get('url', '') if images and isinstance(images[0], dict) else ''
-        
-        # Get product URL
-        url = product_data.get('url', '')
-        
-        # Get SKU
-        sku = product_data.get('sku', '')
-        
-        # Get status
-        status = product_data.get('status', '')
-        is_active = status == 'available' or status == 'sale'
-        is_available = (product_data.get('quantity') or 0) > 0
-        
-        # Create or update product
-        product, created = Product.objects.update_or_create(
-            merchant=self.merchant,
-            salla_product_id=salla_product_id,
-            defaults={
-                'name': name,
-                'description': description,
-                'category': category,
-                'tags': tags,
-                'price': price,
-                'sku': sku,
-                'image_url': image_url,
-                'url': url,
-                'is_active': is_active,
-                'is_available': is_available,
-                'synced_at': timezone.now(),
-            }
-        )
+        counts['unchanged_count'] = len(unchanged)
+        if unchanged:
+            # QuerySet.update leaves updated_at alone
+            Product.objects.filter(
+                merchant=self.merchant, salla_product_id__in=unchanged,
+            ).update(sync_generation=generation)
         
-        return product
+        if to_write:
+            Product.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=['merchant', 'salla_product_id'],
+                update_fields=PRODUCT_UPDATE_FIELDS,
+            )
+        return counts
     
-    def sync_orders(self, limit: int = 100) -> int:
-        """Sync orders from Salla API with automatic token refresh"""
-        synced_count = 0
-        page = 1
-        per_page = min(limit, 50)
-        
-        while synced_count < limit:
-            try:
-                url = f"{self.base_url}/orders"
-                params = {
-                    "page": page,
-                    "per_page": per_page
-                }
-                
-                response, error_msg = call_salla_api_with_refresh(
-                    self.merchant, "GET", url, params=params
-                )
-                
-                if error_msg:
-                    print(f"Error fetching orders: {error_msg}")
-                    # If token refresh failed, merchant needs to reconnect
-                    raise ValueError(f"API call failed: {error_msg}")
-                
-                if response.status_code != 200:
-                    print(f"Error fetching orders: {response.status_code} - {response.text}")
-                    break
-                
-                data = response.json()
-                if not isinstance(data, dict):
-                    print(f"Error: Expected dict response for orders, got {type(data)}")
-                    break
-                    
-                orders_data = data.get('data', [])
-                if not isinstance(orders_data, list):
-                    print(f"Error: Expected list of orders, got {type(orders_data)}")
-                    break
-                
-                
-                if not orders_data:
-                    break
-                
-                for order_data in orders_data:
-                    self._sync_order(order_data)
-                    synced_count += 1
-                    
-                    if synced_count >= limit:
-                        break
-                
-                # Check if there are more pages
-                pagination = data.get('pagination', {})
-                if not pagination.get('has_next', False):
-                    break
-                
-                page += 1
-                
-            except Exception as e:
-                print(f"Error syncing orders: {e}")
-                break
-        
+    def sync_orders(self, limit: int = 100, full: bool = False) -> int:
+        """Sync orders changed since the last completed run, with automatic token refresh"""
+        checkpoint = self._start_run(SyncCheckpoint.ORDERS, full)
+        synced_count, _ = self._sync_resource(checkpoint, limit, parse_order, self._save_orders)
         return synced_count
     
-    def _sync_order(self, order_data: Dict):
-        """Sync a single order"""
-        if not isinstance(order_data, dict):
-            return
-            
-        salla_order_id = str(order_data.get('id', ''))
-        if not salla_order_id:
-            return
+    def _save_orders(self, rows: List[Dict]) -> None:
+        """
+        Write a batch of parsed orders with a fixed number of statements:
+        upsert customers and orders, resolve ids with one lookup each, and
+        replace the orders' items in bulk.
+        """
+        now = timezone.now()
+        # One upsert can't touch a row twice; the last copy of an order wins
+        orders = {row['salla_order_id']: row for row in rows}
+        customers = {
+            row['customer']['salla_customer_id']: row['customer']
+            for row in orders.values() if row['customer']
+        }
+        salla_product_ids = {
+            item['salla_product_id']
+            for row in orders.values() for item in row['items'] if item['salla_product_id']
+        }
         
-        # Get customer information
-        customer_data = order_data.get('customer', {})
-        customer = None
-        if customer_data:
-            salla_customer_id = str(customer_data.get('id', ''))
-            if salla_customer_id:
-                customer, _ = Customer.objects.get_or_create(
-                    merchant=self.merchant,
-                    salla_customer_id=salla_customer_id,
-                    defaults={
-                        'name': customer_data.get('name', ''),
-                        'email': customer_data.get('email', ''),
-                        'phone': customer_data.get('mobile', ''),
-                        'first_seen_at': timezone.now(),
-                    }
+        with transaction.atomic():
+            customer_ids = {}
+            if customers:
+                # Existing customers keep their details; only last_seen_at moves
+                Customer.objects.bulk_create(
+                    [
+                        Customer(merchant=self.merchant, first_seen_at=now, last_seen_at=now, **customer)
+                        for customer in customers.values()
+                    ],
+                    update_conflicts=True,
+                    unique_fields=['merchant', 'salla_customer_id'],
+                    update_fields=['last_seen_at', 'updated_at'],
                 )
-                customer.last_seen_at = timezone.now()
-                customer.save()
-        
-        # Get order details
-        total_amount = Decimal(str(order_data.get('amounts', {}).get('total', {}).get('amount', 0)))
-        status = order_data.get('status', '')
-        
-        # Get order date
-        created_at_str = order_data.get('created_at', '')
-        ordered_at = None
-        if created_at_str:
-            try:
-                # Try parsing ISO format datetime string
-                from datetime import datetime
-                ordered_at = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                if timezone.is_naive(ordered_at):
-                    ordered_at = timezone.make_aware(ordered_at)
-            except:
-                ordered_at = timezone.now()
-        else:
-            ordered_at = timezone.now()
-        
-        # Create or update order
-        order, _ = Order.objects.update_or_create(
-            merchant=self.merchant,
-            salla_order_id=salla_order_id,
-            defaults={
-                'customer': customer,
-                'total_amount': total_amount,
-                'status': status,
-                'ordered_at': ordered_at,
-            }
-        )
-        
-        # Sync order items
-        items_data = order_data.get('products', [])
-        for item_data in items_data:
-            salla_product_id = str(item_data.get('product', {}).get('id', '')) if isinstance(item_data.get('product'), dict) else str(item_data.get('product_id', ''))
+                customer_ids = dict(Customer.objects.filter(
+                    merchant=self.merchant, salla_customer_id__in=customers,
+                ).values_list('salla_customer_id', 'id'))
             
-            product = None
-            if salla_product_id:
-                product = Product.objects.filter(
-                    merchant=self.merchant,
-                    salla_product_id=salla_product_id
-                ).first()
+            Order.objects.bulk_create(
+                [
+                    Order(
+                        merchant=self.merchant,
+                        salla_order_id=salla_order_id,
+                        customer_id=customer_ids.get((row['customer'] or {}).get('salla_customer_id')),
+                        total_amount=row['total_amount'],
+                        status=row['status'],
+                        ordered_at=row['ordered_at'],
+                    )
+                    for salla_order_id, row in orders.items()
+                ],
+                update_conflicts=True,
+                unique_fields=['merchant', 'salla_order_id'],
+                update_fields=['customer', 'total_amount', 'status', 'ordered_at', 'updated_at'],
+            )
+            order_ids = dict(Order.objects.filter(
+                merchant=self.merchant, salla_order_id__in=orders,
+            ).values_list('salla_order_id', 'id'))
             
-            quantity = int(item_data.get('quantity', 1))
-            price_data = item_data.get('price', {})
-            if isinstance(price_data, dict):
-                price = Decimal(str(price_data.get('amount', 0)))
-            else:
-                price = Decimal(str(price_data)) if price_data else Decimal('0')
+            product_ids = {}
+            if salla_product_ids:
+                product_ids = dict(Product.objects.filter(
+                    merchant=self.merchant, salla_product_id__in=salla_product_ids,
+                ).values_list('salla_product_id', 'id'))
             
-            product_name = item_data.get('name', '')
+            items = []
+            for salla_order_id, row in orders.items():
+                # One item per product and order, as before; the last line wins
+                by_product = {item['salla_product_id']: item for item in row['items']}
+                items.extend(
+                    OrderItem(
+                        order_id=order_ids[salla_order_id],
+                        product_id=product_ids.get(salla_product_id),
+                        **item,
+                    )
+                    for salla_product_id, item in by_product.items()
+                )
             
-            OrderItem.objects.update_or_create(
-                order=order,
-                salla_product_id=salla_product_id,
-                defaults={
-                    'product': product,
-                    'quantity': quantity,
-                    'price': price,
-                    'product_name': product_name,
-                }
-            )
-        
-        return order
-
+            OrderItem.objects.filter(order_id__in=order_ids.values()).delete()
+            OrderItem.objects.bulk_create(items)
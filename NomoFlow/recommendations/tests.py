@@ -1,3 +1,186 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+
+from core.models import Merchant, SallaToken
+from .models import Customer, Order, OrderItem, Product, SyncCheckpoint
+from .sync_service import MAX_PER_PAGE, SallaSyncService
+
+
+class FakeCatalog:
+    """Salla product listing served from a list, paged like the API"""
+
+    def __init__(self, count, orders=0):
+        self.products = [self.product(i) for i in range(count)]
+        self.orders = [self.order(i) for i in range(orders)]
+        self.pages = []
+        self.params = []
+
+    @staticmethod
+    def product(i, name=None):
+        return {
+            "id": 1000 + i, "name": name or f"Product {i}", "status": "sale", "quantity": 1,
+            "price": {"amount": 10 + i}, "category": {"name": "c"},
+        }
+
+    @staticmethod
+    def order(i, status="completed"):
+        return {
+            "id": 5000 + i, "status": status, "created_at": "2026-01-05T10:00:00Z",
+            "amounts": {"total": {"amount": 100 + i}},
+            "customer": {"id": 700 + i % 3, "name": f"Customer {i % 3}", "email": f"c{i % 3}@example.com"},
+            "products": [
+                {"product": {"id": 1000 + i}, "quantity": 1, "price": {"amount": 10}, "name": f"Product {i}"},
+                {"product": {"id": 9999}, "quantity": 2, "price": {"amount": 5}, "name": "Deleted product"},
+            ],
+        }
+
+    def fetch(self, resource, page, per_page, params=None):
+        self.pages.append(page)
+        self.params.append(params)
+        records = self.products if resource == "products" else self.orders
+        items = records[(page - 1) * per_page:page * per_page]
+        total_pages = max(1, -(-len(records) // per_page))
+        return items, {"total": len(records), "perPage": per_page, "totalPages": total_pages}
+
+
+class ProductSyncTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="1")
+        SallaToken.objects.create(
+            merchant=self.merchant, access_token="a", refresh_token="r",
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        self.catalog = FakeCatalog(230)
+
+    def sync(self, **kwargs):
+        service = SallaSyncService(self.merchant, concurrency=1, requests_per_second=0)
+        service._fetch_page = self.catalog.fetch
+        return service.sync_products(**kwargs)
+
+    def active_ids(self):
+        return set(Product.objects.filter(merchant=self.merchant, is_active=True)
+                   .values_list("salla_product_id", flat=True))
+
+    def test_limited_run_resumes_after_its_checkpoint(self):
+        result = self.sync(limit=100)
+        self.assertEqual(result["synced_count"], 100)
+        self.assertFalse(result["complete"])
+        self.assertEqual(SyncCheckpoint.objects.get(merchant=self.merchant).page, 2)
+
+        self.catalog.pages.clear()
+        result = self.sync(limit=1000)
+        self.assertTrue(result["complete"])
+        self.assertEqual(result["synced_count"], 130)
+        self.assertEqual(self.catalog.pages[0], 3)
+        self.assertEqual(Product.objects.filter(merchant=self.merchant).count(), 230)
+
+    def test_unchanged_products_are_skipped_by_content_hash(self):
+        self.assertEqual(self.sync(limit=1000)["new_count"], 230)
+
+        self.catalog.products[5] = FakeCatalog.product(5, name="Renamed")
+        result = self.sync(limit=1000)
+        self.assertEqual((result["new_count"], result["changed_count"], result["unchanged_count"]), (0, 1, 229))
+        self.assertTrue(result["catalog_changed"])
+        self.assertEqual(Product.objects.get(salla_product_id="1005").name, "Renamed")
+
+    def test_completed_run_deactivates_products_it_did_not_see(self):
+        self.sync(limit=1000)
+        removed = self.catalog.products.pop(10)
+
+        result = self.sync(limit=1000)
+        self.assertEqual(result["deactivated_count"], 1)
+        self.assertNotIn(str(removed["id"]), self.active_ids())
+        self.assertEqual(len(self.active_ids()), 229)
+
+    def test_incomplete_run_deactivates_nothing(self):
+        self.sync(limit=1000)
+        self.catalog.products.pop(10)
+        self.assertEqual(self.sync(limit=MAX_PER_PAGE)["deactivated_count"], 0)
+        self.assertEqual(len(self.active_ids()), 230)
+
+    def test_long_running_run_keeps_resuming(self):
+        self.sync(limit=MAX_PER_PAGE)
+        # Started long ago, but still writing pages slice after slice
+        SyncCheckpoint.objects.filter(merchant=self.merchant).update(
+            run_started_at=timezone.now() - timedelta(hours=5),
+        )
+
+        self.catalog.pages.clear()
+        result = self.sync(limit=1000)
+        self.assertEqual(self.catalog.pages[0], 2)
+        self.assertTrue(result["complete"])
+
+    def test_idle_run_restarts_instead_of_deactivating_shifted_products(self):
+        self.sync(limit=1000)
+        self.sync(limit=MAX_PER_PAGE)
+        # Paused for longer than the idle limit, while a product on the page
+        # already read was deleted and the first product of page 2 moved onto page 1
+        SyncCheckpoint.objects.filter(merchant=self.merchant).update(
+            updated_at=timezone.now() - timedelta(hours=2),
+        )
+        removed = self.catalog.products.pop(0)
+
+        self.catalog.pages.clear()
+        result = self.sync(limit=1000)
+        self.assertEqual(self.catalog.pages[0], 1)
+        self.assertEqual(result["deactivated_count"], 1)
+        self.assertEqual(self.active_ids(), {str(p["id"]) for p in self.catalog.products})
+        self.assertNotIn(str(removed["id"]), self.active_ids())
+
+
+class OrderSyncTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="2")
+        SallaToken.objects.create(
+            merchant=self.merchant, access_token="a", refresh_token="r",
+            expires_at=timezone.now() + timedelta(days=1),
+        )
+        self.catalog = FakeCatalog(10, orders=60)
+
+    def service(self):
+        service = SallaSyncService(self.merchant, concurrency=1, requests_per_second=0)
+        service._fetch_page = self.catalog.fetch
+        return service
+
+    def test_incremental_runs_filter_on_order_date(self):
+        self.service().sync_orders(limit=1000)
+        self.assertEqual(self.catalog.params[0], None)
+        checkpoint = SyncCheckpoint.objects.get(merchant=self.merchant, resource=SyncCheckpoint.ORDERS)
+        self.assertEqual(checkpoint.full_synced_through, checkpoint.synced_through)
+
+        self.catalog.params.clear()
+        self.service().sync_orders(limit=1000)
+        self.assertEqual(self.catalog.params[0], {"from_date": checkpoint.synced_through.date().isoformat()})
+
+    def test_full_run_is_forced_to_catch_changes_of_older_orders(self):
+        self.service().sync_orders(limit=1000)
+        SyncCheckpoint.objects.filter(merchant=self.merchant).update(
+            full_synced_through=timezone.now() - timedelta(days=8),
+        )
+        self.catalog.orders[3] = FakeCatalog.order(3, status="canceled")
+
+        self.catalog.params.clear()
+        self.service().sync_orders(limit=1000)
+        self.assertEqual(self.catalog.params[0], None)
+        self.assertEqual(Order.objects.get(salla_order_id="5003").status, "canceled")
+        checkpoint = SyncCheckpoint.objects.get(merchant=self.merchant, resource=SyncCheckpoint.ORDERS)
+        self.assertGreater(checkpoint.full_synced_through, timezone.now() - timedelta(minutes=1))
+
+    def test_resync_keeps_items_and_customers_stable(self):
+        self.service().sync_products(limit=1000)
+        self.service().sync_orders(limit=1000)
+        self.service().sync_orders(limit=1000, full=True)
+
+        self.assertEqual(Order.objects.filter(merchant=self.merchant).count(), 60)
+        self.assertEqual(Customer.objects.filter(merchant=self.merchant).count(), 3)
+        self.assertEqual(OrderItem.objects.filter(order__merchant=self.merchant).count(), 120)
 
-# Create your tests here.
+        order = Order.objects.get(salla_order_id="5004")
+        self.assertEqual(order.customer.salla_customer_id, "701")
+        items = {item.salla_product_id: item for item in order.items.all()}
+        self.assertEqual(items["1004"].product, Product.objects.get(merchant=self.merchant, salla_product_id="1004"))
+        # Products not synced (yet) leave the item unlinked
+        self.assertIsNone(items["9999"].product)
+        self.assertEqual(items["9999"].quantity, 2)
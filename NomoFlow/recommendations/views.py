@@ -6,8 +6,7 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
-from core.utils import get_current_merchant
-from core.models import Merchant
+from core.utils import resolve_store_merchant
 from .models import Product, Customer, CustomerInteraction
 from .services import HybridRecommendationEngine
 from .sync_service import SallaSyncService
@@ -17,15 +16,14 @@ import json
 @require_http_methods(["GET"])
 def recommend_for_customer(request, customer_id: int = None):
     """Get product recommendations for a customer"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     # If no merchant in session, try to get from store_id parameter
     if not merchant:
         store_id = request.GET.get('store_id')
         if store_id:
-            try:
-                merchant = Merchant.objects.get(salla_merchant_id=store_id)
-            except Merchant.DoesNotExist:
+            merchant = resolve_store_merchant(store_id)
+            if merchant is None:
                 return JsonResponse({'error': 'Store not found'}, status=404)
         else:
             return JsonResponse({'error': 'No merchant selected'}, status=400)
@@ -141,15 +139,14 @@ def recommend_for_customer(request, customer_id: int = None):
 def recommend_similar_products(request, product_id: int = None):
     """Get products similar to a given product - accepts salla_product_id or internal id"""
     # Try to get merchant from request
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     # If no merchant in session, try to get from store_id parameter
     if not merchant:
         store_id = request.GET.get('store_id')
         if store_id:
-            try:
-                merchant = Merchant.objects.get(salla_merchant_id=store_id)
-            except Merchant.DoesNotExist:
+            merchant = resolve_store_merchant(store_id)
+            if merchant is None:
                 return JsonResponse({'error': 'Store not found'}, status=404)
         else:
             return JsonResponse({'error': 'No merchant selected'}, status=400)
@@ -263,7 +260,7 @@ def recommend_similar_products(request, product_id: int = None):
 @require_http_methods(["GET"])
 def recommend_trending(request):
     """Get trending/popular products"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'error': 'No merchant selected'}, status=400)
     
@@ -308,14 +305,13 @@ def track_interaction(request):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
     
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         # Try to get merchant from store_id
         store_id = data.get('store_id')
         if store_id:
-            try:
-                merchant = Merchant.objects.get(salla_merchant_id=store_id)
-            except Merchant.DoesNotExist:
+            merchant = resolve_store_merchant(store_id)
+            if merchant is None:
                 return JsonResponse({'error': 'Store not found'}, status=404)
         else:
             return JsonResponse({'error': 'No merchant selected'}, status=400)
@@ -365,7 +361,7 @@ def track_interaction(request):
 @require_http_methods(["POST"])
 def sync_products(request):
     """Sync products from Salla API"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'error': 'No merchant selected'}, status=400)
     
@@ -377,7 +373,10 @@ def sync_products(request):
         synced_count = result['synced_count']
         deactivated_count = result['deactivated_count']
         
-        message = f'Synced {synced_count} products'
+        message = (
+            f"Synced {synced_count} products ({result['new_count']} new, "
+            f"{result['changed_count']} updated, {result['unchanged_count']} unchanged)"
+        )
         if deactivated_count > 0:
             message += f', removed {deactivated_count} old products from recommendations'
         
@@ -385,6 +384,10 @@ def sync_products(request):
             'success': True,
             'synced_count': synced_count,
             'deactivated_count': deactivated_count,
+            'new_count': result['new_count'],
+            'changed_count': result['changed_count'],
+            'unchanged_count': result['unchanged_count'],
+            'catalog_changed': result['catalog_changed'],
             'message': message
         })
     except ValueError as e:
@@ -396,7 +399,7 @@ def sync_products(request):
 @require_http_methods(["POST"])
 def sync_orders(request):
     """Sync orders from Salla API"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'error': 'No merchant selected'}, status=400)
     
@@ -419,16 +422,14 @@ def sync_orders(request):
 @require_http_methods(["GET"])
 def widget_snippet(request):
     """Display HTML snippet for Salla store integration - works for any merchant"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     # Try to get merchant from store_id parameter if not in session
     if not merchant:
         store_id = request.GET.get('store_id')
         if store_id:
-            try:
-                merchant = Merchant.objects.get(salla_merchant_id=store_id)
-            except Merchant.DoesNotExist:
-                merchant = None  # Continue without merchant - widget will work anyway
+            # None for unknown stores; the widget works without a merchant
+            merchant = resolve_store_merchant(store_id)
     
     # Build base URL - use request to get current domain
     base_url = request.build_absolute_uri('/').rstrip('/')
@@ -445,16 +446,13 @@ def widget_snippet(request):
 @require_http_methods(["GET"])
 def widget_snippets(request):
     """Display all three widget snippets on one page"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     
     # Try to get merchant from store_id parameter if not in session
     if not merchant:
         store_id = request.GET.get('store_id')
         if store_id:
-            try:
-                merchant = Merchant.objects.get(salla_merchant_id=store_id)
-            except Merchant.DoesNotExist:
-                merchant = None
+            merchant = resolve_store_merchant(store_id)
     
     base_url = request.build_absolute_uri('/').rstrip('/')
     
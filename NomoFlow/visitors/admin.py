@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import VisitorRetentionPolicy
 
-# Register your models here.
+
+@admin.register(VisitorRetentionPolicy)
+class VisitorRetentionPolicyAdmin(admin.ModelAdmin):
+    list_display = ['merchant', 'page_view_days', 'session_days', 'updated_at']
+    search_fields = ['merchant__name', 'merchant__salla_merchant_id']
+    readonly_fields = ['updated_at']
@@ -0,0 +1,298 @@
+"""
+Off-request enrichment of VisitorSession device, source and country.
+
+Views only queue the raw hints of a session (User-Agent, document referrer,
+client IP) the first time a worker sees it. A background flusher parses them
+through memoized parsers, looks the IP up in a local IP-range table and
+fills the columns with one bulk_update per batch.
+
+The IP table is a binary file of sorted, non-overlapping IPv4 ranges built
+by `manage.py build_ip_country_table`. It is memory-mapped and searched in
+place, so lookups cost O(log n) page reads and no per-process copy.
+"""
+import atexit
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from .ingest import PeriodicFlusher
+from .models import VisitorSession
+
+
+# --- User-Agent and referrer -------------------------------------------------
+
+TRAFFIC_SOURCES = ('Direct', 'Search', 'Social', 'Referral')
+
+BOT_MARKERS = ('bot', 'crawl', 'spider', 'slurp', 'headless', 'lighthouse', 'preview')
+
+SEARCH_ENGINES = ('google.', 'bing.com', 'yahoo.', 'duckduckgo.com', 'yandex.', 'baidu.com', 'ecosia.org')
+
+SOCIAL_NETWORKS = (
+    'facebook.com', 'fb.com', 'instagram.com', 'twitter.com', 'x.com', 't.co',
+    'tiktok.com', 'snapchat.com', 'youtube.com', 'linkedin.com', 'pinterest.com',
+    'whatsapp.com', 'wa.me', 't.me', 'telegram.org', 'reddit.com',
+)
+
+
+@lru_cache(maxsize=4096)
+def parse_device(user_agent: str) -> str:
+    """Device class of a User-Agent: Desktop, Mobile, Tablet, Bot or Unknown"""
+    ua = user_agent.lower()
+    if not ua:
+        return 'Unknown'
+    if any(marker in ua for marker in BOT_MARKERS):
+        return 'Bot'
+    if 'ipad' in ua or 'tablet' in ua or ('android' in ua and 'mobile' not in ua):
+        return 'Tablet'
+    if 'mobi' in ua or 'iphone' in ua or 'ipod' in ua:
+        return 'Mobile'
+    return 'Desktop'
+
+
+def _host_matches(host: str, domains: Iterable[str]) -> bool:
+    for domain in domains:
+        if domain.endswith('.'):
+            # "google." matches google.com, google.com.sa, www.google.co.uk ...
+            if host.startswith(domain) or f'.{domain}' in host:
+                return True
+        elif host == domain or host.endswith(f'.{domain}'):
+            return True
+    return False
+
+
+@lru_cache(maxsize=4096)
+def classify_source(referrer: str, site_host: str) -> str:
+    """Traffic source of a landing referrer: Direct, Search, Social or Referral"""
+    host = (urlsplit(referrer).hostname or '') if referrer else ''
+    if host.startswith('www.'):
+        host = host[4:]
+    site_host = site_host[4:] if site_host.startswith('www.') else site_host
+
+    # No referrer, or navigation inside the store itself
+    if not host or host == site_host:
+        return 'Direct'
+    if _host_matches(host, SEARCH_ENGINES):
+        return 'Search'
+    if _host_matches(host, SOCIAL_NETWORKS):
+        return 'Social'
+    return 'Referral'
+
+
+# --- IP to country ------------------------------------------------------------
+
+TABLE_MAGIC = b'NFIPv4\x00\x01'
+RECORD = struct.Struct('>II2s')  # range start, range end (inclusive), ISO country code
+RANGE_START = struct.Struct('>I')
+
+
+class IpCountryTable:
+    """Memory-mapped sorted array of IPv4 ranges, searched with binary search"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as fh:
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(TABLE_MAGIC)] != TABLE_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not an IP country table")
+        self.size = (len(self._map) - len(TABLE_MAGIC)) // RECORD.size
+
+    def _offset(self, index: int) -> int:
+        return len(TABLE_MAGIC) + index * RECORD.size
+
+    def lookup(self, ip: str) -> Optional[str]:
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6:
+            address = address.ipv4_mapped
+            if address is None:
+                return None
+        value = int(address)
+
+        # Last range starting at or before the address
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if RANGE_START.unpack_from(self._map, self._offset(mid))[0] <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+
+        start, end, code = RECORD.unpack_from(self._map, self._offset(lo - 1))
+        if value > end:
+            return None
+        return code.decode('ascii')
+
+
+def write_ip_country_table(ranges: Iterable[Tuple[int, int, str]], path: str) -> int:
+    """Write (start, end, country code) IPv4 ranges as a table file; returns ranges written"""
+    ordered = sorted(ranges)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as fh:
+        fh.write(TABLE_MAGIC)
+        for start, end, code in ordered:
+            fh.write(RECORD.pack(start, end, code.upper().encode('ascii')[:2]))
+    # Atomic swap: workers that mapped the old file keep reading it
+    os.replace(tmp_path, path)
+    return len(ordered)
+
+
+_ip_table: Optional[IpCountryTable] = None
+_ip_table_loaded = False
+_ip_table_lock = threading.Lock()
+
+
+def get_ip_table() -> Optional[IpCountryTable]:
+    """The configured IP country table, or None when there is none"""
+    global _ip_table, _ip_table_loaded
+    if _ip_table_loaded:
+        return _ip_table
+    with _ip_table_lock:
+        if not _ip_table_loaded:
+            path = getattr(settings, 'VISITORS_IP_COUNTRY_FILE', '')
+            if path:
+                try:
+                    _ip_table = IpCountryTable(path)
+                except (OSError, ValueError) as e:
+                    print(f"Error loading IP country table {path}: {e}")
+            _ip_table_loaded = True
+    return _ip_table
+
+
+def lookup_country(ip: Optional[str]) -> Optional[str]:
+    table = get_ip_table()
+    if table is None or not ip:
+        return None
+    return table.lookup(ip)
+
+
+# --- Batch fill ---------------------------------------------------------------
+
+class SessionHints(NamedTuple):
+    user_agent: str
+    referrer: str
+    site_host: str
+    ip: Optional[str]
+    attempts: int = 0
+
+
+def client_ip(request) -> Optional[str]:
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR')
+
+
+def request_hints(request, referrer: Optional[str]) -> SessionHints:
+    """Raw hints of a storefront request; the embed's page is the Origin/Referer"""
+    page = request.META.get('HTTP_ORIGIN') or request.META.get('HTTP_REFERER') or ''
+    return SessionHints(
+        user_agent=request.META.get('HTTP_USER_AGENT', '')[:512],
+        referrer=(referrer or '')[:300],
+        site_host=urlsplit(page).hostname or '',
+        ip=client_ip(request),
+    )
+
+
+def enrich(hints: SessionHints) -> Dict[str, Optional[str]]:
+    return {
+        'device': parse_device(hints.user_agent),
+        'source': classify_source(hints.referrer, hints.site_host),
+        'country': lookup_country(hints.ip),
+    }
+
+
+class EnrichmentBuffer(PeriodicFlusher):
+    """Sessions waiting for enrichment, filled in batches by a background thread"""
+
+    thread_name = 'visitors-enrichment-flusher'
+
+    def __init__(self, flush_interval: float = 10.0, batch_size: int = 500,
+                 max_attempts: int = 3, remembered: int = 50000):
+        super().__init__(flush_interval)
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.remembered = remembered
+        self._pending: Dict[Tuple[int, str], SessionHints] = {}
+        # Sessions this worker already enriched, so later heartbeats skip the queue
+        self._done: 'OrderedDict[Tuple[int, str], None]' = OrderedDict()
+
+    def add(self, merchant_id: int, session_id: str, hints: SessionHints) -> None:
+        key = (merchant_id, session_id)
+        with self._lock:
+            if key in self._done or key in self._pending:
+                return
+            self._pending[key] = hints
+        self._ensure_started()
+
+    def flush(self) -> int:
+        """Fill pending sessions; returns the number of rows updated"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+
+            updated = 0
+            keys = list(pending)
+            for i in range(0, len(keys), self.batch_size):
+                batch = {key: pending[key] for key in keys[i:i + self.batch_size]}
+                try:
+                    updated += self._fill(batch)
+                except Exception as e:
+                    print(f"Error enriching {len(batch)} visitor sessions: {e}")
+            return updated
+
+    def _fill(self, batch: Dict[Tuple[int, str], SessionHints]) -> int:
+        sessions = VisitorSession.objects.filter(
+            merchant_id__in={merchant_id for merchant_id, _ in batch},
+            session_id__in={session_id for _, session_id in batch},
+        ).only('id', 'merchant_id', 'session_id', 'device')
+
+        to_update = []
+        found = set()
+        for session in sessions:
+            key = (session.merchant_id, session.session_id)
+            hints = batch.get(key)
+            if hints is None:
+                continue
+            found.add(key)
+            if session.device:
+                # Already enriched by another worker
+                continue
+            for field, value in enrich(hints).items():
+                setattr(session, field, value)
+            to_update.append(session)
+
+        VisitorSession.objects.bulk_update(to_update, ['device', 'source', 'country'])
+
+        with self._lock:
+            for key, hints in batch.items():
+                if key in found:
+                    self._done[key] = None
+                elif hints.attempts + 1 < self.max_attempts:
+                    # Not written yet (e.g. still in the heartbeat buffer); retry next flush
+                    self._pending.setdefault(key, hints._replace(attempts=hints.attempts + 1))
+            while len(self._done) > self.remembered:
+                self._done.popitem(last=False)
+        return len(to_update)
+
+
+enrichment_buffer = EnrichmentBuffer(
+    flush_interval=getattr(settings, 'VISITORS_ENRICHMENT_FLUSH_SECONDS', 10.0),
+)
+
+atexit.register(enrichment_buffer.flush)
+
+
+def queue_enrichment(request, merchant_id: int, session_id: str, referrer: Optional[str] = None) -> None:
+    enrichment_buffer.add(merchant_id, session_id, request_hints(request, referrer))
@@ -0,0 +1,66 @@
+"""
+Adaptive interval policy for the live counter heartbeat.
+
+The server tells each tab when to send its next heartbeat: quiet stores and
+a busy worker get longer intervals, busy stores get fresher counts. The
+interval never exceeds VISITORS_HEARTBEAT_MAX_SECONDS, which must stay well
+below the active visitor window so live sessions are not dropped.
+"""
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+class RateMeter:
+    """Events per second in this worker over the last `span` seconds"""
+
+    def __init__(self, span: int = 10):
+        self.span = span
+        self._lock = threading.Lock()
+        self._seconds = deque()  # [second, count], oldest first
+
+    def mark(self, now: float = None) -> None:
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            if self._seconds and self._seconds[-1][0] == second:
+                self._seconds[-1][1] += 1
+            else:
+                self._seconds.append([second, 1])
+            self._expire(second)
+
+    def rate(self, now: float = None) -> float:
+        second = int(now if now is not None else time.time())
+        with self._lock:
+            self._expire(second)
+            return sum(count for _, count in self._seconds) / self.span
+
+    def _expire(self, second: int) -> None:
+        while self._seconds and self._seconds[0][0] <= second - self.span:
+            self._seconds.popleft()
+
+
+heartbeat_rate = RateMeter()
+
+
+def next_interval_ms(active_count: int) -> int:
+    """Milliseconds until the client should send its next heartbeat"""
+    base = getattr(settings, 'VISITORS_HEARTBEAT_BASE_SECONDS', 10)
+    maximum = getattr(settings, 'VISITORS_HEARTBEAT_MAX_SECONDS', 60)
+    load_threshold = getattr(settings, 'VISITORS_HEARTBEAT_LOAD_RPS', 50)
+
+    # Nobody else to count: the number barely moves, so check in less often
+    if active_count <= 1:
+        interval = base * 3
+    elif active_count < 5:
+        interval = base * 2
+    else:
+        interval = base
+
+    # Back off proportionally once this worker sees more than its share
+    rate = heartbeat_rate.rate()
+    if load_threshold and rate > load_threshold:
+        interval *= rate / load_threshold
+
+    return int(min(interval, maximum) * 1000)
@@ -0,0 +1,162 @@
+"""
+HyperLogLog unique visitor sketches.
+
+Each merchant gets one sketch per (UTC) day, stored as a small binary blob
+in VisitorDailySketch. Sketches of any date range merge into an estimate of
+distinct sessions over the whole range with ~1.6% standard error, in
+constant memory and without COUNT DISTINCT scans over the raw tables.
+"""
+import atexit
+import hashlib
+import math
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from core.models import Merchant
+from .ingest import PeriodicFlusher
+from .models import PageView, VisitorDailySketch
+
+
+PRECISION = 12
+REGISTERS = 1 << PRECISION
+
+
+class HyperLogLog:
+    """Dense HyperLogLog with 2**PRECISION one-byte registers"""
+
+    def __init__(self, registers: Optional[bytes] = None):
+        if registers is not None and len(registers) != REGISTERS:
+            raise ValueError(f"Expected {REGISTERS} registers, got {len(registers)}")
+        self.registers = bytearray(registers) if registers is not None else bytearray(REGISTERS)
+
+    def add(self, value: str) -> None:
+        h = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        index = h >> (64 - PRECISION)
+        rest = h & ((1 << (64 - PRECISION)) - 1)
+        # Position of the leftmost 1-bit in the remaining 52 bits
+        rank = (64 - PRECISION) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        m = REGISTERS
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+
+        # Small-range correction: linear counting while registers are still empty
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        return cls(bytes(data))
+
+
+def _save_sketch(merchant_id: int, day: date, sketch: HyperLogLog) -> None:
+    """Merge a sketch into the stored one for (merchant, day)"""
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                stored = VisitorDailySketch.objects.select_for_update().filter(
+                    merchant_id=merchant_id, date=day
+                ).first()
+                if stored is None:
+                    VisitorDailySketch.objects.create(
+                        merchant_id=merchant_id, date=day, registers=sketch.to_bytes()
+                    )
+                else:
+                    merged = HyperLogLog.from_bytes(stored.registers)
+                    merged.merge(sketch)
+                    stored.registers = merged.to_bytes()
+                    stored.save(update_fields=['registers', 'updated_at'])
+            return
+        except IntegrityError:
+            # Another worker created the row first; merge into theirs
+            continue
+
+
+class SketchBuffer(PeriodicFlusher):
+    """In-process sketches updated per heartbeat and merged into the DB periodically"""
+
+    thread_name = 'visitors-sketch-flusher'
+
+    def __init__(self, flush_interval: float = 30.0):
+        super().__init__(flush_interval)
+        self._sketches: Dict[Tuple[int, date], HyperLogLog] = {}
+
+    def add(self, merchant_id: int, session_id: str, now: datetime) -> None:
+        self._ensure_started()
+        key = (merchant_id, now.date())
+        with self._lock:
+            sketch = self._sketches.get(key)
+            if sketch is None:
+                sketch = self._sketches[key] = HyperLogLog()
+            sketch.add(session_id)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                sketches, self._sketches = self._sketches, {}
+
+            for (merchant_id, day), sketch in sketches.items():
+                try:
+                    _save_sketch(merchant_id, day, sketch)
+                except Exception as e:
+                    print(f"Error saving visitor sketch for merchant {merchant_id} on {day}: {e}")
+            return len(sketches)
+
+
+sketch_buffer = SketchBuffer(
+    flush_interval=getattr(settings, 'VISITORS_SKETCH_FLUSH_SECONDS', 30.0),
+)
+
+atexit.register(sketch_buffer.flush)
+
+
+def record_unique_visitor(merchant_id: int, session_id: str, now: Optional[datetime] = None) -> None:
+    sketch_buffer.add(merchant_id, session_id, now or timezone.now())
+
+
+def rebuild_sketch(merchant_id: int, day: date) -> int:
+    """Replace a day's sketch with one built from its PageView rows"""
+    sketch = HyperLogLog()
+    day_start = datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+    session_ids = PageView.objects.filter(
+        merchant_id=merchant_id,
+        viewed_at__gte=day_start,
+        viewed_at__lt=day_start + timedelta(days=1),
+    ).values_list('session_id', flat=True).distinct()
+    for session_id in session_ids.iterator():
+        sketch.add(session_id)
+
+    VisitorDailySketch.objects.update_or_create(
+        merchant_id=merchant_id, date=day, defaults={'registers': sketch.to_bytes()}
+    )
+    return sketch.count()
+
+
+def unique_visitors(merchant: Optional[Merchant], start: date, end: date) -> int:
+    """Estimated distinct sessions from `start` to `end` inclusive.
+
+    Passing merchant=None estimates across all merchants.
+    """
+    sketches = VisitorDailySketch.objects.filter(date__gte=start, date__lte=end)
+    if merchant:
+        sketches = sketches.filter(merchant=merchant)
+
+    total = HyperLogLog()
+    for registers in sketches.values_list('registers', flat=True).iterator():
+        total.merge(HyperLogLog.from_bytes(registers))
+    return total.count()
@@ -0,0 +1,286 @@
+"""
+Write-behind ingestion for storefront heartbeats.
+
+Heartbeats are merged in memory per (merchant, session) and flushed on a
+short interval as one bulk upsert of VisitorSession plus one bulk_create of
+PageView, instead of several queries per heartbeat. The session upsert also
+maintains each session's running metrics (page count, first/last path,
+duration), so engagement queries never join PageView.
+"""
+import atexit
+import threading
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connections, router, transaction
+
+from .models import VisitorSession, PageView
+
+
+class PeriodicFlusher:
+    """Base for in-process buffers written out by a background thread"""
+
+    thread_name = 'visitors-flusher'
+
+    def __init__(self, flush_interval: float = 2.0):
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def flush(self):
+        raise NotImplementedError
+
+    def _ensure_started(self) -> None:
+        # Started lazily so each forked worker gets its own flusher thread
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+class SessionDelta:
+    """What one batch adds to a session's row and running metrics"""
+
+    __slots__ = ('started_at', 'last_seen_at', 'page_count', 'first_path', 'first_at', 'last_path', 'last_at')
+
+    def __init__(self, now):
+        self.started_at = now
+        self.last_seen_at = now
+        self.page_count = 0
+        self.first_path = self.last_path = None
+        self.first_at = self.last_at = None
+
+    def add(self, views: List[PageView], now) -> None:
+        if now > self.last_seen_at:
+            self.last_seen_at = now
+        for view in views:
+            self.page_count += 1
+            if view.viewed_at < self.started_at:
+                self.started_at = view.viewed_at
+            if self.first_at is None or view.viewed_at < self.first_at:
+                self.first_path, self.first_at = view.path, view.viewed_at
+            if self.last_at is None or view.viewed_at >= self.last_at:
+                self.last_path, self.last_at = view.path, view.viewed_at
+
+    def merge(self, newer: 'SessionDelta') -> None:
+        """Fold in a delta queued after this one"""
+        self.started_at = min(self.started_at, newer.started_at)
+        self.last_seen_at = max(self.last_seen_at, newer.last_seen_at)
+        self.page_count += newer.page_count
+        if newer.first_at is not None and (self.first_at is None or newer.first_at < self.first_at):
+            self.first_path, self.first_at = newer.first_path, newer.first_at
+        if newer.last_at is not None and (self.last_at is None or newer.last_at >= self.last_at):
+            self.last_path, self.last_at = newer.last_path, newer.last_at
+
+
+# On conflict the stored row keeps started_at and first_path, counters add up
+# and last_seen_at only moves forward
+_UPSERT_SQL = """
+    INSERT INTO {table} (merchant_id, session_id, started_at, last_seen_at,
+                         page_count, first_path, last_path, duration_seconds)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (merchant_id, session_id) DO UPDATE SET
+        last_seen_at = CASE WHEN EXCLUDED.last_seen_at > {table}.last_seen_at
+                            THEN EXCLUDED.last_seen_at ELSE {table}.last_seen_at END,
+        page_count = {table}.page_count + EXCLUDED.page_count,
+        first_path = COALESCE({table}.first_path, EXCLUDED.first_path),
+        last_path = COALESCE(EXCLUDED.last_path, {table}.last_path),
+        duration_seconds = {duration}
+"""
+
+# julianday() is a float of days, so round rather than truncate to whole seconds
+_DURATION_SQL = {
+    'postgresql': "GREATEST({table}.duration_seconds, "
+                  "CAST(EXTRACT(EPOCH FROM (EXCLUDED.last_seen_at - {table}.started_at)) AS integer))",
+    'sqlite': "MAX({table}.duration_seconds, "
+              "CAST(ROUND((julianday(EXCLUDED.last_seen_at) - julianday({table}.started_at)) * 86400) AS integer))",
+}
+
+
+def upsert_sessions(deltas: Dict[Tuple[int, str], SessionDelta]) -> None:
+    """Create or update VisitorSession rows and their running metrics in one statement"""
+    if not deltas:
+        return
+
+    connection = connections[router.db_for_write(VisitorSession)]
+    duration = _DURATION_SQL.get(connection.vendor)
+    if duration is None:
+        _upsert_sessions_orm(deltas)
+        return
+
+    table = connection.ops.quote_name(VisitorSession._meta.db_table)
+    sql = _UPSERT_SQL.format(table=table, duration=duration.format(table=table))
+    adapt = connection.ops.adapt_datetimefield_value
+    params = [
+        (
+            merchant_id,
+            session_id,
+            adapt(delta.started_at),
+            adapt(delta.last_seen_at),
+            delta.page_count,
+            delta.first_path,
+            delta.last_path,
+            max(int((delta.last_seen_at - delta.started_at).total_seconds()), 0),
+        )
+        for (merchant_id, session_id), delta in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def _upsert_sessions_orm(deltas: Dict[Tuple[int, str], SessionDelta]) -> None:
+    """Row-at-a-time fallback for databases without INSERT ... ON CONFLICT"""
+    for (merchant_id, session_id), delta in deltas.items():
+        session, created = VisitorSession.objects.select_for_update().get_or_create(
+            merchant_id=merchant_id,
+            session_id=session_id,
+            defaults={
+                'started_at': delta.started_at,
+                'last_seen_at': delta.last_seen_at,
+                'page_count': delta.page_count,
+                'first_path': delta.first_path,
+                'last_path': delta.last_path,
+            },
+        )
+        if not created:
+            session.last_seen_at = max(session.last_seen_at, delta.last_seen_at)
+            session.page_count += delta.page_count
+            session.first_path = session.first_path or delta.first_path
+            session.last_path = delta.last_path or session.last_path
+        session.duration_seconds = max(
+            session.duration_seconds,
+            int((session.last_seen_at - session.started_at).total_seconds()),
+        )
+        session.save(update_fields=['last_seen_at', 'page_count', 'first_path', 'last_path', 'duration_seconds'])
+
+
+def write_visits(deltas: Dict[Tuple[int, str], SessionDelta], page_views: List[PageView]) -> None:
+    """Session upsert plus PageView inserts as one transaction"""
+    with transaction.atomic():
+        upsert_sessions(deltas)
+        if page_views:
+            PageView.objects.bulk_create(page_views)
+
+
+class HeartbeatBuffer(PeriodicFlusher):
+    """Thread-safe in-process buffer of pending visitor writes"""
+
+    thread_name = 'visitors-heartbeat-flusher'
+
+    def __init__(self, flush_interval: float = 2.0, max_pending: int = 5000, max_retries: int = 3):
+        super().__init__(flush_interval)
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        self._sessions: Dict[Tuple[int, str], SessionDelta] = {}
+        self._page_views: List[PageView] = []
+        self._failed_flushes = 0
+
+    def add(self, merchant_id: int, session_id: str, path: str, now, page_view: bool = True) -> None:
+        """Queue one heartbeat; repeated heartbeats of a session are merged"""
+        views = [PageView(merchant_id=merchant_id, session_id=session_id, path=path, viewed_at=now)] if page_view else []
+        self.add_page_views(merchant_id, session_id, views, now)
+
+    def add_page_views(self, merchant_id: int, session_id: str, views: List[PageView], now) -> None:
+        """Queue a session touch at `now` together with any number of page views"""
+        self._ensure_started()
+
+        with self._lock:
+            key = (merchant_id, session_id)
+            delta = self._sessions.get(key)
+            if delta is None:
+                delta = self._sessions[key] = SessionDelta(now)
+            delta.add(views, now)
+
+            self._page_views.extend(views)
+            overflow = len(self._page_views) >= self.max_pending
+
+        if overflow:
+            self._wake.set()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._page_views)
+
+    def flush(self) -> Tuple[int, int]:
+        """Write everything buffered so far.
+
+        Returns:
+            (sessions_written, page_views_written)
+        """
+        with self._flush_lock:
+            with self._lock:
+                sessions, self._sessions = self._sessions, {}
+                page_views, self._page_views = self._page_views, []
+
+            if not sessions and not page_views:
+                return 0, 0
+
+            try:
+                write_visits(sessions, page_views)
+            except Exception as e:
+                print(f"Error flushing visitor heartbeats ({len(sessions)} sessions, {len(page_views)} page views): {e}")
+                self._requeue(sessions, page_views)
+                return 0, 0
+
+            self._failed_flushes = 0
+            return len(sessions), len(page_views)
+
+    def _requeue(self, sessions: Dict[Tuple[int, str], SessionDelta], page_views: List[PageView]) -> None:
+        """Put a failed batch back in front of what was queued since, for the next flush"""
+        self._failed_flushes += 1
+        if self._failed_flushes > self.max_retries:
+            print(f"Dropping visitor heartbeats after {self.max_retries} failed retries")
+            self._failed_flushes = 0
+            return
+
+        for view in page_views:
+            # The rolled back insert may have assigned ids
+            view.pk = None
+            view._state.adding = True
+
+        with self._lock:
+            for key, newer in self._sessions.items():
+                if key in sessions:
+                    sessions[key].merge(newer)
+                else:
+                    sessions[key] = newer
+            self._sessions = sessions
+
+            page_views.extend(self._page_views)
+            # Past twice the flush threshold the database is not keeping up; keep the newest
+            limit = self.max_pending * 2
+            if len(page_views) > limit:
+                print(f"Dropping {len(page_views) - limit} buffered page views")
+                page_views = page_views[-limit:]
+            self._page_views = page_views
+
+
+def is_buffered_mode() -> bool:
+    return getattr(settings, 'VISITORS_INGESTION_MODE', 'direct') == 'buffered'
+
+
+heartbeat_buffer = HeartbeatBuffer(
+    flush_interval=getattr(settings, 'VISITORS_FLUSH_INTERVAL_SECONDS', 2.0),
+    max_pending=getattr(settings, 'VISITORS_FLUSH_MAX_PENDING', 5000),
+    max_retries=getattr(settings, 'VISITORS_FLUSH_MAX_RETRIES', 3),
+)
+
+# Don't lose the last interval's heartbeats on a graceful worker shutdown
+atexit.register(heartbeat_buffer.flush)
@@ -0,0 +1,273 @@
+"""
+Sliding-window active visitor counter.
+
+Answers "how many sessions were seen in the last N seconds" per merchant
+without querying VisitorSession. Each merchant gets a ring buffer with one
+bucket per second; a session lives in the bucket of the second it was last
+seen, and buckets falling out of the window are evicted as time advances.
+DjangoCacheBackend keeps the same buckets as atomic counters in a shared
+cache instead, for deployments with several worker processes.
+The VisitorSession query is kept as a fallback and to periodically
+reconcile the window with what other workers have written.
+"""
+import hashlib
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import VisitorSession
+
+
+def session_key(session_id: str) -> int:
+    """64-bit hash of a session id, so windows don't hold the raw strings"""
+    return int.from_bytes(hashlib.blake2b(session_id.encode(), digest_size=8).digest(), 'big')
+
+
+class SlidingWindow:
+    """Distinct sessions seen in the last `size` seconds, in O(1) amortized time"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.head: Optional[int] = None
+        self.reconciled_at: Optional[int] = None
+        self._buckets = [set() for _ in range(size)]
+        self._last_seen: Dict[int, int] = {}
+
+    def touch(self, key: int, second: int) -> None:
+        self.advance(second)
+        if second <= self.head - self.size:
+            return
+
+        previous = self._last_seen.get(key)
+        if previous is not None:
+            if previous >= second:
+                return
+            self._buckets[previous % self.size].discard(key)
+
+        self._last_seen[key] = second
+        self._buckets[second % self.size].add(key)
+
+    def count(self, second: int) -> int:
+        self.advance(second)
+        return len(self._last_seen)
+
+    def advance(self, second: int) -> None:
+        if self.head is None:
+            self.head = second
+            return
+        if second <= self.head:
+            return
+
+        # Each slot entered by the head held sessions from exactly one window ago
+        steps = min(second - self.head, self.size)
+        for s in range(self.head + 1, self.head + 1 + steps):
+            bucket = self._buckets[s % self.size]
+            for key in bucket:
+                self._last_seen.pop(key, None)
+            bucket.clear()
+        self.head = second
+
+
+class LocalMemoryBackend:
+    """Per-process windows, exact for a single process only.
+
+    Under several workers (gunicorn's default in the Procfile) each worker
+    only counts the heartbeats it served itself, and other workers' sessions
+    are merged in only when the window is reconciled with the database
+    (every VISITORS_LIVE_COUNTER_RECONCILE_SECONDS). Use DjangoCacheBackend
+    with a shared cache there.
+    """
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._windows: Dict[int, SlidingWindow] = {}
+
+    def _window(self, merchant_id: int) -> SlidingWindow:
+        window = self._windows.get(merchant_id)
+        if window is None:
+            window = self._windows[merchant_id] = SlidingWindow(self.window_seconds)
+        return window
+
+    def touch(self, merchant_id: int, key: int, second: int) -> None:
+        with self._lock:
+            self._window(merchant_id).touch(key, second)
+
+    def count(self, merchant_id: int, second: int) -> int:
+        with self._lock:
+            return self._window(merchant_id).count(second)
+
+    def last_reconciled(self, merchant_id: int) -> Optional[int]:
+        with self._lock:
+            window = self._windows.get(merchant_id)
+            return window.reconciled_at if window else None
+
+    def reconcile(self, merchant_id: int, entries: Iterable[Tuple[int, int]], second: int) -> None:
+        with self._lock:
+            window = self._window(merchant_id)
+            for key, seen in entries:
+                window.touch(key, seen)
+            window.advance(second)
+            window.reconciled_at = second
+
+
+class DjangoCacheBackend:
+    """Windows kept in a shared Django cache, updated with atomic operations.
+
+    Time is cut into buckets of `bucket_seconds`. Each bucket is a counter key
+    holding the sessions whose latest heartbeat fell into it, and each session
+    has a marker key with the bucket it is counted in. A heartbeat in a new
+    bucket claims the move with cache.add, so concurrent heartbeats of one
+    session move it once, then incr/decr the two counters; counters of
+    different sessions never overwrite each other. The count is the sum of the
+    buckets in the window, so its edge is accurate to one bucket.
+
+    Needs a cache shared by all workers (Redis, Memcached, database);
+    with the default LocMemCache this is per-process like LocalMemoryBackend.
+    """
+
+    def __init__(self, window_seconds: int, alias: str = 'default', bucket_seconds: int = 10):
+        self.window_seconds = window_seconds
+        self.alias = alias
+        self.bucket_seconds = max(1, min(bucket_seconds, window_seconds))
+        # Keys outlive the window by a bucket, so the oldest bucket is still readable
+        self.timeout = window_seconds + self.bucket_seconds
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _bucket(self, second: int) -> int:
+        return second // self.bucket_seconds
+
+    def _count_key(self, merchant_id: int, bucket: int) -> str:
+        return f'visitors:live:{merchant_id}:count:{bucket}'
+
+    def _session_key(self, merchant_id: int, key: int) -> str:
+        return f'visitors:live:{merchant_id}:session:{key}'
+
+    def _claim_key(self, merchant_id: int, key: int, bucket: int) -> str:
+        return f'visitors:live:{merchant_id}:session:{key}:{bucket}'
+
+    def _window_buckets(self, second: int) -> range:
+        newest = self._bucket(second)
+        return range(newest - self.window_seconds // self.bucket_seconds + 1, newest + 1)
+
+    def _move(self, merchant_id: int, key: int, previous: Optional[int], bucket: int, oldest: int) -> None:
+        cache = self.cache
+        if not cache.add(self._claim_key(merchant_id, key, bucket), 1, timeout=self.bucket_seconds * 2):
+            # Another worker is moving this session into the same bucket
+            return
+        cache.set(self._session_key(merchant_id, key), bucket, timeout=self.timeout)
+
+        count_key = self._count_key(merchant_id, bucket)
+        cache.add(count_key, 0, timeout=self.timeout)
+        try:
+            cache.incr(count_key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.add(count_key, 1, timeout=self.timeout)
+
+        if previous is not None and previous >= oldest:
+            try:
+                cache.decr(self._count_key(merchant_id, previous))
+            except ValueError:
+                pass
+
+    def touch(self, merchant_id: int, key: int, second: int) -> None:
+        bucket = self._bucket(second)
+        previous = self.cache.get(self._session_key(merchant_id, key))
+        if previous is not None and previous >= bucket:
+            return
+        self._move(merchant_id, key, previous, bucket, self._window_buckets(second).start)
+
+    def count(self, merchant_id: int, second: int) -> int:
+        keys = [self._count_key(merchant_id, bucket) for bucket in self._window_buckets(second)]
+        return max(0, sum(self.cache.get_many(keys).values()))
+
+    def last_reconciled(self, merchant_id: int) -> Optional[int]:
+        return self.cache.get(f'visitors:live:{merchant_id}:reconciled')
+
+    def reconcile(self, merchant_id: int, entries: Iterable[Tuple[int, int]], second: int) -> None:
+        entries = list(entries)
+        oldest = self._window_buckets(second).start
+        markers = self.cache.get_many([self._session_key(merchant_id, key) for key, _ in entries])
+        for key, seen in entries:
+            bucket = self._bucket(seen)
+            previous = markers.get(self._session_key(merchant_id, key))
+            if bucket >= oldest and (previous is None or previous < bucket):
+                self._move(merchant_id, key, previous, bucket, oldest)
+        self.cache.set(f'visitors:live:{merchant_id}:reconciled', second, timeout=self.timeout * 2)
+
+
+def _window_seconds() -> int:
+    return int(getattr(settings, 'VISITORS_ACTIVE_WINDOW_SECONDS', 300))
+
+
+def _build_backend():
+    backend_path = getattr(settings, 'VISITORS_LIVE_COUNTER_BACKEND', 'visitors.live_counter.LocalMemoryBackend')
+    options = getattr(settings, 'VISITORS_LIVE_COUNTER_OPTIONS', {})
+    return import_string(backend_path)(_window_seconds(), **options)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _build_backend()
+    return _backend
+
+
+def db_active_count(merchant_id: int, now=None) -> int:
+    """Active visitor count straight from VisitorSession"""
+    now = now or timezone.now()
+    return VisitorSession.objects.filter(
+        merchant_id=merchant_id,
+        last_seen_at__gte=now - timedelta(seconds=_window_seconds())
+    ).count()
+
+
+def reconcile(merchant_id: int, now=None) -> None:
+    """Merge recently active sessions from the database into the window"""
+    now = now or timezone.now()
+    rows = VisitorSession.objects.filter(
+        merchant_id=merchant_id,
+        last_seen_at__gte=now - timedelta(seconds=_window_seconds())
+    ).values_list('session_id', 'last_seen_at')
+    entries = [(session_key(sid), int(seen.timestamp())) for sid, seen in rows]
+    get_backend().reconcile(merchant_id, entries, int(now.timestamp()))
+
+
+def record_heartbeat(merchant_id: int, session_id: str, now=None) -> None:
+    now = now or timezone.now()
+    try:
+        get_backend().touch(merchant_id, session_key(session_id), int(now.timestamp()))
+    except Exception as e:
+        print(f"Error updating live counter for merchant {merchant_id}: {e}")
+
+
+def active_visitor_count(merchant_id: int, now=None) -> int:
+    """Sessions seen in the last window, from the counter when possible"""
+    now = now or timezone.now()
+    second = int(now.timestamp())
+    reconcile_every = int(getattr(settings, 'VISITORS_LIVE_COUNTER_RECONCILE_SECONDS', 300))
+
+    try:
+        backend = get_backend()
+        reconciled_at = backend.last_reconciled(merchant_id)
+        if reconciled_at is None or second - reconciled_at >= reconcile_every:
+            reconcile(merchant_id, now)
+        return backend.count(merchant_id, second)
+    except Exception as e:
+        print(f"Error reading live counter for merchant {merchant_id}, falling back to database: {e}")
+        return db_active_count(merchant_id, now)
@@ -0,0 +1,33 @@
+"""
+Build unique visitor sketches for past days from the raw PageView rows.
+
+    python manage.py backfill_visitor_sketches --days 30
+    python manage.py backfill_visitor_sketches --days 7 --merchant 12
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import Merchant
+from visitors.hll import rebuild_sketch
+
+
+class Command(BaseCommand):
+    help = "Rebuild per-day HyperLogLog visitor sketches from PageView rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="Number of past days to rebuild, including today")
+        parser.add_argument("--merchant", type=int, help="Only rebuild this merchant id")
+
+    def handle(self, *args, **options):
+        merchants = Merchant.objects.all()
+        if options["merchant"]:
+            merchants = merchants.filter(id=options["merchant"])
+
+        today = timezone.now().date()
+        days = [today - timedelta(days=offset) for offset in range(options["days"])]
+
+        for merchant_id in merchants.values_list("id", flat=True):
+            estimates = [rebuild_sketch(merchant_id, day) for day in days]
+            self.stdout.write(f"Merchant {merchant_id}: rebuilt {len(days)} days, ~{sum(estimates)} daily visitors")
@@ -0,0 +1,69 @@
+"""
+Build the IP country table used by visitor session enrichment.
+
+Input is a CSV of IPv4 ranges, one per line: start,end,country_code, with
+addresses either dotted (1.0.0.0) or as integers, as in the common free
+IP-to-country databases. IPv6 rows are skipped.
+
+    python manage.py build_ip_country_table ip-country.csv --output /data/ip-country.bin
+"""
+import csv
+import ipaddress
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from visitors.enrichment import write_ip_country_table
+
+
+def _ipv4(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        number = int(value)
+        if number > 0xFFFFFFFF:
+            raise ValueError(value)
+        return number
+    address = ipaddress.ip_address(value)
+    if address.version != 4:
+        raise ValueError(value)
+    return int(address)
+
+
+class Command(BaseCommand):
+    help = "Convert an IPv4 range CSV into the memory-mapped table read by visitor enrichment"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="CSV with start,end,country_code rows")
+        parser.add_argument(
+            "--output",
+            default=getattr(settings, "VISITORS_IP_COUNTRY_FILE", ""),
+            help="Table file to write (default: VISITORS_IP_COUNTRY_FILE)",
+        )
+
+    def handle(self, *args, **options):
+        if not options["output"]:
+            raise CommandError("No --output given and VISITORS_IP_COUNTRY_FILE is not set")
+
+        ranges = []
+        skipped = 0
+        with open(options["csv_path"], newline="") as fh:
+            for row in csv.reader(fh):
+                if len(row) < 3:
+                    skipped += 1
+                    continue
+                code = row[2].strip().strip('"')
+                try:
+                    start, end = _ipv4(row[0]), _ipv4(row[1])
+                except ValueError:
+                    # Header, IPv6 or malformed row
+                    skipped += 1
+                    continue
+                if len(code) != 2 or not code.isalpha() or start > end:
+                    skipped += 1
+                    continue
+                ranges.append((start, end, code))
+
+        written = write_ip_country_table(ranges, options["output"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} ranges to {options['output']} ({skipped} rows skipped)"
+        ))
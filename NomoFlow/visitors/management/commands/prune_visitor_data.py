@@ -0,0 +1,79 @@
+"""
+Delete (or archive and delete) expired PageView and VisitorSession rows.
+
+    python manage.py prune_visitor_data --dry-run
+    python manage.py prune_visitor_data --chunk-size 2000 --pause 0.1
+    python manage.py prune_visitor_data --archive-dir /data/archive
+    python manage.py prune_visitor_data --interval 3600      # keep running
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.models import Merchant
+from visitors.retention import CsvArchive, prune_all
+from visitors.rollups import ensure_rolled_up
+
+
+class Command(BaseCommand):
+    help = "Prune visitor rows older than each merchant's retention period, in primary-key chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--merchant", type=int, help="Only prune this merchant id")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per DELETE")
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between chunks")
+        parser.add_argument("--archive-dir", help="Write deleted rows to gzipped CSV files in this directory first")
+        parser.add_argument("--dry-run", action="store_true", help="Count expired rows without deleting")
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Run again every N seconds instead of exiting after one pass",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self._run_once(options)
+            if not options["interval"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
+
+    def _run_once(self, options):
+        merchants = Merchant.objects.all()
+        if options["merchant"]:
+            merchants = merchants.filter(id=options["merchant"])
+        merchant_ids = list(merchants.values_list("id", flat=True))
+
+        # Raw rows must be counted in the rollups before they go away
+        ensure_rolled_up(merchant_ids)
+
+        archive = None
+        if options["archive_dir"] and not options["dry_run"]:
+            archive = CsvArchive(options["archive_dir"], timezone.now().strftime("%Y%m%d%H%M%S"))
+
+        verb = "would delete" if options["dry_run"] else "deleted"
+
+        def report(chunk):
+            self.stdout.write(
+                f"{chunk.model_name} merchant {chunk.merchant_id}: {verb} {chunk.deleted} "
+                f"(total {chunk.total_deleted}, {chunk.rows_per_second:.0f} rows/s)"
+            )
+
+        started = time.monotonic()
+        totals = prune_all(
+            merchant_ids,
+            chunk_size=options["chunk_size"],
+            archive=archive,
+            dry_run=options["dry_run"],
+            pause=options["pause"],
+            on_chunk=report,
+        )
+        elapsed = time.monotonic() - started
+        summary = ", ".join(f"{count} {name}" for name, count in totals.items())
+        rate = sum(totals.values()) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {elapsed:.1f}s: {verb} {summary} across {len(merchant_ids)} merchants ({rate:.0f} rows/s)"
+        ))
@@ -0,0 +1,56 @@
+"""
+Roll raw visitor rows up into the hourly and daily stats tables.
+
+    python manage.py rollup_visitor_stats
+    python manage.py rollup_visitor_stats --interval 300      # keep running
+    python manage.py rollup_visitor_stats --rebuild-days 7    # recompute the last week
+
+Dashboards only roll up a merchant themselves when its rollups are more than
+an hour behind, so this is meant to keep running (see Procfile).
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.models import Merchant
+from visitors.models import VisitorRollupCursor
+from visitors.rollups import ensure_rolled_up
+
+
+class Command(BaseCommand):
+    help = "Roll up PageView and VisitorSession rows into hourly and daily visitor stats"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=0,
+            help="Run again every N seconds instead of exiting after one pass",
+        )
+        parser.add_argument(
+            "--rebuild-days",
+            type=int,
+            default=0,
+            help="Move every cursor back N days first, to recompute recent buckets",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild_days"]:
+            rewind_to = timezone.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=options["rebuild_days"])
+            VisitorRollupCursor.objects.filter(rolled_up_to__gt=rewind_to).update(rolled_up_to=rewind_to)
+
+        while True:
+            started = time.monotonic()
+            merchant_ids = list(Merchant.objects.values_list("id", flat=True))
+            rolled = ensure_rolled_up(merchant_ids)
+            self.stdout.write(
+                f"Rolled up {rolled} of {len(merchant_ids)} merchants in {time.monotonic() - started:.2f}s"
+            )
+
+            if not options["interval"]:
+                break
+            close_old_connections()
+            time.sleep(options["interval"])
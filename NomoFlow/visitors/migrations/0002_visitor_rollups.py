@@ -0,0 +1,78 @@
+# Generated by Django 5.2.6 on 2026-10-17 03:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attribution_customer_name_attribution_product_name_and_more'),
+        ('visitors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorRollupCursor',
+            fields=[
+                ('merchant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='visitor_rollup_cursor', serialize=False, to='core.merchant')),
+                ('rolled_up_to', models.DateTimeField(help_text='Start of the first hour not yet rolled up')),
+            ],
+            options={
+                'verbose_name': 'Visitor Rollup Cursor',
+                'verbose_name_plural': 'Visitor Rollup Cursors',
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitorStatsDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('visitors', models.PositiveIntegerField(default=0, help_text='Distinct sessions with a page view on the day')),
+                ('new_sessions', models.PositiveIntegerField(default=0, help_text='Sessions started on the day')),
+                ('page_views', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Daily Visitor Stats',
+                'verbose_name_plural': 'Daily Visitor Stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='VisitorStatsHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('visitors', models.PositiveIntegerField(default=0, help_text='Distinct sessions with a page view in the hour')),
+                ('new_sessions', models.PositiveIntegerField(default=0, help_text='Sessions started in the hour')),
+                ('page_views', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Hourly Visitor Stats',
+                'verbose_name_plural': 'Hourly Visitor Stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='visitorsession',
+            index=models.Index(fields=['merchant', 'started_at'], name='visitors_vi_merchan_59a46c_idx'),
+        ),
+        migrations.AddField(
+            model_name='visitorstatsdaily',
+            name='merchant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_stats_daily', to='core.merchant'),
+        ),
+        migrations.AddField(
+            model_name='visitorstatshourly',
+            name='merchant',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_stats_hourly', to='core.merchant'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitorstatsdaily',
+            constraint=models.UniqueConstraint(fields=('merchant', 'date'), name='uq_visitor_stats_day'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitorstatshourly',
+            constraint=models.UniqueConstraint(fields=('merchant', 'hour'), name='uq_visitor_stats_hour'),
+        ),
+    ]
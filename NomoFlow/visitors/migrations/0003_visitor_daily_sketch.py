@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attribution_customer_name_attribution_product_name_and_more'),
+        ('visitors', '0002_visitor_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorDailySketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('registers', models.BinaryField(help_text='HyperLogLog registers, one byte each')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('merchant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='visitor_sketches', to='core.merchant')),
+            ],
+            options={
+                'verbose_name': 'Visitor Daily Sketch',
+                'verbose_name_plural': 'Visitor Daily Sketches',
+                'constraints': [models.UniqueConstraint(fields=('merchant', 'date'), name='uq_visitor_sketch_day')],
+            },
+        ),
+    ]
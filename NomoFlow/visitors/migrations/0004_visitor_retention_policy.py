@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_attribution_customer_name_attribution_product_name_and_more'),
+        ('visitors', '0003_visitor_daily_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorRetentionPolicy',
+            fields=[
+                ('merchant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='visitor_retention', serialize=False, to='core.merchant')),
+                ('page_view_days', models.PositiveIntegerField(blank=True, help_text='Days to keep page views (blank uses VISITORS_RETENTION_DAYS)', null=True)),
+                ('session_days', models.PositiveIntegerField(blank=True, help_text='Days to keep sessions after they were last seen (blank uses VISITORS_RETENTION_DAYS)', null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Visitor Retention Policy',
+                'verbose_name_plural': 'Visitor Retention Policies',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 04:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0004_visitor_retention_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitorsession',
+            name='duration_seconds',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='first_path',
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='last_path',
+            field=models.CharField(blank=True, max_length=300, null=True),
+        ),
+        migrations.AddField(
+            model_name='visitorsession',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
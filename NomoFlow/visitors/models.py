@@ -9,6 +9,11 @@ class VisitorSession(models.Model):
     device = models.CharField(max_length=40, null=True, blank=True)
     source = models.CharField(max_length=80, null=True, blank=True)
     country = models.CharField(max_length=80, null=True, blank=True)
+    # Running metrics, maintained by visitors.ingest.upsert_sessions
+    page_count = models.PositiveIntegerField(default=0)
+    first_path = models.CharField(max_length=300, null=True, blank=True)
+    last_path = models.CharField(max_length=300, null=True, blank=True)
+    duration_seconds = models.PositiveIntegerField(default=0)
 
     class Meta:
         constraints = [
@@ -16,6 +21,7 @@ class VisitorSession(models.Model):
         ]
         indexes = [
             models.Index(fields=["last_seen_at"]),
+            models.Index(fields=["merchant", "started_at"]),
         ]
         verbose_name = "Visitor Session"
         verbose_name_plural = "Visitor Sessions"
@@ -42,3 +48,103 @@ class PageView(models.Model):
 
     def __str__(self) -> str:
         return f"{self.path} @ {self.viewed_at}"
+
+
+class VisitorStatsHourly(models.Model):
+    """Per-merchant visitor totals for one hour, rolled up from raw rows"""
+    merchant = models.ForeignKey("core.Merchant", on_delete=models.CASCADE, related_name="visitor_stats_hourly")
+    hour = models.DateTimeField()
+    visitors = models.PositiveIntegerField(default=0, help_text="Distinct sessions with a page view in the hour")
+    new_sessions = models.PositiveIntegerField(default=0, help_text="Sessions started in the hour")
+    page_views = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["merchant", "hour"], name="uq_visitor_stats_hour"),
+        ]
+        verbose_name = "Hourly Visitor Stats"
+        verbose_name_plural = "Hourly Visitor Stats"
+
+    def __str__(self) -> str:
+        return f"{self.merchant_id} @ {self.hour}: {self.visitors} visitors"
+
+
+class VisitorStatsDaily(models.Model):
+    """Per-merchant visitor totals for one (UTC) day, rolled up from raw rows"""
+    merchant = models.ForeignKey("core.Merchant", on_delete=models.CASCADE, related_name="visitor_stats_daily")
+    date = models.DateField()
+    visitors = models.PositiveIntegerField(default=0, help_text="Distinct sessions with a page view on the day")
+    new_sessions = models.PositiveIntegerField(default=0, help_text="Sessions started on the day")
+    page_views = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["merchant", "date"], name="uq_visitor_stats_day"),
+        ]
+        verbose_name = "Daily Visitor Stats"
+        verbose_name_plural = "Daily Visitor Stats"
+
+    def __str__(self) -> str:
+        return f"{self.merchant_id} on {self.date}: {self.visitors} visitors"
+
+
+class VisitorRollupCursor(models.Model):
+    """How far a merchant's raw visitor rows have been rolled up"""
+    merchant = models.OneToOneField(
+        "core.Merchant",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="visitor_rollup_cursor",
+    )
+    rolled_up_to = models.DateTimeField(help_text="Start of the first hour not yet rolled up")
+
+    class Meta:
+        verbose_name = "Visitor Rollup Cursor"
+        verbose_name_plural = "Visitor Rollup Cursors"
+
+    def __str__(self) -> str:
+        return f"{self.merchant_id} rolled up to {self.rolled_up_to}"
+
+
+class VisitorDailySketch(models.Model):
+    """HyperLogLog sketch of one merchant's distinct sessions on one (UTC) day"""
+    merchant = models.ForeignKey("core.Merchant", on_delete=models.CASCADE, related_name="visitor_sketches")
+    date = models.DateField()
+    registers = models.BinaryField(help_text="HyperLogLog registers, one byte each")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["merchant", "date"], name="uq_visitor_sketch_day"),
+        ]
+        verbose_name = "Visitor Daily Sketch"
+        verbose_name_plural = "Visitor Daily Sketches"
+
+    def __str__(self) -> str:
+        return f"Sketch for {self.merchant_id} on {self.date}"
+
+
+class VisitorRetentionPolicy(models.Model):
+    """Per-merchant override of how long raw visitor rows are kept"""
+    merchant = models.OneToOneField(
+        "core.Merchant",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="visitor_retention",
+    )
+    page_view_days = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Days to keep page views (blank uses VISITORS_RETENTION_DAYS)"
+    )
+    session_days = models.PositiveIntegerField(
+        null=True, blank=True, help_text="Days to keep sessions after they were last seen (blank uses VISITORS_RETENTION_DAYS)"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Visitor Retention Policy"
+        verbose_name_plural = "Visitor Retention Policies"
+
+    def __str__(self) -> str:
+        return f"Retention for {self.merchant_id}: {self.page_view_days or 'default'}d views, {self.session_days or 'default'}d sessions"
@@ -0,0 +1,118 @@
+"""
+Concurrent viewers per page ("N people are viewing this product").
+
+Built in memory on the heartbeat stream: each merchant keeps the page every
+session was last seen on, a per-page viewer count, and a ring of per-second
+buckets used to expire sessions that stopped sending heartbeats. Reads and
+updates are O(1) amortized and never touch the database. Counts are per
+worker process.
+"""
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .live_counter import session_key
+
+
+MAX_PATH_LENGTH = 300
+
+
+def normalize_path(path: Optional[str]) -> str:
+    """Page identity: no query string or fragment, no trailing slash"""
+    path = (path or '/').split('?', 1)[0].split('#', 1)[0]
+    path = path.rstrip('/') or '/'
+    return path[:MAX_PATH_LENGTH]
+
+
+class MerchantPages:
+    """Live page of every active session of one merchant"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.head: Optional[int] = None
+        self.sessions: Dict[int, Tuple[str, int]] = {}  # session key -> (path, second)
+        self.viewers: Dict[str, int] = {}
+        self._buckets: Dict[int, Set[int]] = {}
+
+    def touch(self, key: int, path: str, second: int) -> None:
+        self.advance(second)
+        if second <= self.head - self.window:
+            return
+
+        current = self.sessions.get(key)
+        if current is not None:
+            if current[1] > second:
+                return
+            self._remove(key, current)
+
+        self.sessions[key] = (path, second)
+        self.viewers[path] = self.viewers.get(path, 0) + 1
+        self._buckets.setdefault(second, set()).add(key)
+
+    def count(self, path: str, second: int) -> int:
+        self.advance(second)
+        return self.viewers.get(path, 0)
+
+    def advance(self, second: int) -> None:
+        if self.head is None:
+            self.head = second
+            return
+        if second <= self.head:
+            return
+
+        # Buckets at or before the new window start hold only expired sessions
+        oldest_kept = second - self.window + 1
+        if second - self.head >= self.window:
+            expired = [s for s in self._buckets if s < oldest_kept]
+        else:
+            expired = range(self.head - self.window + 1, oldest_kept)
+        for s in expired:
+            for key in self._buckets.pop(s, ()):
+                current = self.sessions.pop(key)
+                self._decrement(current[0])
+        self.head = second
+
+    def _remove(self, key: int, current: Tuple[str, int]) -> None:
+        bucket = self._buckets.get(current[1])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[current[1]]
+        self._decrement(current[0])
+
+    def _decrement(self, path: str) -> None:
+        remaining = self.viewers[path] - 1
+        if remaining:
+            self.viewers[path] = remaining
+        else:
+            del self.viewers[path]
+
+
+class PageViewerIndex:
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self._lock = threading.Lock()
+        self._merchants: Dict[int, MerchantPages] = {}
+
+    def touch(self, merchant_id: int, session_id: str, path: str, now=None) -> None:
+        now = now or timezone.now()
+        with self._lock:
+            pages = self._merchants.get(merchant_id)
+            if pages is None:
+                pages = self._merchants[merchant_id] = MerchantPages(self.window_seconds)
+            pages.touch(session_key(session_id), normalize_path(path), int(now.timestamp()))
+
+    def count(self, merchant_id: int, path: str, now=None) -> int:
+        now = now or timezone.now()
+        with self._lock:
+            pages = self._merchants.get(merchant_id)
+            if pages is None:
+                return 0
+            return pages.count(normalize_path(path), int(now.timestamp()))
+
+
+# Comfortably above the longest heartbeat interval, so viewers between two
+# heartbeats are not dropped
+page_viewers = PageViewerIndex(getattr(settings, 'VISITORS_PAGE_VIEWERS_WINDOW_SECONDS', 90))
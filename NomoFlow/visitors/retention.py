@@ -0,0 +1,158 @@
+"""
+Retention for raw visitor rows.
+
+Expired PageView and VisitorSession rows are deleted (and optionally
+archived) per merchant in chunks of at most `chunk_size` consecutive
+primary keys, so each DELETE holds its locks briefly and Postgres can
+vacuum between chunks instead of facing one huge transaction.
+"""
+import csv
+import gzip
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import PageView, VisitorSession, VisitorRetentionPolicy
+
+
+# Rollups read today's and the current hour's totals from raw rows
+MIN_RETENTION_DAYS = 2
+
+
+@dataclass
+class PruneTarget:
+    model: type
+    time_field: str
+    policy_field: str
+
+
+TARGETS = [
+    PruneTarget(PageView, 'viewed_at', 'page_view_days'),
+    PruneTarget(VisitorSession, 'last_seen_at', 'session_days'),
+]
+
+
+@dataclass
+class ChunkResult:
+    model_name: str
+    merchant_id: int
+    deleted: int
+    total_deleted: int
+    elapsed: float
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.total_deleted / self.elapsed if self.elapsed else 0.0
+
+
+def retention_days(policy: Optional[VisitorRetentionPolicy], field: str) -> int:
+    default_days = getattr(settings, 'VISITORS_RETENTION_DAYS', 90)
+    days = getattr(policy, field, None) if policy else None
+    return max(days or default_days, MIN_RETENTION_DAYS)
+
+
+class CsvArchive:
+    """Appends deleted rows to one gzipped CSV per model"""
+
+    def __init__(self, directory: str, run_stamp: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.run_stamp = run_stamp
+
+    def write(self, model: type, rows: list) -> None:
+        if not rows:
+            return
+        path = os.path.join(self.directory, f"{model._meta.db_table}-{self.run_stamp}.csv.gz")
+        new_file = not os.path.exists(path)
+        with gzip.open(path, 'at', newline='') as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(rows[0].keys()))
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+
+
+def prune_expired(
+    target: PruneTarget,
+    merchant_id: int,
+    cutoff: datetime,
+    chunk_size: int = 5000,
+    archive: Optional[CsvArchive] = None,
+    dry_run: bool = False,
+    pause: float = 0.0,
+) -> Iterator[ChunkResult]:
+    """Delete a merchant's rows older than `cutoff`, one PK-range chunk at a time"""
+    expired = target.model.objects.filter(
+        merchant_id=merchant_id, **{f'{target.time_field}__lt': cutoff}
+    )
+    model_name = target.model.__name__
+    started = time.monotonic()
+    total = 0
+    last_id = 0
+
+    while True:
+        ids = list(
+            expired.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+        chunk = expired.filter(id__gte=ids[0], id__lte=ids[-1])
+
+        if dry_run:
+            deleted = len(ids)
+        else:
+            with transaction.atomic():
+                if archive is not None:
+                    archive.write(target.model, list(chunk.values()))
+                deleted, _ = chunk.delete()
+
+        last_id = ids[-1]
+        total += deleted
+        yield ChunkResult(model_name, merchant_id, deleted, total, time.monotonic() - started)
+
+        if len(ids) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+
+def merchant_cutoffs(merchant_ids, now: Optional[datetime] = None) -> Dict[int, Dict[str, datetime]]:
+    """Cutoff per merchant and policy field, applying per-merchant overrides"""
+    now = now or timezone.now()
+    policies = VisitorRetentionPolicy.objects.in_bulk(list(merchant_ids))
+    return {
+        merchant_id: {
+            target.policy_field: now - timedelta(days=retention_days(policies.get(merchant_id), target.policy_field))
+            for target in TARGETS
+        }
+        for merchant_id in merchant_ids
+    }
+
+
+def prune_all(
+    merchant_ids,
+    chunk_size: int = 5000,
+    archive: Optional[CsvArchive] = None,
+    dry_run: bool = False,
+    pause: float = 0.0,
+    on_chunk: Optional[Callable[[ChunkResult], None]] = None,
+) -> Dict[str, int]:
+    """Prune every target for every merchant; returns rows deleted per model"""
+    totals = {target.model.__name__: 0 for target in TARGETS}
+    for merchant_id, cutoffs in merchant_cutoffs(merchant_ids).items():
+        for target in TARGETS:
+            result = None
+            for result in prune_expired(
+                target, merchant_id, cutoffs[target.policy_field],
+                chunk_size=chunk_size, archive=archive, dry_run=dry_run, pause=pause,
+            ):
+                if on_chunk:
+                    on_chunk(result)
+            if result is not None:
+                totals[result.model_name] += result.total_deleted
+    return totals
@@ -0,0 +1,243 @@
+"""
+Hourly and daily visitor rollups.
+
+Closed hours and days are aggregated once from PageView/VisitorSession into
+VisitorStatsHourly/VisitorStatsDaily, tracked per merchant by
+VisitorRollupCursor. Dashboards read closed buckets from the rollup tables
+and only the buckets after the cursor from the raw tables, so their cost no
+longer grows with the raw history, which can then be expired.
+
+Rolling up is the job of `manage.py rollup_visitor_stats --interval N`. Each
+pass also recomputes the hours that can still receive client-timestamped
+page views (clamped to LATE_EVENT_WINDOW in the past). The read path only
+rolls a merchant up itself when its cursor is more than MAX_READ_LAG behind,
+i.e. when the worker isn't running.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from core.models import Merchant
+from .models import (
+    PageView,
+    VisitorSession,
+    VisitorStatsHourly,
+    VisitorStatsDaily,
+    VisitorRollupCursor,
+)
+
+
+# Client batches may date page views this far back (see visitors.views)
+LATE_EVENT_WINDOW = timedelta(hours=1)
+
+# Hours re-rolled by every pass: the late event window, plus slack for the
+# pass interval and buffered writes
+REROLL_WINDOW = LATE_EVENT_WINDOW + timedelta(minutes=15)
+
+# How far a cursor may lag behind the current hour before a dashboard read
+# rolls the merchant up itself
+MAX_READ_LAG = timedelta(hours=1)
+
+
+def _hour_floor(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _day_floor(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _aggregate(merchant_ids: Optional[Iterable[int]], start: datetime, end: datetime, trunc) -> Dict[Tuple[int, object], dict]:
+    """Visitors, new sessions and page views per (merchant, bucket) in [start, end)"""
+    page_views = PageView.objects.filter(viewed_at__gte=start, viewed_at__lt=end)
+    sessions = VisitorSession.objects.filter(started_at__gte=start, started_at__lt=end)
+    if merchant_ids is not None:
+        page_views = page_views.filter(merchant_id__in=merchant_ids)
+        sessions = sessions.filter(merchant_id__in=merchant_ids)
+
+    buckets: Dict[Tuple[int, object], dict] = {}
+
+    rows = page_views.annotate(bucket=trunc('viewed_at')).values('merchant_id', 'bucket').annotate(
+        page_views=Count('id'),
+        visitors=Count('session_id', distinct=True),
+    )
+    for row in rows:
+        buckets[(row['merchant_id'], row['bucket'])] = {
+            'visitors': row['visitors'],
+            'new_sessions': 0,
+            'page_views': row['page_views'],
+        }
+
+    rows = sessions.annotate(bucket=trunc('started_at')).values('merchant_id', 'bucket').annotate(
+        new_sessions=Count('id'),
+    )
+    for row in rows:
+        totals = buckets.setdefault(
+            (row['merchant_id'], row['bucket']),
+            {'visitors': 0, 'new_sessions': 0, 'page_views': 0},
+        )
+        totals['new_sessions'] = row['new_sessions']
+
+    return buckets
+
+
+def refresh_rollups(merchant_ids: List[int], start: datetime, end: datetime) -> Tuple[int, int]:
+    """Recompute the hourly buckets in [start, end) and the days they close.
+
+    Returns:
+        (hourly_rows, daily_rows) written
+    """
+    start, end = _hour_floor(start), _hour_floor(end)
+    if start >= end:
+        return 0, 0
+
+    hourly = [
+        VisitorStatsHourly(merchant_id=merchant_id, hour=hour, **totals)
+        for (merchant_id, hour), totals in _aggregate(merchant_ids, start, end, TruncHour).items()
+    ]
+
+    # Only whole days that have ended by `end` get a daily row
+    day_start, day_end = _day_floor(start), _day_floor(end)
+    daily = []
+    if day_start < day_end:
+        daily = [
+            VisitorStatsDaily(merchant_id=merchant_id, date=day, **totals)
+            for (merchant_id, day), totals in _aggregate(merchant_ids, day_start, day_end, TruncDate).items()
+        ]
+
+    with transaction.atomic():
+        VisitorStatsHourly.objects.bulk_create(
+            hourly,
+            update_conflicts=True,
+            unique_fields=['merchant', 'hour'],
+            update_fields=['visitors', 'new_sessions', 'page_views', 'updated_at'],
+        )
+        VisitorStatsDaily.objects.bulk_create(
+            daily,
+            update_conflicts=True,
+            unique_fields=['merchant', 'date'],
+            update_fields=['visitors', 'new_sessions', 'page_views', 'updated_at'],
+        )
+
+    return len(hourly), len(daily)
+
+
+def ensure_rolled_up(merchant_ids: List[int], now: Optional[datetime] = None) -> int:
+    """Roll up every closed hour since each merchant's cursor, and re-roll the
+    hours within REROLL_WINDOW that late page views may have changed.
+
+    Merchants without a cursor are backfilled VISITORS_ROLLUP_BACKFILL_DAYS.
+    Returns the number of merchants that were rolled up.
+    """
+    now = now or timezone.now()
+    end = _hour_floor(now)
+    reroll_start = _hour_floor(now - REROLL_WINDOW)
+    backfill_days = getattr(settings, 'VISITORS_ROLLUP_BACKFILL_DAYS', 35)
+    backfill_start = _day_floor(end - timedelta(days=backfill_days))
+
+    cursors = dict(
+        VisitorRollupCursor.objects.filter(merchant_id__in=merchant_ids).values_list('merchant_id', 'rolled_up_to')
+    )
+
+    # Merchants at the same cursor are rolled up together
+    pending: Dict[datetime, List[int]] = {}
+    for merchant_id in merchant_ids:
+        start = min(cursors.get(merchant_id) or backfill_start, reroll_start)
+        if start < end:
+            pending.setdefault(start, []).append(merchant_id)
+
+    for start, ids in pending.items():
+        refresh_rollups(ids, start, end)
+        VisitorRollupCursor.objects.bulk_create(
+            [VisitorRollupCursor(merchant_id=merchant_id, rolled_up_to=end) for merchant_id in ids],
+            update_conflicts=True,
+            unique_fields=['merchant'],
+            update_fields=['rolled_up_to'],
+        )
+
+    return sum(len(ids) for ids in pending.values())
+
+
+def _rolled_up_to(merchant: Optional[Merchant], now: datetime) -> datetime:
+    """Where the rollups read for `merchant` end; later buckets come from the raw tables.
+
+    A merchant whose cursor lags more than MAX_READ_LAG is rolled up first.
+    Totals over all merchants (merchant=None) never roll up on read, since
+    that could backfill every lagging merchant inside one request; they read
+    raw rows from the oldest cursor on instead, and merchants the worker has
+    not reached yet only count from there.
+    """
+    end = _hour_floor(now)
+    if merchant is None:
+        oldest = VisitorRollupCursor.objects.aggregate(oldest=Min('rolled_up_to'))['oldest']
+        return min(oldest or end, end)
+
+    cursor = VisitorRollupCursor.objects.filter(merchant=merchant).values_list('rolled_up_to', flat=True).first()
+    if not cursor or cursor < end - MAX_READ_LAG:
+        ensure_rolled_up([merchant.id], now)
+        return end
+    return min(cursor, end)
+
+
+def daily_totals(merchant: Optional[Merchant], days: int, now: Optional[datetime] = None) -> List[dict]:
+    """Visitors, new sessions and page views for each of the last `days` days.
+
+    Days rolled up by the worker come from VisitorStatsDaily, the rest (today,
+    and yesterday until its row is written) from the raw tables.
+    Passing merchant=None totals all merchants.
+    """
+    now = now or timezone.now()
+    raw_start = _day_floor(_rolled_up_to(merchant, now))
+
+    today_start = _day_floor(now)
+    first_day_start = today_start - timedelta(days=days - 1)
+    first_day = first_day_start.date()
+
+    rolled = VisitorStatsDaily.objects.filter(date__gte=first_day, date__lt=raw_start.date())
+    if merchant:
+        rolled = rolled.filter(merchant=merchant)
+    by_date = {
+        row['date']: row
+        for row in rolled.values('date').annotate(
+            visitors=Sum('visitors'),
+            new_sessions=Sum('new_sessions'),
+            page_views=Sum('page_views'),
+        )
+    }
+
+    raw_rows = _aggregate([merchant.id] if merchant else None, max(raw_start, first_day_start), now + timedelta(seconds=1), TruncDate)
+    for (_, day), totals in raw_rows.items():
+        row = by_date.setdefault(day, {'visitors': 0, 'new_sessions': 0, 'page_views': 0})
+        for field in ('visitors', 'new_sessions', 'page_views'):
+            row[field] += totals[field]
+
+    result = []
+    for offset in range(days):
+        day: date = first_day + timedelta(days=offset)
+        row = by_date.get(day, {})
+        result.append({
+            'date': day,
+            'visitors': row.get('visitors') or 0,
+            'new_sessions': row.get('new_sessions') or 0,
+            'page_views': row.get('page_views') or 0,
+        })
+    return result
+
+
+def new_sessions_since(merchant: Optional[Merchant], since: datetime, now: Optional[datetime] = None) -> int:
+    """Sessions started since `since`, to hour resolution for rolled-up hours"""
+    now = now or timezone.now()
+    raw_start = _rolled_up_to(merchant, now)
+
+    rolled = VisitorStatsHourly.objects.filter(hour__gte=since, hour__lt=raw_start)
+    live = VisitorSession.objects.filter(started_at__gte=max(since, raw_start))
+    if merchant:
+        rolled = rolled.filter(merchant=merchant)
+        live = live.filter(merchant=merchant)
+
+    return (rolled.aggregate(total=Sum('new_sessions'))['total'] or 0) + live.count()
@@ -0,0 +1,109 @@
+"""
+Server-push live visitor counts.
+
+Each worker keeps one channel per merchant. A channel polls the active
+visitor counter on a short interval and pushes to its subscribers only when
+the count changes, so any number of open tabs of a store costs one counter
+read per interval. Only works when served through NomoFlow.asgi.
+"""
+import asyncio
+import json
+from typing import Dict, Optional, Set
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .live_counter import active_visitor_count
+
+
+class MerchantChannel:
+    """Subscribers of one merchant's live count inside this worker"""
+
+    def __init__(self, merchant_id: int):
+        self.merchant_id = merchant_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.last_count: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class LiveCountBroadcaster:
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self._channels: Dict[int, MerchantChannel] = {}
+
+    def subscribe(self, merchant_id: int) -> asyncio.Queue:
+        channel = self._channels.get(merchant_id)
+        if channel is None:
+            channel = self._channels[merchant_id] = MerchantChannel(merchant_id)
+
+        # Holds only the latest count; slow readers skip intermediate values
+        queue = asyncio.Queue(maxsize=1)
+        if channel.last_count is not None:
+            queue.put_nowait(channel.last_count)
+        channel.subscribers.add(queue)
+
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.get_running_loop().create_task(self._poll(channel))
+        return queue
+
+    def unsubscribe(self, merchant_id: int, queue: asyncio.Queue) -> None:
+        channel = self._channels.get(merchant_id)
+        if channel is None:
+            return
+        channel.subscribers.discard(queue)
+        if not channel.subscribers:
+            if channel.task is not None:
+                channel.task.cancel()
+            del self._channels[merchant_id]
+
+    async def _poll(self, channel: MerchantChannel) -> None:
+        count_for = sync_to_async(active_visitor_count)
+        while channel.subscribers:
+            try:
+                count = await count_for(channel.merchant_id)
+            except Exception as e:
+                print(f"Error polling live count for merchant {channel.merchant_id}: {e}")
+                count = channel.last_count
+
+            if count is not None and count != channel.last_count:
+                channel.last_count = count
+                for queue in list(channel.subscribers):
+                    if queue.full():
+                        queue.get_nowait()
+                    queue.put_nowait(count)
+
+            await asyncio.sleep(self.poll_interval)
+
+
+broadcaster = LiveCountBroadcaster(
+    poll_interval=getattr(settings, 'VISITORS_STREAM_POLL_SECONDS', 2.0),
+)
+
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+async def live_count_events(merchant_id: int):
+    """Async iterator of SSE frames for one subscriber"""
+    keepalive = getattr(settings, 'VISITORS_STREAM_KEEPALIVE_SECONDS', 15)
+    max_duration = getattr(settings, 'VISITORS_STREAM_MAX_SECONDS', 300)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max_duration
+    queue = broadcaster.subscribe(merchant_id)
+    try:
+        # Reconnect quickly when we close the stream at max_duration
+        yield "retry: 1000\n\n"
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                count = await asyncio.wait_for(queue.get(), timeout=min(keepalive, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield _sse('count', {'count': count})
+    finally:
+        broadcaster.unsubscribe(merchant_id, queue)
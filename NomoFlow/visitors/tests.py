@@ -1,3 +1,448 @@
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db import OperationalError
 from django.test import TestCase
+from django.utils import timezone as django_timezone
+
+from core.models import Merchant
+from core.utils import invalidate_store_merchant
+from features.flags import invalidate_feature_flags
+from features.models import Feature, MerchantFeature
+from .enrichment import IpCountryTable, enrichment_buffer, write_ip_country_table
+from .hll import HyperLogLog, sketch_buffer
+from .ingest import HeartbeatBuffer, SessionDelta, write_visits
+from .live_counter import DjangoCacheBackend, SlidingWindow
+from .models import PageView, VisitorRetentionPolicy, VisitorRollupCursor, VisitorSession, VisitorStatsDaily, VisitorStatsHourly
+from .retention import TARGETS, prune_all, prune_expired
+from .rollups import daily_totals, ensure_rolled_up, new_sessions_since
+from .top_pages import MerchantLeaderboard, SpaceSaving, TopPagesIndex, top_pages
+
+
+class SpaceSavingTests(TestCase):
+    def test_exact_counts_within_capacity(self):
+        summary = SpaceSaving(capacity=3)
+        for item in ["a", "b", "a", "c", "a", "b"]:
+            summary.add(item)
+        self.assertEqual(summary.counts, {"a": 3, "b": 2, "c": 1})
+        self.assertEqual(summary.top(1), [{"path": "a", "count": 3, "error": 0}])
+
+    def test_eviction_inherits_minimum_count(self):
+        summary = SpaceSaving(capacity=2)
+        for item in ["a", "a", "b", "c"]:
+            summary.add(item)
+        # "b" (count 1) was evicted; "c" over-estimates by that count
+        self.assertEqual(summary.counts, {"a": 2, "c": 2})
+        self.assertEqual(summary.errors["c"], 1)
+
+    def test_heavy_hitter_survives_churn(self):
+        summary = SpaceSaving(capacity=5)
+        for i in range(1000):
+            summary.add("hot" if i % 3 == 0 else f"cold-{i}")
+        self.assertEqual(summary.top(1)[0]["path"], "hot")
+
+
+class MerchantLeaderboardTests(TestCase):
+    def test_previous_epoch_is_kept_for_one_rotation(self):
+        board = MerchantLeaderboard(capacity=10, epoch_seconds=300)
+        board.rotate(1000)
+        board.current.add("/a")
+        board.rotate(1300)
+        board.current.add("/b")
+        self.assertEqual({entry["path"] for entry in board.top(10)}, {"/a", "/b"})
+        board.rotate(1600)
+        self.assertEqual([entry["path"] for entry in board.top(10)], ["/b"])
+
+    def test_gap_of_several_epochs_clears_both(self):
+        board = MerchantLeaderboard(capacity=10, epoch_seconds=300)
+        board.rotate(1000)
+        board.current.add("/a")
+        board.rotate(5000)
+        self.assertEqual(board.top(10), [])
+
+    def test_backwards_timestamp_keeps_leaderboard(self):
+        index = TopPagesIndex(capacity=10, epoch_seconds=300)
+        index.add(1, "/a", now=10_000)
+        index.add(1, "/b", now=10_300)
+        # A sample an hour in the past must not wipe current and previous
+        index.add(1, "/late", now=6_700)
+        top = {entry["path"]: entry["count"] for entry in index.top(1, now=10_300)}
+        self.assertEqual(top, {"/a": 1, "/b": 1, "/late": 1})
+
+
+class SlidingWindowTests(TestCase):
+    def test_counts_distinct_sessions(self):
+        window = SlidingWindow(10)
+        window.touch(1, 100)
+        window.touch(1, 101)
+        window.touch(2, 102)
+        self.assertEqual(window.count(102), 2)
+
+    def test_sessions_expire_after_their_last_touch(self):
+        window = SlidingWindow(10)
+        window.touch(1, 100)
+        window.touch(2, 100)
+        window.touch(1, 105)
+        self.assertEqual(window.count(110), 1)
+        self.assertEqual(window.count(115), 0)
+
+    def test_touch_older_than_window_is_ignored(self):
+        window = SlidingWindow(10)
+        window.touch(1, 100)
+        window.touch(2, 90)
+        self.assertEqual(window.count(100), 1)
+
+
+class DjangoCacheBackendTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = DjangoCacheBackend(60, bucket_seconds=10)
+
+    def test_session_is_counted_once_across_buckets(self):
+        for second in (1000, 1005, 1012, 1031):
+            self.backend.touch(1, 42, second)
+        self.backend.touch(1, 43, 1031)
+        self.assertEqual(self.backend.count(1, 1031), 2)
+
+    def test_sessions_leave_with_their_bucket(self):
+        self.backend.touch(1, 42, 1000)
+        self.backend.touch(1, 43, 1040)
+        self.assertEqual(self.backend.count(1, 1055), 2)
+        self.assertEqual(self.backend.count(1, 1060), 1)
+        self.assertEqual(self.backend.count(1, 1100), 0)
+
+    def test_concurrent_heartbeats_are_not_lost(self):
+        def heartbeat(first):
+            for key in range(first, first + 50):
+                self.backend.touch(1, key, 1000)
+
+        threads = [threading.Thread(target=heartbeat, args=(n * 50,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.backend.count(1, 1000), 400)
+
+    def test_reconcile_adds_other_workers_sessions(self):
+        self.backend.touch(1, 42, 1000)
+        self.backend.reconcile(1, [(42, 995), (43, 1010), (44, 900)], 1020)
+        self.assertEqual(self.backend.count(1, 1020), 2)
+        self.assertEqual(self.backend.last_reconciled(1), 1020)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="300")
+
+    def visit(self, session_id, at):
+        VisitorSession.objects.create(merchant=self.merchant, session_id=session_id, started_at=at, last_seen_at=at)
+        PageView.objects.create(merchant=self.merchant, session_id=session_id, path="/", viewed_at=at)
+
+    def at(self, day, hour, minute=0):
+        return datetime(2026, 3, day, hour, minute, tzinfo=dt_timezone.utc)
+
+    def test_pass_rerolls_hours_open_to_late_events(self):
+        self.visit("a", self.at(10, 9, 10))
+        ensure_rolled_up([self.merchant.id], self.at(10, 10, 20))
+        # A batch sent at 10:25 dates a page view 9:40
+        self.visit("b", self.at(10, 9, 40))
+        ensure_rolled_up([self.merchant.id], self.at(10, 10, 25))
+
+        hour = VisitorStatsHourly.objects.get(merchant=self.merchant, hour=self.at(10, 9))
+        self.assertEqual((hour.visitors, hour.page_views), (2, 2))
+
+    def test_read_path_leaves_rolling_up_to_the_worker(self):
+        VisitorRollupCursor.objects.create(merchant=self.merchant, rolled_up_to=self.at(10, 9))
+        self.visit("a", self.at(10, 9, 30))
+
+        now = self.at(10, 10, 5)
+        self.assertEqual(daily_totals(self.merchant, days=1, now=now)[0]["visitors"], 1)
+        self.assertEqual(new_sessions_since(self.merchant, self.at(10, 0), now=now), 1)
+        self.assertFalse(VisitorStatsHourly.objects.exists())
+        self.assertEqual(VisitorRollupCursor.objects.get(merchant=self.merchant).rolled_up_to, self.at(10, 9))
+
+    def test_read_path_rolls_up_when_the_worker_lags(self):
+        VisitorRollupCursor.objects.create(merchant=self.merchant, rolled_up_to=self.at(10, 6))
+        self.visit("a", self.at(10, 7, 30))
+
+        self.assertEqual(new_sessions_since(self.merchant, self.at(10, 0), now=self.at(10, 10, 5)), 1)
+        self.assertEqual(VisitorRollupCursor.objects.get(merchant=self.merchant).rolled_up_to, self.at(10, 10))
+        self.assertTrue(VisitorStatsHourly.objects.filter(hour=self.at(10, 7)).exists())
+
+    def test_all_merchant_totals_never_roll_up_on_read(self):
+        other = Merchant.objects.create(name="Other", salla_merchant_id="301")
+        VisitorRollupCursor.objects.create(merchant=self.merchant, rolled_up_to=self.at(10, 6))
+        self.visit("a", self.at(10, 7, 30))
+        VisitorSession.objects.create(merchant=other, session_id="b", started_at=self.at(10, 8), last_seen_at=self.at(10, 8))
+
+        self.assertEqual(new_sessions_since(None, self.at(10, 0), now=self.at(10, 10, 5)), 2)
+        self.assertEqual(daily_totals(None, days=1, now=self.at(10, 10, 5))[0]["new_sessions"], 2)
+        self.assertFalse(VisitorStatsHourly.objects.exists())
+        self.assertEqual(VisitorRollupCursor.objects.count(), 1)
+
+    def test_day_not_yet_rolled_up_is_read_raw(self):
+        self.visit("a", self.at(9, 12))
+        ensure_rolled_up([self.merchant.id], self.at(9, 23, 30))
+        self.visit("b", self.at(9, 23, 40))
+
+        days = daily_totals(self.merchant, days=2, now=self.at(10, 0, 10))
+        self.assertFalse(VisitorStatsDaily.objects.exists())
+        self.assertEqual([day["visitors"] for day in days], [2, 0])
+
+        ensure_rolled_up([self.merchant.id], self.at(10, 0, 15))
+        self.assertEqual(VisitorStatsDaily.objects.get(merchant=self.merchant).visitors, 2)
+        self.assertEqual([day["visitors"] for day in daily_totals(self.merchant, days=2, now=self.at(10, 0, 20))], [2, 0])
+
+
+class HyperLogLogTests(TestCase):
+    def test_empty_sketch_counts_zero(self):
+        self.assertEqual(HyperLogLog().count(), 0)
+
+    def test_estimate_is_close(self):
+        sketch = HyperLogLog()
+        for i in range(20000):
+            sketch.add(f"session-{i}")
+            sketch.add(f"session-{i}")
+        self.assertAlmostEqual(sketch.count(), 20000, delta=20000 * 0.05)
+
+    def test_merge_estimates_the_union(self):
+        monday, tuesday, union = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for i in range(6000):
+            (monday if i < 4000 else tuesday).add(f"s{i}")
+            union.add(f"s{i}")
+        # Sessions seen on both days count once
+        for i in range(3000, 4000):
+            tuesday.add(f"s{i}")
+
+        monday.merge(tuesday)
+        self.assertEqual(monday.to_bytes(), union.to_bytes())
+        self.assertAlmostEqual(monday.count(), 6000, delta=6000 * 0.05)
+
+    def test_round_trips_through_bytes(self):
+        sketch = HyperLogLog()
+        sketch.add("a")
+        self.assertEqual(HyperLogLog.from_bytes(sketch.to_bytes()).registers, sketch.registers)
+        with self.assertRaises(ValueError):
+            HyperLogLog(b"short")
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="500")
+        self.other = Merchant.objects.create(name="Other", salla_merchant_id="501")
+        # prune_all cuts off from the current time
+        self.now = django_timezone.now()
+        old, recent = self.now - timedelta(days=100), self.now - timedelta(days=1)
+        rows = []
+        for i in range(10):
+            rows.append(PageView(merchant=self.merchant, session_id=f"old{i}", path="/", viewed_at=old))
+            rows.append(PageView(merchant=self.merchant, session_id=f"new{i}", path="/", viewed_at=recent))
+            rows.append(PageView(merchant=self.other, session_id=f"other{i}", path="/", viewed_at=old))
+        PageView.objects.bulk_create(rows)
+        self.page_views = TARGETS[0]
+        self.cutoff = self.now - timedelta(days=90)
+
+    def test_deletes_expired_rows_in_pk_chunks(self):
+        chunks = list(prune_expired(self.page_views, self.merchant.id, self.cutoff, chunk_size=3))
+
+        self.assertEqual([chunk.deleted for chunk in chunks], [3, 3, 3, 1])
+        self.assertEqual(chunks[-1].total_deleted, 10)
+        self.assertEqual(PageView.objects.filter(merchant=self.merchant).count(), 10)
+        self.assertFalse(PageView.objects.filter(merchant=self.merchant, session_id__startswith="old").exists())
+        self.assertEqual(PageView.objects.filter(merchant=self.other).count(), 10)
+
+    def test_dry_run_deletes_nothing(self):
+        chunks = list(prune_expired(self.page_views, self.merchant.id, self.cutoff, chunk_size=4, dry_run=True))
+        self.assertEqual(chunks[-1].total_deleted, 10)
+        self.assertEqual(PageView.objects.count(), 30)
+
+    def test_merchant_policy_overrides_the_default(self):
+        VisitorRetentionPolicy.objects.create(merchant=self.other, page_view_days=365)
+        totals = prune_all([self.merchant.id, self.other.id], chunk_size=4)
+        self.assertEqual(totals["PageView"], 10)
+        self.assertEqual(PageView.objects.filter(merchant=self.other).count(), 10)
+
+
+class IpCountryTableTests(TestCase):
+    def setUp(self):
+        def ip(address):
+            return int(ipaddress.ip_address(address))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "ip-country.bin")
+        # Written out of order; the table sorts its ranges
+        write_ip_country_table([
+            (ip("5.0.0.0"), ip("5.255.255.255"), "sa"),
+            (ip("1.0.0.0"), ip("1.0.0.255"), "AE"),
+            (ip("2.0.0.0"), ip("2.0.255.255"), "EG"),
+        ], path)
+        self.table = IpCountryTable(path)
+        self.addCleanup(self.table._map.close)
+
+    def test_finds_the_range_of_an_address(self):
+        self.assertEqual(self.table.size, 3)
+        self.assertEqual(self.table.lookup("1.0.0.0"), "AE")
+        self.assertEqual(self.table.lookup("1.0.0.255"), "AE")
+        self.assertEqual(self.table.lookup("2.0.128.1"), "EG")
+        self.assertEqual(self.table.lookup("5.255.255.255"), "SA")
+
+    def test_addresses_outside_every_range(self):
+        for address in ("0.255.255.255", "1.0.1.0", "4.0.0.1", "6.0.0.0"):
+            self.assertIsNone(self.table.lookup(address))
+
+    def test_ipv6(self):
+        self.assertEqual(self.table.lookup("::ffff:2.0.0.1"), "EG")
+        self.assertIsNone(self.table.lookup("2001:db8::1"))
+        self.assertIsNone(self.table.lookup("not an ip"))
+
+
+class TrackBatchTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="store-batch")
+        invalidate_store_merchant("store-batch")
+
+    def tearDown(self):
+        # Write what the views buffered while the test database still exists
+        sketch_buffer.flush()
+        enrichment_buffer.flush()
+
+    def test_back_dated_events_keep_the_top_pages_leaderboard(self):
+        top_pages.add(self.merchant.id, "/home")
+        hour_ago_ms = (time.time() - 3600) * 1000
+        response = self.client.post(
+            "/visitors/track/batch/",
+            json.dumps({
+                "store_id": "store-batch",
+                "session_id": "s1",
+                "events": [{"page": "/old", "viewed_at": hour_ago_ms}, {"page": "/new"}],
+            }),
+            content_type="text/plain",
+        )
+        self.assertEqual(response.json(), {"success": True, "recorded": 2})
+        paths = {entry["path"] for entry in top_pages.top(self.merchant.id)}
+        self.assertTrue({"/home", "/old", "/new"} <= paths)
+        self.assertEqual(PageView.objects.filter(merchant=self.merchant).count(), 2)
+
+
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="store-heartbeat")
+        invalidate_store_merchant("store-heartbeat")
+        invalidate_feature_flags(self.merchant.id)
+        self.feature = Feature.objects.create(key="live_counter", title="Live View Counter")
+
+    def tearDown(self):
+        sketch_buffer.flush()
+        enrichment_buffer.flush()
+
+    def heartbeat(self, session_id="s1"):
+        return self.client.post("/visitors/heartbeat/", json.dumps({
+            "store_id": "store-heartbeat", "session_id": session_id, "page": "/products",
+        }), content_type="application/json")
+
+    def test_enabled_store_gets_the_live_count(self):
+        MerchantFeature.objects.create(merchant=self.merchant, feature=self.feature, is_enabled=True)
+        self.heartbeat("s1")
+        response = self.heartbeat("s2")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data["enabled"])
+        self.assertEqual(data["active_visitors"], 2)
+        self.assertGreater(data["next_interval_ms"], 0)
+        self.assertEqual(VisitorSession.objects.filter(merchant=self.merchant).count(), 2)
+
+    def test_disabled_store_is_not_tracked(self):
+        MerchantFeature.objects.create(merchant=self.merchant, feature=self.feature, is_enabled=False)
+        response = self.heartbeat()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"success": True, "enabled": False})
+        self.assertFalse(VisitorSession.objects.exists())
+
+    def test_unknown_store(self):
+        response = self.client.post("/visitors/heartbeat/", json.dumps({
+            "store_id": "nope", "session_id": "s1",
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+
+class WriteVisitsTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="650")
+        self.start = django_timezone.now()
+
+    def visit(self, path=None, seconds=0, session_id="s1"):
+        now = self.start + timedelta(seconds=seconds)
+        views = [PageView(merchant=self.merchant, session_id=session_id, path=path, viewed_at=now)] if path else []
+        delta = SessionDelta(now)
+        delta.add(views, now)
+        write_visits({(self.merchant.id, session_id): delta}, views)
+
+    def session(self):
+        session = VisitorSession.objects.get(merchant=self.merchant, session_id="s1")
+        return session.page_count, session.first_path, session.last_path, session.duration_seconds
+
+    def check_running_metrics(self):
+        self.visit("/home")
+        self.assertEqual(self.session(), (1, "/home", "/home", 0))
+        self.visit("/products", seconds=25)
+        self.visit("/cart", seconds=60)
+        self.assertEqual(self.session(), (3, "/home", "/cart", 60))
+        # A heartbeat without a page view only extends the session
+        self.visit(seconds=90)
+        self.assertEqual(self.session(), (3, "/home", "/cart", 90))
+        self.assertEqual(PageView.objects.filter(merchant=self.merchant).count(), 3)
+
+    def test_running_metrics_across_writes(self):
+        self.check_running_metrics()
+
+    def test_orm_fallback_keeps_the_same_metrics(self):
+        with mock.patch.dict("visitors.ingest._DURATION_SQL", clear=True):
+            self.check_running_metrics()
+
+    def test_out_of_order_heartbeat_does_not_shrink_the_session(self):
+        self.visit("/home")
+        self.visit("/cart", seconds=60)
+        self.visit(seconds=30)
+        session = VisitorSession.objects.get(merchant=self.merchant, session_id="s1")
+        self.assertEqual(session.last_seen_at, self.start + timedelta(seconds=60))
+        self.assertEqual(session.duration_seconds, 60)
+
+
+class HeartbeatBufferTests(TestCase):
+    def setUp(self):
+        self.merchant = Merchant.objects.create(name="Store", salla_merchant_id="600")
+        self.buffer = HeartbeatBuffer(flush_interval=3600, max_pending=100, max_retries=2)
+        self.buffer._ensure_started = lambda: None
+        self.now = django_timezone.now()
+
+    def heartbeat(self, path, seconds=0):
+        self.buffer.add(self.merchant.id, "s1", path, self.now + timedelta(seconds=seconds))
+
+    def test_failed_flush_is_retried_with_the_next(self):
+        self.heartbeat("/a")
+        with mock.patch("visitors.ingest.write_visits", side_effect=OperationalError("database is locked")):
+            self.assertEqual(self.buffer.flush(), (0, 0))
+        self.heartbeat("/b", seconds=10)
+
+        self.assertEqual(self.buffer.flush(), (1, 2))
+        session = VisitorSession.objects.get(merchant=self.merchant, session_id="s1")
+        self.assertEqual((session.page_count, session.first_path, session.last_path), (2, "/a", "/b"))
+        self.assertEqual(PageView.objects.filter(merchant=self.merchant).count(), 2)
 
-# Create your tests here.
+    def test_batch_is_dropped_after_max_retries(self):
+        self.heartbeat("/a")
+        with mock.patch("visitors.ingest.write_visits", side_effect=OperationalError("database is locked")):
+            for _ in range(3):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending_count(), 0)
+        self.assertEqual(self.buffer.flush(), (0, 0))
@@ -0,0 +1,134 @@
+"""
+Streaming top-pages leaderboard.
+
+Each merchant keeps a Space-Saving heavy-hitters summary of page paths,
+updated by the heartbeat stream. A summary tracks at most `capacity` paths
+no matter how many distinct paths a store has, and every update is O(1):
+counts only grow by one, so paths are kept in per-count buckets and the
+minimum count moves at most one step per update.
+
+To reflect what is hot right now rather than all time, summaries rotate
+every epoch and the leaderboard combines the current and previous epoch.
+Leaderboards are per worker process.
+"""
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from django.conf import settings
+
+from .page_viewers import normalize_path
+
+
+class SpaceSaving:
+    """Top-k frequent items in bounded memory (Metwally et al.)"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._buckets: Dict[int, Set[str]] = {}
+        self._min = 0
+
+    def add(self, item: str) -> None:
+        count = self.counts.get(item)
+        if count is not None:
+            self._move(item, count, count + 1)
+            return
+
+        if len(self.counts) < self.capacity:
+            self.counts[item] = 1
+            self.errors[item] = 0
+            self._buckets.setdefault(1, set()).add(item)
+            self._min = 1
+            return
+
+        # Evict one of the least frequent items and inherit its count as error
+        evicted = next(iter(self._buckets[self._min]))
+        floor = self._min
+        self._buckets[floor].discard(evicted)
+        del self.counts[evicted]
+        del self.errors[evicted]
+
+        self.counts[item] = floor + 1
+        self.errors[item] = floor
+        self._buckets.setdefault(floor + 1, set()).add(item)
+        if not self._buckets[floor]:
+            del self._buckets[floor]
+            self._min = floor + 1
+
+    def _move(self, item: str, old: int, new: int) -> None:
+        bucket = self._buckets[old]
+        bucket.discard(item)
+        if not bucket:
+            del self._buckets[old]
+            if self._min == old:
+                self._min = new
+        self._buckets.setdefault(new, set()).add(item)
+        self.counts[item] = new
+
+    def top(self, n: int) -> List[dict]:
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+        return [{'path': item, 'count': count, 'error': self.errors[item]} for item, count in ranked]
+
+
+class MerchantLeaderboard:
+    def __init__(self, capacity: int, epoch_seconds: int):
+        self.capacity = capacity
+        self.epoch_seconds = epoch_seconds
+        self.epoch: Optional[int] = None
+        self.current = SpaceSaving(capacity)
+        self.previous = SpaceSaving(capacity)
+
+    def rotate(self, now: float) -> None:
+        epoch = int(now) // self.epoch_seconds
+        if self.epoch is not None and epoch <= self.epoch:
+            # Same epoch, or a late or clock-skewed sample: counted into current
+            return
+        if self.epoch is not None and epoch == self.epoch + 1:
+            self.previous = self.current
+        else:
+            self.previous = SpaceSaving(self.capacity)
+        self.current = SpaceSaving(self.capacity)
+        self.epoch = epoch
+
+    def top(self, n: int) -> List[dict]:
+        combined: Dict[str, dict] = {}
+        for summary in (self.previous, self.current):
+            for item, count in summary.counts.items():
+                entry = combined.setdefault(item, {'path': item, 'count': 0, 'error': 0})
+                entry['count'] += count
+                entry['error'] += summary.errors[item]
+        return sorted(combined.values(), key=lambda entry: entry['count'], reverse=True)[:n]
+
+
+class TopPagesIndex:
+    def __init__(self, capacity: int = 100, epoch_seconds: int = 300):
+        self.capacity = capacity
+        self.epoch_seconds = epoch_seconds
+        self._lock = threading.Lock()
+        self._merchants: Dict[int, MerchantLeaderboard] = {}
+
+    def add(self, merchant_id: int, path: str, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.time()
+        with self._lock:
+            board = self._merchants.get(merchant_id)
+            if board is None:
+                board = self._merchants[merchant_id] = MerchantLeaderboard(self.capacity, self.epoch_seconds)
+            board.rotate(now)
+            board.current.add(normalize_path(path))
+
+    def top(self, merchant_id: int, n: int = 10, now: Optional[float] = None) -> List[dict]:
+        now = now if now is not None else time.time()
+        with self._lock:
+            board = self._merchants.get(merchant_id)
+            if board is None:
+                return []
+            board.rotate(now)
+            return board.top(n)
+
+
+top_pages = TopPagesIndex(
+    capacity=getattr(settings, 'VISITORS_TOP_PAGES_CAPACITY', 100),
+    epoch_seconds=getattr(settings, 'VISITORS_TOP_PAGES_EPOCH_SECONDS', 300),
+)
@@ -8,6 +8,10 @@ urlpatterns = [
     path('toggle/', views.toggle_feature, name='toggle_feature'),
     path('is-enabled/', views.is_feature_enabled, name='is_feature_enabled'),
     path('track/', views.track_visit, name='track_visit'),
+    path('track/batch/', views.track_batch, name='track_batch'),
+    path('heartbeat/', views.heartbeat, name='heartbeat'),
     path('live-count/', views.get_live_count, name='get_live_count'),
+    path('live-count/stream/', views.live_count_stream, name='live_count_stream'),
+    path('page-viewers/', views.get_page_viewers, name='get_page_viewers'),
     path('live-counter.js', views.live_counter_embed_js, name='live_counter_embed_js'),
 ]
@@ -1,14 +1,25 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils import timezone
 from django.db.models import Count
-from datetime import timedelta
-from core.utils import get_current_merchant
-from core.models import Merchant
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from core.utils import resolve_store_merchant
 from .models import VisitorSession, PageView
+from .ingest import SessionDelta, heartbeat_buffer, is_buffered_mode, write_visits
+from .enrichment import queue_enrichment
+from .live_counter import active_visitor_count, record_heartbeat
+from .stream import live_count_events
+from .heartbeat import heartbeat_rate, next_interval_ms
+from .rollups import LATE_EVENT_WINDOW, daily_totals, new_sessions_since
+from .hll import record_unique_visitor
+from .page_viewers import normalize_path, page_viewers
+from .top_pages import top_pages
 from features.models import MerchantFeature, Feature
+from features import flags
 import json
 import hashlib
 import uuid
@@ -16,7 +27,7 @@ import uuid
 
 def live_view_counter_page(request):
     """Dashboard page for live view counter"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return redirect('dashboard')
     
@@ -36,32 +47,17 @@ def live_view_counter_page(request):
     )
     
     # Get active sessions (last 5 minutes)
-    active_threshold = timezone.now() - timedelta(minutes=5)
-    active_sessions = VisitorSession.objects.filter(
-        merchant=merchant,
-        last_seen_at__gte=active_threshold
-    ).count()
+    active_sessions = active_visitor_count(merchant.id)
     
     # Get stats
     now = timezone.now()
-    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    today_sessions = VisitorSession.objects.filter(
-        merchant=merchant,
-        started_at__gte=today_start
-    ).count()
-    
-    today_views = PageView.objects.filter(
-        merchant=merchant,
-        viewed_at__gte=today_start
-    ).count()
+    today = daily_totals(merchant, days=1, now=now)[0]
+    today_sessions = today['new_sessions']
+    today_views = today['page_views']
     
     # Last 24 hours
     last_24h = now - timedelta(hours=24)
-    sessions_24h = VisitorSession.objects.filter(
-        merchant=merchant,
-        started_at__gte=last_24h
-    ).count()
+    sessions_24h = new_sessions_since(merchant, last_24h, now=now)
     
     context = {
         'merchant': merchant,
@@ -78,7 +74,7 @@ def live_view_counter_page(request):
 @require_http_methods(["POST"])
 def toggle_feature(request):
     """Toggle live view counter feature on/off"""
-    merchant = get_current_merchant(request)
+    merchant = request.merchant
     if not merchant:
         return JsonResponse({'success': False, 'message': 'No merchant selected'}, status=400)
     
@@ -121,33 +117,90 @@ def is_feature_enabled(request):
         response['Access-Control-Allow-Origin'] = '*'
         return response
     
-    try:
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        feature = Feature.objects.filter(key='live_counter').first()
-        
-        if not feature:
-            response = JsonResponse({'enabled': False})
-            response['Access-Control-Allow-Origin'] = '*'
-            return response
-        
-        merchant_feature = MerchantFeature.objects.filter(
-            merchant=merchant,
-            feature=feature
-        ).first()
-        
-        if not merchant_feature:
-            response = JsonResponse({'enabled': False})
-            response['Access-Control-Allow-Origin'] = '*'
-            return response
-        
-        response = JsonResponse({'enabled': merchant_feature.is_enabled})
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
+        response = JsonResponse({'enabled': False, 'message': 'Store not found'})
         response['Access-Control-Allow-Origin'] = '*'
         return response
-        
-    except Merchant.DoesNotExist:
-        response = JsonResponse({'enabled': False, 'message': 'Store not found'})
+    
+    feature = Feature.objects.filter(key='live_counter').first()
+    
+    if not feature:
+        response = JsonResponse({'enabled': False})
         response['Access-Control-Allow-Origin'] = '*'
         return response
+    
+    merchant_feature = MerchantFeature.objects.filter(
+        merchant=merchant,
+        feature=feature
+    ).first()
+    
+    if not merchant_feature:
+        response = JsonResponse({'enabled': False})
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    response = JsonResponse({'enabled': merchant_feature.is_enabled})
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+MAX_BATCH_EVENTS = 50
+
+
+def _record_visit(merchant, session_id, page_path, now, page_views=None):
+    """Record one visit of a session: in-memory counters, session and page views.
+    
+    page_views defaults to a single view of page_path at now; pass a list to
+    record a client-side batch instead, or an empty list to only touch the session.
+    """
+    if page_views is None:
+        page_views = [PageView(merchant=merchant, session_id=session_id, path=page_path, viewed_at=now)]
+    
+    record_heartbeat(merchant.id, session_id, now)
+    record_unique_visitor(merchant.id, session_id, now)
+    page_viewers.touch(merchant.id, session_id, page_path, now)
+    for view in page_views:
+        top_pages.add(merchant.id, view.path, now.timestamp())
+    
+    if is_buffered_mode():
+        # Write-behind: session and page views are flushed in bulk by the buffer
+        heartbeat_buffer.add_page_views(merchant.id, session_id, page_views, now)
+        return
+    
+    delta = SessionDelta(now)
+    delta.add(page_views, now)
+    write_visits({(merchant.id, session_id): delta}, page_views)
+
+
+def _parse_page_view_events(merchant, session_id, events, now):
+    """PageView objects for a client-side batch, timestamps clamped to the last hour"""
+    if not isinstance(events, list):
+        return []
+    
+    earliest = now - LATE_EVENT_WINDOW
+    views = []
+    for event in events[:MAX_BATCH_EVENTS]:
+        if not isinstance(event, dict):
+            continue
+        
+        viewed_at = now
+        timestamp = event.get('viewed_at')
+        if isinstance(timestamp, (int, float)):
+            try:
+                viewed_at = datetime.fromtimestamp(timestamp / 1000, tz=dt_timezone.utc)
+            except (OverflowError, OSError, ValueError):
+                pass
+            viewed_at = min(max(viewed_at, earliest), now)
+        
+        views.append(PageView(
+            merchant=merchant,
+            session_id=session_id,
+            path=str(event.get('page') or '/')[:300],
+            referrer=str(event.get('referrer'))[:300] if event.get('referrer') else None,
+            viewed_at=viewed_at,
+        ))
+    return views
 
 
 @require_http_methods(["POST"])
@@ -163,52 +216,108 @@ def track_visit(request):
         if not store_id or not session_id:
             return JsonResponse({'success': False, 'message': 'Missing required fields'}, status=400)
         
-        try:
-            merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        except Merchant.DoesNotExist:
+        merchant = resolve_store_merchant(store_id)
+        if merchant is None:
             return JsonResponse({'success': False, 'message': 'Store not found'}, status=404)
         
         now = timezone.now()
+        _record_visit(merchant, session_id, page_path, now)
+        queue_enrichment(request, merchant.id, session_id, data.get('referrer'))
         
-        # Update or create visitor session
-        session, created = VisitorSession.objects.update_or_create(
-            merchant=merchant,
-            session_id=session_id,
-            defaults={
-                'started_at': now,
-                'last_seen_at': now,
-            }
-        )
+        return JsonResponse({
+            'success': True,
+            'active_visitors': active_visitor_count(merchant.id, now)
+        })
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        print(f"Error in track_visit: {e}")
+        return JsonResponse({'success': False, 'message': 'An error occurred'}, status=500)
+
+
+@require_http_methods(["POST"])
+@csrf_exempt
+def heartbeat(request):
+    """Record a visit and return the live count, enabled flag and next interval.
+    
+    Replaces the separate is-enabled, track and live-count calls of the embed.
+    """
+    try:
+        data = json.loads(request.body)
+        store_id = data.get('store_id')
+        session_id = data.get('session_id')
+        page_path = data.get('page', '/')
         
-        # Always update last_seen_at for existing sessions
-        if not created:
-            session.last_seen_at = now
-            session.save(update_fields=['last_seen_at'])
+        if not store_id or not session_id:
+            return JsonResponse({'success': False, 'message': 'Missing required fields'}, status=400)
         
-        # Track page view
-        PageView.objects.create(
-            merchant=merchant,
-            session_id=session_id,
-            path=page_path,
-            viewed_at=now
-        )
+        merchant = resolve_store_merchant(store_id)
+        if merchant is None:
+            return JsonResponse({'success': False, 'enabled': False, 'message': 'Store not found'}, status=404)
         
-        # Get active visitor count
-        active_threshold = now - timedelta(minutes=5)
-        active_count = VisitorSession.objects.filter(
-            merchant=merchant,
-            last_seen_at__gte=active_threshold
-        ).count()
+        if not flags.is_feature_enabled(merchant.id, 'live_counter'):
+            return JsonResponse({'success': True, 'enabled': False})
+        
+        heartbeat_rate.mark()
+        now = timezone.now()
+        
+        # Embeds that batch page views send them along; the heartbeat itself
+        # then only keeps the session alive
+        page_views = None
+        if 'events' in data or data.get('count_page_view') is False:
+            page_views = _parse_page_view_events(merchant, session_id, data.get('events'), now)
+        _record_visit(merchant, session_id, page_path, now, page_views=page_views)
+        queue_enrichment(request, merchant.id, session_id, data.get('referrer'))
+        active_count = active_visitor_count(merchant.id, now)
         
         return JsonResponse({
             'success': True,
-            'active_visitors': active_count
+            'enabled': True,
+            'active_visitors': active_count,
+            'page_viewers': page_viewers.count(merchant.id, page_path, now),
+            'next_interval_ms': next_interval_ms(active_count),
         })
         
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
     except Exception as e:
-        print(f"Error in track_visit: {e}")
+        print(f"Error in heartbeat: {e}")
+        return JsonResponse({'success': False, 'message': 'An error occurred'}, status=500)
+
+
+@require_http_methods(["POST"])
+@csrf_exempt
+def track_batch(request):
+    """Record a batch of page views of one session.
+    
+    Accepts navigator.sendBeacon payloads, which arrive as text/plain JSON:
+    {"store_id", "session_id", "events": [{"page", "referrer", "viewed_at" (ms)}]}
+    """
+    try:
+        data = json.loads(request.body)
+        store_id = data.get('store_id')
+        session_id = data.get('session_id')
+        
+        if not store_id or not session_id:
+            return JsonResponse({'success': False, 'message': 'Missing required fields'}, status=400)
+        
+        merchant = resolve_store_merchant(store_id)
+        if merchant is None:
+            return JsonResponse({'success': False, 'message': 'Store not found'}, status=404)
+        
+        now = timezone.now()
+        page_views = _parse_page_view_events(merchant, session_id, data.get('events'), now)
+        if page_views:
+            _record_visit(merchant, session_id, page_views[-1].path, now, page_views=page_views)
+            queue_enrichment(request, merchant.id, session_id, page_views[0].referrer)
+        
+        return JsonResponse({'success': True, 'recorded': len(page_views)})
+        
+    except json.JSONDecodeError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON'}, status=400)
+    except Exception as e:
+        print(f"Error in track_batch: {e}")
         return JsonResponse({'success': False, 'message': 'An error occurred'}, status=500)
 
 
@@ -222,24 +331,65 @@ def get_live_count(request):
         response['Access-Control-Allow-Origin'] = '*'
         return response
     
-    try:
-        merchant = Merchant.objects.get(salla_merchant_id=store_id)
-        
-        # Get active sessions (last 5 minutes)
-        active_threshold = timezone.now() - timedelta(minutes=5)
-        active_count = VisitorSession.objects.filter(
-            merchant=merchant,
-            last_seen_at__gte=active_threshold
-        ).count()
-        
-        response = JsonResponse({'count': active_count})
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
+        response = JsonResponse({'count': 0, 'message': 'Store not found'})
         response['Access-Control-Allow-Origin'] = '*'
         return response
-        
-    except Merchant.DoesNotExist:
-        response = JsonResponse({'count': 0, 'message': 'Store not found'})
+    
+    # Get active sessions (last 5 minutes)
+    response = JsonResponse({'count': active_visitor_count(merchant.id)})
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@require_http_methods(["GET"])
+def get_page_viewers(request):
+    """Get how many visitors are on a given page right now"""
+    store_id = request.GET.get('store_id')
+    path = request.GET.get('path', '/')
+    
+    if not store_id:
+        response = JsonResponse({'viewers': 0, 'message': 'Store ID required'})
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    merchant = resolve_store_merchant(store_id)
+    if merchant is None:
+        response = JsonResponse({'viewers': 0, 'message': 'Store not found'})
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    response = JsonResponse({
+        'path': normalize_path(path),
+        'viewers': page_viewers.count(merchant.id, path),
+    })
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+@require_http_methods(["GET"])
+async def live_count_stream(request):
+    """Stream the active visitor count as Server-Sent Events, pushed on change"""
+    store_id = request.GET.get('store_id')
+    
+    # Streams need the ASGI server; 204 tells EventSource to stop and the embed to poll
+    if not store_id or not isinstance(request, ASGIRequest):
+        response = HttpResponse(status=204)
         response['Access-Control-Allow-Origin'] = '*'
         return response
+    
+    merchant = await sync_to_async(resolve_store_merchant)(store_id)
+    if merchant is None:
+        response = HttpResponse(status=204)
+        response['Access-Control-Allow-Origin'] = '*'
+        return response
+    
+    response = StreamingHttpResponse(live_count_events(merchant.id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    response['Access-Control-Allow-Origin'] = '*'
+    return response
 
 
 def live_counter_embed_js(request):
@@ -274,88 +424,137 @@ def live_counter_embed_js(request):
     }}
     
     const SESSION_ID = getSessionId();
+    let badgeShown = false;
     
-    // Check if feature is enabled
-    fetch(BASE_URL + '/visitors/is-enabled/?store_id=' + encodeURIComponent(STORE_ID), {{
-        headers: {{
-            'ngrok-skip-browser-warning': 'true'
-        }}
-    }})
-    .then(response => {{
-        if (!response.ok) {{
-            console.error('[Nomo Live Counter] API error:', response.status);
-            return {{ enabled: false }};
-        }}
-        return response.json();
-    }})
-    .then(data => {{
-        if (!data.enabled) {{
-            console.log('[Nomo Live Counter] Feature is disabled for this store');
+    // Page views are queued and sent with the next heartbeat, or with a
+    // beacon when the page is hidden, instead of one request each
+    const USE_BEACON = typeof navigator.sendBeacon === 'function';
+    let pendingViews = [];
+    
+    function queuePageView() {{
+        pendingViews.push({{
+            page: window.location.pathname,
+            referrer: document.referrer || '',
+            viewed_at: Date.now()
+        }});
+    }}
+    
+    function flushPageViews() {{
+        if (!pendingViews.length) {{
             return;
         }}
-        
-        // Initialize the live counter
-        initLiveCounter();
-    }})
-    .catch(error => {{
-        console.error('[Nomo Live Counter] Error checking feature status:', error);
-    }});
-    
-    function initLiveCounter() {{
-        // Track initial visit
-        trackVisit();
-        
-        // Track every 30 seconds
-        setInterval(trackVisit, 30000);
-        
-        // Create and show the counter badge
-        showCounterBadge();
-        
-        // Update counter every 10 seconds
-        setInterval(updateCounter, 10000);
+        const body = JSON.stringify({{
+            store_id: STORE_ID,
+            session_id: SESSION_ID,
+            events: pendingViews
+        }});
+        pendingViews = [];
+        // text/plain keeps the beacon a CORS simple request (no preflight)
+        const payload = new Blob([body], {{ type: 'text/plain' }});
+        if (!navigator.sendBeacon(BASE_URL + '/visitors/track/batch/', payload)) {{
+            fetch(BASE_URL + '/visitors/track/batch/', {{
+                method: 'POST',
+                headers: {{ 'Content-Type': 'text/plain' }},
+                body: body,
+                keepalive: true
+            }}).catch(() => {{}});
+        }}
+    }}
+    
+    if (USE_BEACON) {{
+        queuePageView();
+        document.addEventListener('visibilitychange', function() {{
+            if (document.visibilityState === 'hidden') {{
+                flushPageViews();
+            }}
+        }});
+        window.addEventListener('pagehide', flushPageViews);
     }}
     
-    function trackVisit() {{
-        const pagePath = window.location.pathname;
+    // One request records the visit, returns the count and whether the
+    // feature is enabled, and tells us when to send the next one
+    function heartbeat() {{
+        const events = pendingViews;
+        pendingViews = [];
+        const payload = {{
+            store_id: STORE_ID,
+            session_id: SESSION_ID,
+            page: window.location.pathname,
+            referrer: document.referrer || ''
+        }};
+        if (USE_BEACON) {{
+            payload.events = events;
+        }}
         
-        fetch(BASE_URL + '/visitors/track/', {{
+        fetch(BASE_URL + '/visitors/heartbeat/', {{
             method: 'POST',
             headers: {{
                 'Content-Type': 'application/json',
                 'ngrok-skip-browser-warning': 'true'
             }},
-            body: JSON.stringify({{
-                store_id: STORE_ID,
-                session_id: SESSION_ID,
-                page: pagePath
-            }})
+            body: JSON.stringify(payload)
+        }})
+        .then(response => {{
+            if (!response.ok) {{
+                throw new Error('API error: ' + response.status);
+            }}
+            return response.json();
         }})
-        .then(response => response.json())
         .then(data => {{
-            if (data.success && data.active_visitors) {{
-                updateBadgeCount(data.active_visitors);
+            if (!data.enabled) {{
+                console.log('[Nomo Live Counter] Feature is disabled for this store');
+                pendingViews = [];
+                const existing = document.getElementById('nomo-live-counter-badge');
+                if (existing) {{
+                    existing.remove();
+                }}
+                return;
+            }}
+            
+            if (!badgeShown) {{
+                badgeShown = true;
+                showCounterBadge();
+                startCountStream();
             }}
+            updateBadgeCount(data.active_visitors);
+            scheduleHeartbeat(data.next_interval_ms);
         }})
         .catch(error => {{
-            console.error('[Nomo Live Counter] Track error:', error);
+            console.error('[Nomo Live Counter] Heartbeat error:', error);
+            pendingViews = events.concat(pendingViews);
+            if (badgeShown) {{
+                scheduleHeartbeat(60000);
+            }}
         }});
     }}
     
-    function updateCounter() {{
-        fetch(BASE_URL + '/visitors/live-count/?store_id=' + encodeURIComponent(STORE_ID), {{
-            headers: {{
-                'ngrok-skip-browser-warning': 'true'
-            }}
-        }})
-        .then(response => response.json())
-        .then(data => {{
+    function scheduleHeartbeat(intervalMs) {{
+        // Jitter keeps tabs opened together from hitting the server in lockstep
+        const jitter = intervalMs * 0.1 * (Math.random() * 2 - 1);
+        setTimeout(heartbeat, Math.max(intervalMs + jitter, 5000));
+    }}
+    
+    function startCountStream() {{
+        if (typeof EventSource === 'undefined') {{
+            return;
+        }}
+        
+        // Pushes count changes between heartbeats when the server supports it
+        const source = new EventSource(BASE_URL + '/visitors/live-count/stream/?store_id=' + encodeURIComponent(STORE_ID));
+        source.addEventListener('count', function(event) {{
+            const data = JSON.parse(event.data);
             updateBadgeCount(data.count);
-        }})
-        .catch(error => {{
-            console.error('[Nomo Live Counter] Update error:', error);
         }});
+        source.onerror = function() {{
+            // EventSource retries on its own unless the server refused the stream
+            if (source.readyState === EventSource.CLOSED) {{
+                console.log('[Nomo Live Counter] Stream unavailable, using heartbeat counts');
+            }}
+        }};
     }}
     
+    heartbeat();
+    
     function showCounterBadge() {{
         // Remove existing badge
         const existing = document.getElementById('nomo-live-counter-badge');